@@ -1,4 +1,5 @@
 import os
+from functools import partial
 
 from flask import Flask, request, jsonify
 from sbk.services.document_service import DocumentService
@@ -6,14 +7,31 @@ from sbk.services.vector_service import VectorService
 from sbk.services.retrieval_service import RetrievalService
 from sbk.services.knowledge_base_service import KnowledgeBaseService
 from sbk.core.database import get_db, engine, Base
+from sbk.core.tasks import task_manager
 from sbk.models.schemas import KnowledgeBaseConfig, SearchRequest, Query
 from sbk.core.exceptions import ValidationError
+from sbk.core.vector_stores.base import PAYLOAD_FIELDS
+from sbk.core.vector_stores.factory import VectorStoreFactory
+from sbk.core.embeddings.factory import EmbeddingFactory
+from sbk.core.embeddings.registry import normalize_config
+from sbk.core.health import cache_metrics, health_checker
 
 app = Flask(__name__)
 
+# chunks 接口单次读取的主键上限
+MAX_FETCH_IDS = 1000
+
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
 
+def _embedding_dim(embedding_config: dict) -> int:
+    """知识库 embedding 的向量维度，openai 按配置的维度，其余加载模型后计算一次"""
+    normalized = normalize_config(embedding_config)
+    if normalized["type"] == "openai":
+        return normalized["dim"]
+    with EmbeddingFactory.acquire(embedding_config) as model:
+        return len(model.embed_query("dimension"))
+
 # 知识库管理
 @app.route('/knowledge-bases/create', methods=['POST'])
 def create_knowledge_base():
@@ -26,6 +44,10 @@ def create_knowledge_base():
         config = data.get('config', {})
         try:
             validated_config = KnowledgeBaseConfig(**config).model_dump()
+            # 集合组织方式在创建时确定，之后修改 KBS_COLLECTION_LAYOUT 不影响已有知识库
+            validated_config['vector_store'] = VectorStoreFactory.pin_layout(
+                validated_config['vector_store'], partial(_embedding_dim, validated_config['embedding'])
+            )
         except Exception as e:
             raise ValidationError(f"Invalid config: {str(e)}")
             
@@ -85,16 +107,57 @@ def upload_document(kb_id):
             return jsonify({'error': 'Knowledge base not found'}), 404
             
         doc_service = DocumentService(kb.id, kb.document_store_path, kb.vector_store_path, kb.config)
-        doc_id = doc_service.process_document(file)
+        doc_id, file_path = doc_service.save_upload(file)
+        # 解析、向量化和写入在后台任务中完成，请求立即返回任务ID
+        task_id = task_manager.submit_task("process_document", {
+            "kb_id": kb.id,
+            "document_store_path": kb.document_store_path,
+            "vector_store_path": kb.vector_store_path,
+            "config": kb.config,
+            "doc_id": doc_id,
+            "file_path": file_path,
+            "filename": file.filename,
+        })
         
         return jsonify({
-            'message': 'Document uploaded and processed successfully',
-            'document_id': doc_id
-        }), 201
+            'message': 'Document uploaded and queued for processing',
+            'document_id': doc_id,
+            'task_id': task_id
+        }), 202
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 任务状态查询
+@app.route('/tasks/<task_id>', methods=['GET'])
+def get_task_status(task_id):
+    try:
+        status = task_manager.get_task_status(task_id)
+        if 'task_id' not in status:
+            return jsonify(status), 404
+        return jsonify(status), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 健康状态
+@app.route('/health', methods=['GET'])
+def get_health():
+    try:
+        return jsonify(health_checker.get_health_status()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 模型注册表、缓存和写缓冲的实时统计
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    try:
+        return jsonify(cache_metrics()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # 文档检索
 @app.route('/knowledge-bases/<int:kb_id>/search', methods=['POST'])
 def search(kb_id):
@@ -111,14 +174,37 @@ def search(kb_id):
         
         if not kb:
             return jsonify({'error': 'Knowledge base not found'}), 404
+        if search_request.partitions and not (kb.config.get('vector_store') or {}).get('partition_by'):
+            raise ValidationError("Knowledge base is not partitioned")
             
         retrieval_service = RetrievalService(
             kb.id,
             search_request.retrieval_config.model_dump() if search_request.retrieval_config else None,
             kb.config,
+            vector_store_path=kb.vector_store_path,
         )
-        query = Query(query=search_request.query)
-        results = retrieval_service.search(query, search_request.top_k)
+        if isinstance(search_request.query, list):
+            # 批量检索，结果以查询下标为键
+            results = retrieval_service.search_batch(
+                search_request.query,
+                search_request.top_k,
+                recall_tier=search_request.recall_tier,
+                latency_budget_ms=search_request.latency_budget_ms,
+                fields=search_request.fields,
+                metadata_filter=search_request.metadata_filter,
+                partitions=search_request.partitions,
+            )
+        else:
+            query = Query(query=search_request.query)
+            results = retrieval_service.search(
+                query,
+                search_request.top_k,
+                recall_tier=search_request.recall_tier,
+                latency_budget_ms=search_request.latency_budget_ms,
+                fields=search_request.fields,
+                metadata_filter=search_request.metadata_filter,
+                partitions=search_request.partitions,
+            )
         
         return jsonify({
             'results': results
@@ -129,5 +215,74 @@ def search(kb_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 按主键批量读取 chunk，?ids=1,2,3&fields=doc_id,content
+@app.route('/knowledge-bases/<int:kb_id>/chunks', methods=['GET'])
+def get_chunks(kb_id):
+    try:
+        try:
+            ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+        except ValueError:
+            raise ValidationError("ids must be a comma separated list of integers")
+        if not ids:
+            raise ValidationError("ids is required")
+        if len(ids) > MAX_FETCH_IDS:
+            raise ValidationError(f"At most {MAX_FETCH_IDS} ids per request")
+        fields = request.args.get('fields')
+        if fields is not None:
+            fields = [name.strip() for name in fields.split(',') if name.strip()]
+            unknown = set(fields) - set(PAYLOAD_FIELDS) - {'id'}
+            if unknown:
+                raise ValidationError(f"Unknown fields: {', '.join(sorted(unknown))}")
+
+        db = next(get_db())
+        kb_service = KnowledgeBaseService(db)
+        kb = kb_service.get_knowledge_base(kb_id)
+
+        if not kb:
+            return jsonify({'error': 'Knowledge base not found'}), 404
+
+        retrieval_service = RetrievalService(kb.id, config=kb.config, vector_store_path=kb.vector_store_path)
+        chunks = retrieval_service.fetch(ids, fields)
+        found = {chunk['id'] for chunk in chunks}
+
+        return jsonify({
+            'chunks': chunks,
+            'missing': [i for i in dict.fromkeys(ids) if i not in found]
+        }), 200
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 删除整个分区（按元数据或写入日期分区的知识库），分区取值即元数据取值或 YYYY-MM-DD / YYYY-MM
+@app.route('/knowledge-bases/<int:kb_id>/partitions/<path:value>', methods=['DELETE'])
+def drop_partition(kb_id, value):
+    try:
+        db = next(get_db())
+        kb_service = KnowledgeBaseService(db)
+        kb = kb_service.get_knowledge_base(kb_id)
+
+        if not kb:
+            return jsonify({'error': 'Knowledge base not found'}), 404
+        vector_store = kb.config.get('vector_store') or {}
+        if vector_store.get('partition_by') not in ('metadata', 'ingest_date'):
+            raise ValidationError("Only knowledge bases partitioned by metadata or ingest_date can drop partitions")
+
+        vector_service = VectorService(
+            collection_name=f"collection_kb_{kb.id}",
+            vector_store_path=kb.vector_store_path,
+            vector_store=vector_store,
+            kb_id=kb.id,
+        )
+        return jsonify({
+            'deleted': vector_service.drop_partition(value)
+        }), 200
+
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=os.environ.get('kbs_server_port', 9159)) 
\ No newline at end of file
@@ -43,10 +43,183 @@ class FileStorageConfig:
         # 确保存储目录存在
         os.makedirs(self.root_path, exist_ok=True)
 
+@dataclass
+class MilvusConfig:
+    host: str = "localhost"
+    port: str = "19530"
+    # 建立连接的超时时间（秒）
+    timeout: float = 10.0
+    # 批量检索时单次 search 请求的最大查询数，超过后拆成多次请求
+    max_nq: int = 1024
+
+@dataclass
+class VectorStoreRuntimeConfig:
+    # 知识库未指定时使用的向量库后端：milvus 或 faiss
+    type: str = "milvus"
+    # FAISS 索引快照是否以只读 mmap 方式加载
+    faiss_mmap: bool = True
+    # FAISS 增量行和墓碑累计到该数量时写出新快照
+    faiss_checkpoint_rows: int = 10000
+    # 知识库未指定时的向量存储精度：float32、float16、sq8 或 pq
+    precision: str = "float32"
+    # 有损索引召回 top_k * rerank_factor 个候选，再用全精度向量重排，0 表示不重排
+    rerank_factor: int = 0
+    # pq 精度下每个向量的编码字节数，0 表示 dim / 4
+    pq_bytes: int = 0
+    # chunk 正文和元数据的存放位置：inline（Milvus 集合内）或 external（知识库目录下的压缩存储）
+    chunk_store: str = "inline"
+    # 外部 chunk 存储的压缩方式：zstd、zlib 或 none，未安装 zstandard 时 zstd 退化为 zlib
+    chunk_codec: str = "zstd"
+    chunk_compress_level: int = 3
+    # 按 doc_id 哈希分区时知识库未指定的桶数
+    partition_buckets: int = 16
+    # 按写入日期分区时知识库未指定的粒度：day 或 month
+    partition_granularity: str = "month"
+    # 知识库未指定时 Milvus 集合的组织方式：per_kb（每个知识库一个集合）或 shared（同维度的知识库共用集合）
+    collection_layout: str = "per_kb"
+    # 共享集合的名称前缀，完整名称附加向量维度及精度、正文存放方式
+    shared_collection_prefix: str = "kbs_shared"
+    # 共享集合按 kb_id 分区键划分的物理分区数
+    shared_num_partitions: int = 64
+
+@dataclass
+class IndexPolicyConfig:
+    # 是否按行数自动选择向量索引并在后台重建
+    auto: bool = True
+    # 行数不超过该值时使用 FLAT（精确检索）
+    flat_max_rows: int = 50000
+    # 行数不超过该值且内存预算足够时使用 IVF_FLAT，否则使用 HNSW 或 IVF_PQ
+    ivf_max_rows: int = 2000000
+    # 单个集合向量索引的内存预算（字节）
+    memory_budget: int = 4 * 1024 * 1024 * 1024  # 4GB
+    # IVF 检索的 nprobe 占 nlist 的比例
+    nprobe_ratio: float = 0.1
+    # HNSW 检索的 ef 下限
+    hnsw_ef: int = 64
+    # 同一集合两次检查索引方案的最小间隔（秒）
+    check_interval: float = 60.0
+    # 索引重建和写入的文件锁目录，同一主机上的各进程共用，保证同一集合同时只有一个重建
+    lock_dir: str = "data/locks"
+    # Milvus 切换到新集合后等待多久（秒）再删除旧集合，让进行中的检索完成
+    swap_grace: float = 30.0
+    # 写入进程与重建进程之间的最大时钟偏差（秒），重建按主键中的时间戳补齐复制期间的写入时向前多比较这段时间
+    clock_skew: float = 60.0
+
+@dataclass
+class EmbeddingRuntimeConfig:
+    # 进程内最多常驻的 embedding 模型数量
+    max_resident_models: int = 4
+    # 模型空闲多久（秒）后被卸载，0 表示不按空闲时间卸载
+    idle_ttl: float = 1800.0
+    # chunk 向量缓存目录
+    cache_path: str = str(Path.home() / ".kbs" / "embedding_cache")
+    # 每个 embedding 配置的缓存容量上限（字节），0 表示关闭缓存
+    cache_max_bytes: int = 2 * 1024 * 1024 * 1024  # 2GB
+    # 缓存中向量的存储精度：float32 或 float16（容量减半，命中与否都返回取整后的向量）
+    cache_dtype: str = "float32"
+    # 查询向量内存缓存：最大条目数（0 表示关闭）、内存预算（字节）、有效期（秒）
+    query_cache_max_entries: int = 10000
+    query_cache_max_bytes: int = 256 * 1024 * 1024  # 256MB
+    query_cache_ttl: float = 3600.0
+    # 本地模型的动态微批：是否开启、最大条数、最长等待时间（毫秒）
+    micro_batch: bool = False
+    micro_batch_max_size: int = 32
+    micro_batch_max_wait_ms: float = 5.0
+    # 批量入库时本地模型的编码进程数（小于 2 表示单进程），以及启用多进程的最小文本数
+    num_workers: int = 0
+    bulk_min_texts: int = 256
+    # ONNX 模型导出目录和默认推理线程数（0 表示由 onnxruntime 决定）
+    onnx_path: str = str(Path.home() / ".kbs" / "onnx_models")
+    onnx_threads: int = 0
+
+@dataclass
+class SearchCacheConfig:
+    # 检索结果缓存最大条目数，0 表示关闭
+    max_entries: int = 10000
+    # 检索结果缓存内存预算（字节）
+    max_bytes: int = 256 * 1024 * 1024  # 256MB
+    # 集合版本号文件，同一主机上的工作进程通过它感知彼此的写入
+    generation_path: str = str(Path.home() / ".kbs" / "generations.sqlite")
+    # 检索结果缓存条目的有效期（秒），0 表示只靠版本号失效
+    ttl: float = 60.0
+    # 结果需要缓存的检索使用的 Milvus 一致性级别，Strong 保证已完成的写入可见；
+    # 改为 Bounded 可降低延迟，缓存中的结果最多在 ttl 内缺少最近的写入
+    consistency_level: str = "Strong"
+
+@dataclass
+class TaskConfig:
+    # 后台任务（文档入库等）并行执行的线程数
+    max_workers: int = 2
+    # 已结束的任务状态保留的秒数，超过后从数据库中清理，0 表示不清理
+    retention: float = 86400.0
+    # 执行中的任务把进度写入数据库的最小间隔（秒）
+    progress_interval: float = 1.0
+    # 未结束的任务超过该秒数没有心跳即视为所属进程已退出，标记为失败，0 表示不检查
+    orphan_timeout: float = 300.0
+
+@dataclass
+class IngestConfig:
+    # 流式入库时每批向量化和写入的 chunk 数
+    batch_size: int = 256
+    # 相邻阶段之间最多缓冲的批次数
+    queue_size: int = 2
+
+@dataclass
+class WriteBufferConfig:
+    # 写缓冲累计到多少行或多少字节时立即写入 Milvus
+    max_rows: int = 2048
+    max_bytes: int = 32 * 1024 * 1024  # 32MB
+    # 单次 insert 请求的字节上限，需低于 gRPC 消息上限
+    max_batch_bytes: int = 16 * 1024 * 1024  # 16MB
+    # 缓冲中的行最长停留时间（秒），0 表示只按大小或显式 flush 写入
+    flush_interval: float = 1.0
+
+@dataclass
+class BM25Config:
+    # BM25 参数
+    k1: float = 1.2
+    b: float = 0.75
+    # 索引段数超过该值时合并最小的 merge_factor 个段
+    max_segments: int = 8
+    merge_factor: int = 4
+
+@dataclass
+class FusionConfig:
+    # 混合检索的融合方式：weighted（归一化分数加权）或 rrf（倒数排名融合）
+    method: str = "weighted"
+    # 每路检索召回 top_k * oversample 个候选参与融合
+    oversample: int = 4
+    # RRF 的平滑常数
+    rrf_k: int = 60
+
+@dataclass
+class SearchTierConfig:
+    # 各召回档位要求的校准召回率（相对精确检索）
+    fast_recall: float = 0.8
+    balanced_recall: float = 0.95
+    max_recall: float = 0.99
+    # 各召回档位混合检索的候选倍数，balanced 使用融合配置中的 oversample
+    fast_oversample: int = 2
+    max_oversample: int = 8
+    # 离线校准默认使用的查询数和 top_k
+    calibration_queries: int = 200
+    calibration_top_k: int = 10
+
 class Config:
     def __init__(self):
         self.db = self._load_db_config()
         self.storage = self._load_storage_config()
+        self.milvus = self._load_milvus_config()
+        self.vector_store = self._load_vector_store_config()
+        self.index = self._load_index_policy_config()
+        self.embedding = self._load_embedding_config()
+        self.search_cache = self._load_search_cache_config()
+        self.tasks = self._load_task_config()
+        self.ingest = self._load_ingest_config()
+        self.write_buffer = self._load_write_buffer_config()
+        self.bm25 = self._load_bm25_config()
+        self.fusion = self._load_fusion_config()
+        self.search_tiers = self._load_search_tier_config()
     
     def _load_db_config(self) -> DBConfig:
         """从环境变量加载数据库配置"""
@@ -75,5 +248,132 @@ class Config:
             allowed_extensions=set(os.getenv("KBS_ALLOWED_EXTENSIONS", "pdf,txt,doc,docx").split(","))
         )
 
+    def _load_milvus_config(self) -> MilvusConfig:
+        """从环境变量加载 Milvus 连接配置"""
+        return MilvusConfig(
+            host=os.getenv("MILVUS_HOST", "localhost"),
+            port=os.getenv("MILVUS_PORT", "19530"),
+            timeout=float(os.getenv("KBS_MILVUS_TIMEOUT", "10")),
+            max_nq=max(1, int(os.getenv("KBS_MILVUS_MAX_NQ", "1024"))),
+        )
+
+    def _load_vector_store_config(self) -> VectorStoreRuntimeConfig:
+        """从环境变量加载向量库后端配置"""
+        return VectorStoreRuntimeConfig(
+            type=os.getenv("KBS_VECTOR_STORE", "milvus").lower(),
+            faiss_mmap=os.getenv("KBS_FAISS_MMAP", "true").lower() in ("1", "true", "yes"),
+            faiss_checkpoint_rows=max(1, int(os.getenv("KBS_FAISS_CHECKPOINT_ROWS", "10000"))),
+            precision=os.getenv("KBS_VECTOR_PRECISION", "float32").lower(),
+            rerank_factor=max(0, int(os.getenv("KBS_VECTOR_RERANK_FACTOR", "0"))),
+            pq_bytes=max(0, int(os.getenv("KBS_VECTOR_PQ_BYTES", "0"))),
+            chunk_store=os.getenv("KBS_CHUNK_STORE", "inline").lower(),
+            chunk_codec=os.getenv("KBS_CHUNK_CODEC", "zstd").lower(),
+            chunk_compress_level=int(os.getenv("KBS_CHUNK_COMPRESS_LEVEL", "3")),
+            partition_buckets=max(1, int(os.getenv("KBS_PARTITION_BUCKETS", "16"))),
+            partition_granularity=os.getenv("KBS_PARTITION_GRANULARITY", "month").lower(),
+            collection_layout=os.getenv("KBS_COLLECTION_LAYOUT", "per_kb").lower(),
+            shared_collection_prefix=os.getenv("KBS_SHARED_COLLECTION_PREFIX", "kbs_shared"),
+            shared_num_partitions=max(1, int(os.getenv("KBS_SHARED_NUM_PARTITIONS", "64"))),
+        )
+
+    def _load_index_policy_config(self) -> IndexPolicyConfig:
+        """从环境变量加载向量索引选择配置"""
+        return IndexPolicyConfig(
+            auto=os.getenv("KBS_INDEX_AUTO", "true").lower() in ("1", "true", "yes"),
+            flat_max_rows=int(os.getenv("KBS_INDEX_FLAT_MAX_ROWS", "50000")),
+            ivf_max_rows=int(os.getenv("KBS_INDEX_IVF_MAX_ROWS", "2000000")),
+            memory_budget=int(os.getenv("KBS_INDEX_MEMORY_BUDGET", str(4 * 1024 * 1024 * 1024))),
+            nprobe_ratio=float(os.getenv("KBS_INDEX_NPROBE_RATIO", "0.1")),
+            hnsw_ef=int(os.getenv("KBS_INDEX_HNSW_EF", "64")),
+            check_interval=float(os.getenv("KBS_INDEX_CHECK_INTERVAL", "60")),
+            lock_dir=os.getenv("KBS_INDEX_LOCK_DIR", "data/locks"),
+            swap_grace=float(os.getenv("KBS_INDEX_SWAP_GRACE", "30")),
+            clock_skew=float(os.getenv("KBS_INDEX_CLOCK_SKEW", "60")),
+        )
+
+    def _load_embedding_config(self) -> EmbeddingRuntimeConfig:
+        """从环境变量加载 embedding 运行时配置"""
+        return EmbeddingRuntimeConfig(
+            max_resident_models=int(os.getenv("KBS_EMBEDDING_MAX_MODELS", "4")),
+            idle_ttl=float(os.getenv("KBS_EMBEDDING_IDLE_TTL", "1800")),
+            cache_path=os.getenv("KBS_EMBEDDING_CACHE_PATH", str(Path.home() / ".kbs" / "embedding_cache")),
+            cache_max_bytes=int(os.getenv("KBS_EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024))),
+            cache_dtype=os.getenv("KBS_EMBEDDING_CACHE_DTYPE", "float32"),
+            query_cache_max_entries=int(os.getenv("KBS_QUERY_CACHE_MAX_ENTRIES", "10000")),
+            query_cache_max_bytes=int(os.getenv("KBS_QUERY_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            query_cache_ttl=float(os.getenv("KBS_QUERY_CACHE_TTL", "3600")),
+            micro_batch=os.getenv("KBS_EMBEDDING_MICRO_BATCH", "false").lower() in ("1", "true", "yes"),
+            micro_batch_max_size=int(os.getenv("KBS_EMBEDDING_MICRO_BATCH_SIZE", "32")),
+            micro_batch_max_wait_ms=float(os.getenv("KBS_EMBEDDING_MICRO_BATCH_WAIT_MS", "5")),
+            num_workers=int(os.getenv("KBS_EMBEDDING_WORKERS", "0")),
+            bulk_min_texts=int(os.getenv("KBS_EMBEDDING_BULK_MIN_TEXTS", "256")),
+            onnx_path=os.getenv("KBS_ONNX_MODEL_PATH", str(Path.home() / ".kbs" / "onnx_models")),
+            onnx_threads=int(os.getenv("KBS_ONNX_THREADS", "0")),
+        )
+
+    def _load_search_cache_config(self) -> SearchCacheConfig:
+        """从环境变量加载检索结果缓存配置"""
+        return SearchCacheConfig(
+            max_entries=int(os.getenv("KBS_SEARCH_CACHE_MAX_ENTRIES", "10000")),
+            max_bytes=int(os.getenv("KBS_SEARCH_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            generation_path=os.getenv("KBS_SEARCH_CACHE_GENERATION_PATH", str(Path.home() / ".kbs" / "generations.sqlite")),
+            ttl=float(os.getenv("KBS_SEARCH_CACHE_TTL", "60")),
+            consistency_level=os.getenv("KBS_SEARCH_CACHE_CONSISTENCY", "Strong"),
+        )
+
+    def _load_task_config(self) -> TaskConfig:
+        """从环境变量加载后台任务配置"""
+        return TaskConfig(
+            max_workers=int(os.getenv("KBS_TASK_WORKERS", "2")),
+            retention=float(os.getenv("KBS_TASK_RETENTION", "86400")),
+            progress_interval=float(os.getenv("KBS_TASK_PROGRESS_INTERVAL", "1")),
+            orphan_timeout=float(os.getenv("KBS_TASK_ORPHAN_TIMEOUT", "300")),
+        )
+
+    def _load_ingest_config(self) -> IngestConfig:
+        """从环境变量加载文档入库配置"""
+        return IngestConfig(
+            batch_size=int(os.getenv("KBS_INGEST_BATCH_SIZE", "256")),
+            queue_size=int(os.getenv("KBS_INGEST_QUEUE_SIZE", "2")),
+        )
+
+    def _load_write_buffer_config(self) -> WriteBufferConfig:
+        """从环境变量加载向量写缓冲配置"""
+        return WriteBufferConfig(
+            max_rows=int(os.getenv("KBS_WRITE_BUFFER_ROWS", "2048")),
+            max_bytes=int(os.getenv("KBS_WRITE_BUFFER_BYTES", str(32 * 1024 * 1024))),
+            max_batch_bytes=int(os.getenv("KBS_MAX_INSERT_BYTES", str(16 * 1024 * 1024))),
+            flush_interval=float(os.getenv("KBS_WRITE_BUFFER_INTERVAL", "1.0")),
+        )
+
+    def _load_bm25_config(self) -> BM25Config:
+        """从环境变量加载 BM25 索引配置"""
+        return BM25Config(
+            k1=float(os.getenv("KBS_BM25_K1", "1.2")),
+            b=float(os.getenv("KBS_BM25_B", "0.75")),
+            max_segments=int(os.getenv("KBS_BM25_MAX_SEGMENTS", "8")),
+            merge_factor=int(os.getenv("KBS_BM25_MERGE_FACTOR", "4")),
+        )
+
+    def _load_fusion_config(self) -> FusionConfig:
+        """从环境变量加载混合检索融合配置"""
+        return FusionConfig(
+            method=os.getenv("KBS_FUSION_METHOD", "weighted").lower(),
+            oversample=max(1, int(os.getenv("KBS_FUSION_OVERSAMPLE", "4"))),
+            rrf_k=int(os.getenv("KBS_FUSION_RRF_K", "60")),
+        )
+
+    def _load_search_tier_config(self) -> SearchTierConfig:
+        """从环境变量加载召回档位和校准配置"""
+        return SearchTierConfig(
+            fast_recall=float(os.getenv("KBS_RECALL_FAST", "0.8")),
+            balanced_recall=float(os.getenv("KBS_RECALL_BALANCED", "0.95")),
+            max_recall=float(os.getenv("KBS_RECALL_MAX", "0.99")),
+            fast_oversample=max(1, int(os.getenv("KBS_RECALL_FAST_OVERSAMPLE", "2"))),
+            max_oversample=max(1, int(os.getenv("KBS_RECALL_MAX_OVERSAMPLE", "8"))),
+            calibration_queries=int(os.getenv("KBS_CALIBRATION_QUERIES", "200")),
+            calibration_top_k=int(os.getenv("KBS_CALIBRATION_TOP_K", "10")),
+        )
+
 # 全局配置实例
 config = Config() 
\ No newline at end of file
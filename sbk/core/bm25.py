@@ -0,0 +1,554 @@
+import os
+import json
+import math
+import heapq
+import fcntl
+import shutil
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from sbk.config import config as settings
+from sbk.core.tokenizer import tokenize
+from sbk.core.metadata_filter import matches
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+TOMBSTONE_FILE = "deleted.npy"
+LOCK_FILE = ".lock"
+# 每个倒排块包含的 posting 数，块内记录最大词频和最短文档长度用于估算分数上界
+BLOCK_SIZE = 128
+# 首轮处理的块数，此后每轮翻倍直至上限，每轮结束后用新的阈值重新剪枝
+BLOCKS_PER_ROUND = 8
+MAX_BLOCKS_PER_ROUND = 256
+
+
+class _Segment:
+    """不可变的索引段
+
+    postings/tfs 按词项连续存放、词项内按文档号升序，以内存映射方式打开；
+    词典、文档长度和主键常驻内存，正文和元数据只在命中后按偏移读取。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "lexicon.json"), encoding="utf-8") as f:
+            self.lexicon: Dict[str, List[int]] = json.load(f)
+        with open(os.path.join(path, "doc_ids.json"), encoding="utf-8") as f:
+            self.doc_ids: List[str] = json.load(f)
+        self.postings = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.block_max_tf = np.load(os.path.join(path, "block_max_tf.npy"))
+        self.block_min_dl = np.load(os.path.join(path, "block_min_dl.npy"))
+        self.doclen = np.load(os.path.join(path, "doclen.npy"))
+        self.pks = np.load(os.path.join(path, "pks.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        # 保持文件句柄，段被合并删除后仍可读取
+        self._docs_fd = os.open(os.path.join(path, "docs.jsonl"), os.O_RDONLY)
+        self.live = np.ones(len(self.pks), dtype=bool)
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.pks)
+
+    def apply_tombstones(self, deleted: np.ndarray):
+        self.live = ~np.isin(self.pks, deleted) if len(deleted) else np.ones(len(self.pks), dtype=bool)
+
+    def read_doc(self, local: int) -> Dict[str, Any]:
+        start, end = int(self.offsets[local]), int(self.offsets[local + 1])
+        return json.loads(os.pread(self._docs_fd, end - start, start).decode("utf-8"))
+
+    def iter_live_docs(self) -> Iterable[Tuple[int, Dict[str, Any]]]:
+        for local in np.flatnonzero(self.live):
+            yield int(self.pks[local]), self.read_doc(int(local))
+
+    def close(self):
+        try:
+            os.close(self._docs_fd)
+        except OSError:
+            pass
+
+    @staticmethod
+    def write(path: str,
+              pks: Sequence[int],
+              doc_ids: Sequence[str],
+              contents: Sequence[str],
+              metadatas: Sequence[Dict]):
+        """构建并原子地写出一个段"""
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        term_docs: Dict[str, List[int]] = defaultdict(list)
+        term_tfs: Dict[str, List[int]] = defaultdict(list)
+        doclen = np.zeros(len(contents), dtype=np.int32)
+        offsets = np.zeros(len(contents) + 1, dtype=np.int64)
+        with open(os.path.join(tmp_path, "docs.jsonl"), "wb") as f:
+            for local, (doc_id, content, metadata) in enumerate(zip(doc_ids, contents, metadatas)):
+                counts = Counter(tokenize(content))
+                doclen[local] = sum(counts.values())
+                for term, tf in counts.items():
+                    term_docs[term].append(local)
+                    term_tfs[term].append(tf)
+                line = json.dumps({"doc_id": doc_id, "content": content, "metadata": metadata},
+                                  ensure_ascii=False).encode("utf-8") + b"\n"
+                f.write(line)
+                offsets[local + 1] = offsets[local] + len(line)
+
+        lexicon: Dict[str, List[int]] = {}
+        postings_parts, tfs_parts, block_starts = [], [], []
+        position = 0
+        for term in sorted(term_docs):
+            docs = term_docs[term]
+            lexicon[term] = [position, position + len(docs), len(block_starts)]
+            block_starts.extend(range(position, position + len(docs), BLOCK_SIZE))
+            postings_parts.append(np.asarray(docs, dtype=np.int32))
+            tfs_parts.append(np.minimum(np.asarray(term_tfs[term]), np.iinfo(np.uint16).max).astype(np.uint16))
+            position += len(docs)
+
+        postings = np.concatenate(postings_parts) if postings_parts else np.empty(0, dtype=np.int32)
+        tfs = np.concatenate(tfs_parts) if tfs_parts else np.empty(0, dtype=np.uint16)
+        starts = np.asarray(block_starts, dtype=np.int64)
+        if len(starts):
+            block_max_tf = np.maximum.reduceat(tfs, starts).astype(np.uint16)
+            block_min_dl = np.minimum.reduceat(doclen[postings], starts).astype(np.int32)
+        else:
+            block_max_tf = np.empty(0, dtype=np.uint16)
+            block_min_dl = np.empty(0, dtype=np.int32)
+
+        np.save(os.path.join(tmp_path, "postings.npy"), postings)
+        np.save(os.path.join(tmp_path, "tfs.npy"), tfs)
+        np.save(os.path.join(tmp_path, "block_max_tf.npy"), block_max_tf)
+        np.save(os.path.join(tmp_path, "block_min_dl.npy"), block_min_dl)
+        np.save(os.path.join(tmp_path, "doclen.npy"), doclen)
+        np.save(os.path.join(tmp_path, "pks.npy"), np.asarray(pks, dtype=np.int64))
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        with open(os.path.join(tmp_path, "lexicon.json"), "w", encoding="utf-8") as f:
+            json.dump(lexicon, f, ensure_ascii=False)
+        with open(os.path.join(tmp_path, "doc_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(list(doc_ids), f, ensure_ascii=False)
+        os.rename(tmp_path, path)
+
+
+class BM25Index:
+    """单个知识库的持久化 BM25 倒排索引
+
+    写入以段为单位追加，删除记录为墓碑，段数超过上限时合并最小的若干段并清理墓碑。
+    检索按块级分数上界从高到低处理倒排块（block-max MaxScore），
+    分数上界不超过当前第 k 名的块直接跳过，因此延迟取决于被处理的块数而非语料规模。
+    多个进程可共享同一目录：写入通过文件锁串行，读取方在清单变化后重新加载。
+    """
+
+    def __init__(self,
+                 path: str,
+                 k1: float = 1.2,
+                 b: float = 0.75,
+                 max_segments: int = 8,
+                 merge_factor: int = 4):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max(1, max_segments)
+        self.merge_factor = max(2, merge_factor)
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._segments: Dict[str, _Segment] = {}
+        self._deleted = np.empty(0, dtype=np.int64)
+        self._manifest_mtime: Optional[Tuple[int, int]] = None
+        self._num_docs = 0
+        self._max_docs = 0
+        self._total_len = 0
+
+    # ---- 持久化 ----
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.path, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.path, MANIFEST_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"version": 0, "next_segment": 0, "segments": []}
+
+    def _write_json_atomic(self, name: str, data: Any):
+        tmp = os.path.join(self.path, name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    def _write_tombstones(self, deleted: np.ndarray):
+        tmp = os.path.join(self.path, TOMBSTONE_FILE + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, deleted)
+        os.replace(tmp, os.path.join(self.path, TOMBSTONE_FILE))
+
+    def _read_tombstones(self) -> np.ndarray:
+        try:
+            return np.load(os.path.join(self.path, TOMBSTONE_FILE))
+        except FileNotFoundError:
+            return np.empty(0, dtype=np.int64)
+
+    def _refresh(self, force: bool = False):
+        """清单文件变化后重新加载段和墓碑"""
+        try:
+            # 清单通过 os.replace 原子替换，inode 和修改时间任一变化即重新加载
+            stat = os.stat(os.path.join(self.path, MANIFEST_FILE))
+            mtime = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            mtime = None
+        if not force and mtime == self._manifest_mtime:
+            return
+        with self._lock:
+            manifest = self._read_manifest()
+            names = [segment["name"] for segment in manifest["segments"]]
+            segments = {}
+            for name in names:
+                segment = self._segments.get(name) or _Segment(os.path.join(self.path, name))
+                segments[name] = segment
+            for name, segment in self._segments.items():
+                if name not in segments:
+                    segment.close()
+            deleted = self._read_tombstones()
+            for segment in segments.values():
+                segment.apply_tombstones(deleted)
+            self._segments = segments
+            self._deleted = deleted
+            self._num_docs = int(sum(segment.live.sum() for segment in segments.values()))
+            self._max_docs = sum(segment.num_docs for segment in segments.values())
+            self._total_len = int(sum(segment.doclen[segment.live].sum() for segment in segments.values()))
+            self._manifest_mtime = mtime
+
+    def _commit(self, manifest: Dict[str, Any]):
+        manifest["version"] += 1
+        self._write_json_atomic(MANIFEST_FILE, manifest)
+
+    # ---- 写入 ----
+
+    def add(self,
+            pks: Sequence[int],
+            doc_ids: Sequence[str],
+            contents: Sequence[str],
+            metadatas: Sequence[Dict]):
+        """追加一批 chunk，pks 为向量库中对应行的主键"""
+        if not len(pks):
+            return
+        with self._lock, self._file_lock():
+            manifest = self._read_manifest()
+            name = f"seg_{manifest['next_segment']:06d}"
+            _Segment.write(os.path.join(self.path, name), pks, doc_ids, contents, metadatas)
+            manifest["next_segment"] += 1
+            manifest["segments"].append({"name": name, "num_docs": len(pks)})
+            removed, merged_pks = self._merge_if_needed(manifest)
+            self._commit(manifest)
+            if merged_pks:
+                # 清单提交后再清理被合并段的墓碑，读取方不会看到已删除的行重新出现
+                deleted = self._read_tombstones()
+                self._write_tombstones(deleted[~np.isin(deleted, np.concatenate(merged_pks))])
+            self._refresh(force=True)
+        for name in removed:
+            shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        logger.debug("BM25 index %s: added %d chunks", self.path, len(pks))
+
+    def _merge_if_needed(self, manifest: Dict[str, Any]) -> Tuple[List[str], List[np.ndarray]]:
+        """段数超过上限时把最小的若干段合并为一个，返回待删除的段目录和被合并段的主键"""
+        removed: List[str] = []
+        merged_pks: List[np.ndarray] = []
+        deleted = self._read_tombstones()
+        while len(manifest["segments"]) > self.max_segments:
+            entries = sorted(manifest["segments"], key=lambda entry: entry["num_docs"])[:self.merge_factor]
+            pks, doc_ids, contents, metadatas = [], [], [], []
+            for entry in entries:
+                segment = self._segments.get(entry["name"])
+                opened = segment is None
+                if opened:
+                    segment = _Segment(os.path.join(self.path, entry["name"]))
+                live = segment.live
+                segment.apply_tombstones(deleted)
+                merged_pks.append(segment.pks)
+                for pk, doc in segment.iter_live_docs():
+                    pks.append(pk)
+                    doc_ids.append(doc["doc_id"])
+                    contents.append(doc["content"])
+                    metadatas.append(doc["metadata"])
+                if opened:
+                    segment.close()
+                else:
+                    segment.live = live
+            name = f"seg_{manifest['next_segment']:06d}"
+            _Segment.write(os.path.join(self.path, name), pks, doc_ids, contents, metadatas)
+            manifest["next_segment"] += 1
+            merged_names = {entry["name"] for entry in entries}
+            manifest["segments"] = [entry for entry in manifest["segments"] if entry["name"] not in merged_names]
+            manifest["segments"].append({"name": name, "num_docs": len(pks)})
+            removed.extend(merged_names)
+            logger.debug("BM25 index %s: merged %d segments into %s", self.path, len(entries), name)
+        return removed, merged_pks
+
+    def _delete(self, pks: np.ndarray) -> int:
+        if not len(pks):
+            return 0
+        with self._lock, self._file_lock():
+            deleted = np.union1d(self._read_tombstones(), pks.astype(np.int64))
+            self._write_tombstones(deleted)
+            self._commit(self._read_manifest())
+            self._refresh(force=True)
+        return len(pks)
+
+    def delete_pks(self, pks: Iterable[int]) -> int:
+        """按主键删除"""
+        return self._delete(np.asarray(list(pks), dtype=np.int64))
+
+    def delete_doc_ids(self, doc_ids: Iterable[str]) -> int:
+        """删除属于指定文档的全部 chunk"""
+        targets = set(doc_ids)
+        self._refresh()
+        with self._lock:
+            matched = [
+                segment.pks[local]
+                for segment in self._segments.values()
+                for local, doc_id in enumerate(segment.doc_ids)
+                if doc_id in targets and segment.live[local]
+            ]
+        return self._delete(np.asarray(matched, dtype=np.int64))
+
+    def delete_where(self, metadata_filter: Dict[str, Any]) -> int:
+        """删除元数据满足 metadata_filter 的 chunk"""
+        self._refresh()
+        with self._lock:
+            matched = [
+                pk
+                for segment in self._segments.values()
+                for pk, doc in segment.iter_live_docs()
+                if matches(doc["metadata"], metadata_filter)
+            ]
+        return self._delete(np.asarray(matched, dtype=np.int64))
+
+    # ---- 检索 ----
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+        """返回 BM25 分数最高的 top_k 个 chunk，只为命中的结果读取正文"""
+        pks, scores, fetch = self.rank(query, top_k)
+        return [fetch(i) for i in range(len(pks))]
+
+    def rank(self, query: str, top_k: int = 3,
+             allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, Callable[[int], Dict[str, Any]]]:
+        """只计算排名，不读取正文
+
+        allowed 为元数据过滤得到的主键，指定时只有这些 chunk 参与排名
+
+        Returns:
+            按分数降序排列的主键数组、分数数组，以及按位置读取完整结果的函数
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), None)
+        query_terms = Counter(tokenize(query))
+        if not query_terms or top_k <= 0 or (allowed is not None and len(allowed) == 0):
+            return empty
+        self._refresh()
+        with self._lock:
+            segments = sorted(self._segments.values(), key=lambda segment: segment.num_docs, reverse=True)
+            num_docs, max_docs, total_len = self._num_docs, self._max_docs, self._total_len
+        if num_docs == 0:
+            return empty
+        avgdl = total_len / num_docs
+
+        # 文档频率按所有段统计（包含已删除但尚未合并的行），文档总数同样包含这些行（即 Lucene 的 maxDoc），
+        # 二者口径一致，df 不会超过文档总数，IDF 始终为正
+        weights = {}
+        for term, qtf in query_terms.items():
+            df = sum(segment.lexicon[term][1] - segment.lexicon[term][0]
+                     for segment in segments if term in segment.lexicon)
+            if df:
+                weights[term] = qtf * math.log(1 + (max_docs - df + 0.5) / (df + 0.5))
+        if not weights:
+            return empty
+
+        if allowed is not None:
+            allowed = np.unique(np.asarray(allowed, dtype=np.int64))
+        heap: List[Tuple[float, int, int]] = []
+        for seg_index, segment in enumerate(segments):
+            self._search_segment(segment, seg_index, weights, avgdl, heap, top_k, allowed)
+
+        ranked = sorted(heap, reverse=True)
+        pks = np.array([segments[seg_index].pks[local] for _, seg_index, local in ranked], dtype=np.int64)
+        scores = np.array([score for score, _, _ in ranked], dtype=np.float32)
+
+        def fetch(i: int) -> Dict[str, Any]:
+            score, seg_index, local = ranked[i]
+            doc = segments[seg_index].read_doc(local)
+            return {
+                "score": float(score),
+                "doc_id": doc["doc_id"],
+                "metadata": doc["metadata"],
+                "content": doc["content"],
+                "id": int(pks[i]),
+            }
+
+        return pks, scores, fetch
+
+    def _term_score(self, weight: float, tf: np.ndarray, dl: np.ndarray, avgdl: float) -> np.ndarray:
+        tf = tf.astype(np.float32)
+        return weight * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / avgdl))
+
+    def _search_segment(self,
+                        segment: _Segment,
+                        seg_index: int,
+                        weights: Dict[str, float],
+                        avgdl: float,
+                        heap: List[Tuple[float, int, int]],
+                        top_k: int,
+                        allowed: Optional[np.ndarray] = None):
+        terms = [(term, weight, *segment.lexicon[term]) for term, weight in weights.items() if term in segment.lexicon]
+        if not terms:
+            return
+
+        # 每个块的分数上界：块内最大词频配合块内最短文档长度
+        block_term, block_no, block_ub, term_ub = [], [], [], []
+        for i, (_, weight, start, end, block_start) in enumerate(terms):
+            nblocks = -(-(end - start) // BLOCK_SIZE)
+            ub = self._term_score(weight,
+                                  segment.block_max_tf[block_start:block_start + nblocks],
+                                  segment.block_min_dl[block_start:block_start + nblocks],
+                                  avgdl)
+            block_term.append(np.full(nblocks, i))
+            block_no.append(np.arange(nblocks))
+            block_ub.append(ub)
+            term_ub.append(float(ub.max()))
+        block_term = np.concatenate(block_term)
+        block_no = np.concatenate(block_no)
+        block_ub = np.concatenate(block_ub)
+        term_ub = np.asarray(term_ub)
+        # 文档在其他词项上可能获得的最高分
+        others_ub = term_ub.sum() - term_ub[block_term]
+        max_others = float(others_ub.max())
+
+        order = np.argsort(-block_ub, kind="stable")
+        # 已处理过的候选文档号（有序），删除标记和过滤条件只对候选逐个检查，
+        # 不为每次查询构建与段等长的位图
+        seen = np.empty(0, dtype=np.int64)
+        threshold = heap[0][0] if len(heap) >= top_k else 0.0
+        round_start, round_size = 0, BLOCKS_PER_ROUND
+        while round_start < len(order):
+            # 剩余块按上界降序，若最高的块也进不了前 k 名则整体结束
+            if block_ub[order[round_start]] + max_others <= threshold:
+                break
+            batch = order[round_start:round_start + round_size]
+            round_start += round_size
+            round_size = min(round_size * 2, MAX_BLOCKS_PER_ROUND)
+            batch = batch[block_ub[batch] + others_ub[batch] > threshold]
+            if not len(batch):
+                continue
+
+            parts = []
+            for block in batch:
+                _, _, start, end, _ = terms[block_term[block]]
+                lo = start + int(block_no[block]) * BLOCK_SIZE
+                parts.append(segment.postings[lo:min(end, lo + BLOCK_SIZE)])
+            candidates = np.unique(np.concatenate(parts)).astype(np.int64)
+            candidates = candidates[~np.isin(candidates, seen, assume_unique=True)]
+            if not len(candidates):
+                continue
+            seen = np.union1d(seen, candidates)
+            candidates = candidates[segment.live[candidates]]
+            if allowed is not None and len(candidates):
+                # allowed 已排序，二分查找候选的主键
+                pks = segment.pks[candidates]
+                pos = np.minimum(np.searchsorted(allowed, pks), len(allowed) - 1)
+                candidates = candidates[allowed[pos] == pks]
+            if not len(candidates):
+                continue
+
+            # 候选文档在所有查询词项上的精确分数，通过二分查找定位 posting
+            scores = np.zeros(len(candidates), dtype=np.float32)
+            dl = segment.doclen[candidates]
+            for _, weight, start, end, _ in terms:
+                postings = segment.postings[start:end]
+                pos = np.searchsorted(postings, candidates)
+                found = pos < len(postings)
+                found[found] &= postings[pos[found]] == candidates[found]
+                if found.any():
+                    tf = segment.tfs[start + pos[found]]
+                    scores[found] += self._term_score(weight, tf, dl[found], avgdl)
+
+            if len(candidates) > top_k:
+                keep = np.argpartition(-scores, top_k - 1)[:top_k]
+                candidates, scores = candidates[keep], scores[keep]
+            for local, score in zip(candidates.tolist(), scores.tolist()):
+                if len(heap) < top_k:
+                    heapq.heappush(heap, (score, seg_index, local))
+                elif score > heap[0][0]:
+                    heapq.heapreplace(heap, (score, seg_index, local))
+            if len(heap) >= top_k:
+                threshold = heap[0][0]
+
+    def stats(self) -> Dict[str, Any]:
+        self._refresh()
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "live_docs": self._num_docs,
+                "deleted": len(self._deleted),
+                "avg_doc_len": self._total_len / self._num_docs if self._num_docs else 0.0,
+            }
+
+
+class BM25IndexRegistry:
+    """按目录共享 BM25 索引实例，并记录集合与索引目录的对应关系"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_segments: int = 8, merge_factor: int = 4):
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.merge_factor = merge_factor
+        self._indexes: Dict[str, BM25Index] = {}
+        self._bindings: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, vector_store_path: str) -> BM25Index:
+        """获取知识库的 BM25 索引，位于 vector_store_path/bm25"""
+        path = os.path.realpath(os.path.join(vector_store_path, "bm25"))
+        with self._lock:
+            index = self._indexes.get(path)
+            if index is None:
+                index = BM25Index(path, k1=self.k1, b=self.b,
+                                  max_segments=self.max_segments, merge_factor=self.merge_factor)
+                self._indexes[path] = index
+            return index
+
+    def bind(self, key: str, vector_store_path: str):
+        """记录集合对应的知识库目录，写缓冲写入后据此更新索引"""
+        with self._lock:
+            self._bindings[key] = vector_store_path
+
+    def bound(self, key: str) -> Optional[BM25Index]:
+        with self._lock:
+            vector_store_path = self._bindings.get(key)
+        return self.get(vector_store_path) if vector_store_path else None
+
+    def remove(self, vector_store_path: str):
+        """丢弃知识库的索引实例和绑定，知识库删除时调用"""
+        path = os.path.realpath(os.path.join(vector_store_path, "bm25"))
+        with self._lock:
+            self._indexes.pop(path, None)
+            for key in [key for key, bound in self._bindings.items() if bound == vector_store_path]:
+                del self._bindings[key]
+
+# 全局 BM25 索引注册表
+bm25_indexes = BM25IndexRegistry(
+    k1=settings.bm25.k1,
+    b=settings.bm25.b,
+    max_segments=settings.bm25.max_segments,
+    merge_factor=settings.bm25.merge_factor,
+)
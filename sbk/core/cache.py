@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from sbk.config import config as settings
+
+
+def estimate_size(value: Any) -> int:
+    """估算对象占用的内存字节数"""
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes + 112
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], float):
+            # float 列表：指针 + float 对象
+            return sys.getsizeof(value) + len(value) * 24
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存，支持条目数上限、内存预算和 TTL"""
+
+    def __init__(self,
+                 max_entries: int = 10000,
+                 max_bytes: int = 0,
+                 ttl: float = 0,
+                 sizeof: Callable[[Any], int] = estimate_size):
+        """
+        Args:
+            max_entries: 最大条目数
+            max_bytes: 内存预算（字节），0 表示不限制
+            ttl: 条目有效期（秒），0 表示不过期
+            sizeof: 估算条目大小的函数
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return default
+            value, size, expires_at = item
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        if not self.enabled:
+            return
+        size = self.sizeof(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            while self._data and (len(self._data) > self.max_entries
+                                  or (self.max_bytes and self._bytes > self.max_bytes)):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+            }
+
+
+class GenerationCounter:
+    """按作用域维护的版本号，写入数据时递增，用于让依赖旧数据的缓存条目自然失效
+
+    指定 path 时版本号保存在 SQLite 文件中，同一主机上的多个工作进程共享。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._generations: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS generations (scope TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def get(self, scope: Hashable) -> int:
+        if self._db is None:
+            return self._generations.get(scope, 0)
+        with self._lock:
+            row = self._db.execute("SELECT value FROM generations WHERE scope = ?", (str(scope),)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, scope: Hashable) -> int:
+        with self._lock:
+            if self._db is None:
+                generation = self._generations.get(scope, 0) + 1
+                self._generations[scope] = generation
+                return generation
+            self._db.execute(
+                "INSERT INTO generations (scope, value) VALUES (?, 1) "
+                "ON CONFLICT(scope) DO UPDATE SET value = value + 1",
+                (str(scope),)
+            )
+            return self._db.execute("SELECT value FROM generations WHERE scope = ?", (str(scope),)).fetchone()[0]
+
+# 全局集合版本号，向量库写入或删除时递增
+collection_generations = GenerationCounter(settings.search_cache.generation_path)
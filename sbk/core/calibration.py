@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from dataclasses import asdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from sbk.config import config as settings
+from sbk.core.index_policy import PRECISIONS, IndexPlan, choose_index
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_FILE = "calibration.json"
+# 召回档位，从快到准
+RECALL_TIERS = ("fast", "balanced", "max")
+# 没有可用的校准表时，各档位相对默认 nprobe/ef 的倍数
+TIER_SCALES = {"fast": 0.5, "balanced": 1.0, "max": 4.0}
+# 校准 ef 时扫描的上限
+MAX_CALIBRATION_EF = 1024
+# 精度报告最多用多少行构建索引
+REPORT_MAX_ROWS = 200000
+# 与第 k 个精确距离的相对差在该范围内的行视为并列，检索返回其中任意一行都算命中
+TIE_TOLERANCE = 1e-4
+
+
+def tier_recall(tier: str) -> float:
+    """召回档位要求的召回率"""
+    return getattr(settings.search_tiers, f"{tier}_recall")
+
+
+def tier_oversample(tier: Optional[str], default: int) -> int:
+    """召回档位对应的混合检索候选倍数，balanced 或未指定时使用 default"""
+    if tier == "fast":
+        return settings.search_tiers.fast_oversample
+    if tier == "max":
+        return max(default, settings.search_tiers.max_oversample)
+    return default
+
+
+def knob_default(plan: IndexPlan, knob: str, top_k: int) -> int:
+    """索引方案默认使用的 nprobe/ef"""
+    if knob == "nprobe":
+        return plan.nprobe
+    return max(settings.index.hnsw_ef, top_k)
+
+
+def knob_grid(plan: IndexPlan, knob: str, top_k: int) -> List[int]:
+    """校准时扫描的参数值：从最小值按 2 倍递增到上限，并包含默认值"""
+    if knob == "nprobe":
+        value, upper = 1, max(1, plan.nlist)
+    else:
+        value, upper = max(1, top_k), max(MAX_CALIBRATION_EF, settings.index.hnsw_ef)
+    values = {knob_default(plan, knob, top_k), upper}
+    while value < upper:
+        values.add(value)
+        value *= 2
+    return sorted(values)
+
+
+def select_entry(entries: List[Dict[str, Any]],
+                 target_recall: Optional[float] = None,
+                 latency_budget_ms: Optional[float] = None) -> Dict[str, Any]:
+    """从校准表中选出一组参数
+
+    先排除 p99 延迟超出预算的参数（都超出时取最快的一组），再在其中选满足召回要求的最快参数；
+    没有满足召回要求的参数时取召回率最高的一组。只给出延迟预算时取预算内召回率最高的参数。
+    """
+    candidates = entries
+    if latency_budget_ms is not None:
+        candidates = [entry for entry in entries if entry["p99_ms"] <= latency_budget_ms]
+        if not candidates:
+            return min(entries, key=lambda entry: entry["p99_ms"])
+    if target_recall is not None:
+        meeting = [entry for entry in candidates if entry["recall"] >= target_recall]
+        if meeting:
+            return min(meeting, key=lambda entry: (entry["p99_ms"], entry["value"]))
+    return max(candidates, key=lambda entry: (entry["recall"], -entry["p99_ms"]))
+
+
+def resolve_search_params(store,
+                          table: Optional[Dict[str, Any]],
+                          top_k: int,
+                          recall_tier: Optional[str] = None,
+                          latency_budget_ms: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """把请求的召回档位和延迟预算换算为检索参数
+
+    优先按校准表选择；校准表不存在或与当前索引不一致时，召回档位按 TIER_SCALES 缩放默认参数，
+    只有延迟预算时使用默认参数。返回 None 表示使用索引的默认参数。
+    """
+    if recall_tier is None and latency_budget_ms is None:
+        return None
+    plan = store.current_index()
+    knob = store.search_knob(plan)
+    if knob is None:
+        # FLAT 为精确检索，没有可调的参数
+        return None
+    if table is not None and (table.get("store") != store.key or table.get("index") != asdict(plan)
+                              or table.get("knob") != knob or not table.get("entries")):
+        logger.debug("Calibration table of %s does not match index %s, ignoring it", store.key, plan)
+        table = None
+    if table is not None:
+        entry = select_entry(
+            table["entries"],
+            target_recall=tier_recall(recall_tier) if recall_tier else None,
+            latency_budget_ms=latency_budget_ms,
+        )
+        return {knob: int(entry["value"])}
+    if recall_tier is None:
+        return None
+    return {knob: max(1, round(knob_default(plan, knob, top_k) * TIER_SCALES[recall_tier]))}
+
+
+def _sample_queries(store, num_queries: int, seed: Optional[int] = None) -> np.ndarray:
+    """用随机两行向量的中点作为校准查询，避免查询与库中某一行完全相同"""
+    rng = np.random.default_rng(seed)
+    num_rows = store.num_rows()
+    if num_rows == 0:
+        return np.empty((0, store.dim or 0), dtype=np.float32)
+    positions = np.sort(rng.choice(num_rows, size=min(num_rows, num_queries * 2), replace=False))
+    sampled, offset = [], 0
+    for _, vectors in store.iter_embeddings():
+        # num_rows 可能是近似值，超出实际行数的位置直接忽略
+        selected = positions[(positions >= offset) & (positions < offset + len(vectors))] - offset
+        if len(selected):
+            sampled.append(vectors[selected])
+        offset += len(vectors)
+    if not sampled:
+        return np.empty((0, store.dim or 0), dtype=np.float32)
+    sampled = np.concatenate(sampled)
+    rng.shuffle(sampled)
+    if len(sampled) < 2:
+        return sampled
+    half = len(sampled) // 2
+    return np.ascontiguousarray((sampled[:half] + sampled[half:half * 2]) / 2, dtype=np.float32)
+
+
+def exact_top_k(batches: Iterable[Tuple[np.ndarray, np.ndarray]],
+                queries: np.ndarray,
+                top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """遍历 (id 数组, 向量矩阵) 批次暴力计算 L2 最近邻
+
+    Returns:
+        形状均为 (查询数, top_k) 的 id 数组和距离数组，每行按距离升序，不足时 id 以 -1、距离以 inf 补齐
+    """
+    best_distances = np.full((len(queries), top_k), np.inf, dtype=np.float32)
+    best_ids = np.full((len(queries), top_k), -1, dtype=np.int64)
+    query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+    for ids, vectors in batches:
+        distances = query_norms - 2 * queries @ vectors.T + np.einsum("ij,ij->i", vectors, vectors)[None, :]
+        distances = np.concatenate([best_distances, distances.astype(np.float32)], axis=1)
+        candidates = np.concatenate([best_ids, np.broadcast_to(ids, (len(queries), len(ids)))], axis=1)
+        keep = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+        best_distances = np.take_along_axis(distances, keep, axis=1)
+        best_ids = np.take_along_axis(candidates, keep, axis=1)
+    order = np.argsort(best_distances, axis=1, kind="stable")
+    return np.take_along_axis(best_ids, order, axis=1), np.take_along_axis(best_distances, order, axis=1)
+
+
+def relevant_ids(batches: Iterable[Tuple[np.ndarray, np.ndarray]],
+                 queries: np.ndarray,
+                 top_k: int) -> Tuple[List[set], np.ndarray, int]:
+    """每个查询的正确结果集合、并列距离上限及应命中的总数
+
+    距离不超过第 k 个精确距离（含 TIE_TOLERANCE）的行都算正确结果：校准查询取两行向量的中点，
+    到这两行的距离完全相同，库中也可能有重复的向量，精确检索返回并列行中的哪一行都是对的，
+    只按 id 比较会把 FLAT 的召回率算成小于 1。多取 top_k 个候选容纳并列的行，
+    更多的并列行由 _correct 按命中的精确距离判断。
+    """
+    ids, distances = exact_top_k(batches, queries, top_k * 2)
+    relevant, bounds, expected = [], np.full(len(queries), -np.inf), 0
+    for i, (row_ids, row_distances) in enumerate(zip(ids, distances)):
+        count = min(top_k, int((row_ids >= 0).sum()))
+        expected += count
+        if count == 0:
+            relevant.append(set())
+            continue
+        kth = float(row_distances[count - 1])
+        bounds[i] = kth + TIE_TOLERANCE * max(abs(kth), 1e-6)
+        relevant.append(set(row_ids[(row_ids >= 0) & (row_distances <= bounds[i])].tolist()))
+    return relevant, bounds, expected
+
+
+def _correct(ids: Iterable[int], distances: Optional[Iterable[float]], relevant: set, bound: float) -> int:
+    """命中中正确结果的个数，distances 为命中的精确距离，索引只给出近似距离时传 None"""
+    if distances is None:
+        return len(set(ids) & relevant)
+    return len({id for id, distance in zip(ids, distances) if id in relevant or distance <= bound})
+
+
+def calibrate(store,
+              num_queries: Optional[int] = None,
+              top_k: Optional[int] = None,
+              queries: Optional[np.ndarray] = None,
+              seed: Optional[int] = None) -> Dict[str, Any]:
+    """测量当前索引在不同 nprobe/ef 下相对精确检索的召回率和单查询延迟
+
+    Args:
+        store: 向量库后端
+        num_queries: 未提供 queries 时采样的查询数
+        top_k: 计算召回率的 top_k
+        queries: 校准查询向量，建议使用真实查询的向量
+        seed: 采样随机种子
+
+    Returns:
+        Dict: 校准表，entries 中每项为一个参数值的 recall、p50_ms 和 p99_ms
+    """
+    num_queries = num_queries or settings.search_tiers.calibration_queries
+    top_k = top_k or settings.search_tiers.calibration_top_k
+    plan = store.current_index()
+    knob = store.search_knob(plan)
+    if queries is None:
+        queries = _sample_queries(store, num_queries, seed)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    if len(queries) == 0:
+        raise ValueError("No vectors to calibrate against")
+
+    relevant, bounds, expected = relevant_ids(store.iter_embeddings(), queries, top_k)
+    # 有损索引返回的距离是近似值，只能按 id 判断
+    exact_scores = not plan.is_lossy
+    entries = []
+    for value in (knob_grid(plan, knob, top_k) if knob else [None]):
+        search_params = {knob: value} if knob else None
+        # 预热一次，避免首个查询的加载时间计入延迟
+        store.search(queries[:1], [top_k], search_params=search_params)
+        latencies, found = [], 0
+        for query, correct, bound in zip(queries, relevant, bounds):
+            started = time.perf_counter()
+            hits = store.search(query[None, :], [top_k], search_params=search_params)[0][:top_k]
+            latencies.append((time.perf_counter() - started) * 1000)
+            found += _correct([hit["id"] for hit in hits],
+                              [hit["score"] for hit in hits] if exact_scores else None, correct, bound)
+        entry = {
+            "value": value,
+            "recall": round(found / max(1, expected), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        }
+        logger.info("Calibrated %s %s=%s: %s", store.key, knob, value, entry)
+        entries.append(entry)
+
+    return {
+        "store": store.key,
+        "index": asdict(plan),
+        "knob": knob,
+        "top_k": top_k,
+        "num_rows": store.num_rows(),
+        "num_queries": len(queries),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "entries": entries,
+    }
+
+
+def _recall(found: Tuple[np.ndarray, Optional[np.ndarray]], truth: Tuple[List[set], np.ndarray, int]) -> float:
+    """found 为检索结果的 (id 数组, 精确距离数组或 None)，truth 为 relevant_ids 的返回值"""
+    ids, distances = found
+    relevant, bounds, expected = truth
+    hits = 0
+    for i, row in enumerate(ids):
+        valid = row >= 0
+        hits += _correct(row[valid].tolist(), None if distances is None else distances[i][valid].tolist(),
+                         relevant[i], bounds[i])
+    return round(hits / max(1, expected), 4)
+
+
+def precision_report(store,
+                     num_rows: Optional[int] = None,
+                     num_queries: Optional[int] = None,
+                     top_k: Optional[int] = None,
+                     rerank_factor: int = 4,
+                     max_rows: int = REPORT_MAX_ROWS,
+                     seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """比较各存储精度的召回率和内存占用
+
+    按 num_rows（默认为当前行数）选择每种精度的索引方案，用 FAISS 在最多 max_rows 行上构建同类索引，
+    以序列化大小估算每个向量的字节数并按 num_rows 外推；召回率相对同一批行上的精确检索，
+    有损索引同时给出召回 top_k * rerank_factor 个候选后用全精度向量重排的召回率。
+    Milvus 的实际内存与 FAISS 同类索引接近，但不完全相同。
+    """
+    import faiss
+
+    num_queries = num_queries or settings.search_tiers.calibration_queries
+    top_k = top_k or settings.search_tiers.calibration_top_k
+    num_rows = num_rows or store.num_rows()
+    rng = np.random.default_rng(seed)
+
+    ids, vectors = [], []
+    for batch_ids, batch_vectors in store.iter_embeddings():
+        ids.append(batch_ids)
+        vectors.append(batch_vectors)
+        if sum(len(batch) for batch in ids) >= max_rows:
+            break
+    if not ids:
+        raise ValueError("No vectors to build the report from")
+    ids, vectors = np.concatenate(ids)[:max_rows], np.concatenate(vectors)[:max_rows]
+    pairs = rng.choice(len(vectors), size=(min(num_queries, len(vectors)), 2))
+    queries = np.ascontiguousarray(vectors[pairs].mean(axis=1), dtype=np.float32)
+    truth = relevant_ids([(ids, vectors)], queries, top_k)
+
+    report = []
+    for precision in PRECISIONS:
+        plan = choose_index(num_rows, vectors.shape[1], precision)
+        # 样本行数较少时按样本缩小 nlist，保证每个聚类有足够的训练点
+        if plan.nlist:
+            plan = IndexPlan(plan.index_type, nlist=max(1, min(plan.nlist, len(vectors) // 39)),
+                             m=plan.m, precision=plan.precision)
+        if plan.index_type == "FLAT":
+            index = faiss.IndexIDMap2(faiss.index_factory(vectors.shape[1], plan.faiss_factory(), faiss.METRIC_L2))
+        else:
+            index = faiss.index_factory(vectors.shape[1], plan.faiss_factory(), faiss.METRIC_L2)
+        if not index.is_trained:
+            sample = vectors[rng.choice(len(vectors), size=min(len(vectors), plan.train_size), replace=False)]
+            index.train(sample)
+        index.add_with_ids(vectors, ids)
+        params = faiss.SearchParametersIVF(nprobe=plan.nprobe) if plan.is_ivf or plan.index_type == "HNSW" else None
+
+        bytes_per_vector = len(faiss.serialize_index(index)) / len(vectors)
+        found_distances, found_ids = index.search(queries, top_k, params=params)
+        entry = {
+            "precision": precision,
+            "index": asdict(plan),
+            "bytes_per_vector": round(bytes_per_vector, 1),
+            "estimated_bytes": int(bytes_per_vector * num_rows),
+            "recall": _recall((found_ids, None if plan.is_lossy else found_distances), truth),
+        }
+        if plan.is_lossy:
+            candidates = index.search(queries, top_k * rerank_factor, params=params)[1]
+            positions = {int(id): i for i, id in enumerate(ids)}
+            reranked, reranked_distances = [], []
+            for query, row in zip(queries, candidates):
+                row = row[row >= 0]
+                distances = ((vectors[[positions[int(id)] for id in row]] - query) ** 2).sum(axis=1)
+                order = np.argsort(distances)[:top_k]
+                padding = (0, max(0, top_k - len(order)))
+                reranked.append(np.pad(row[order], padding, constant_values=-1))
+                reranked_distances.append(np.pad(distances[order], padding, constant_values=np.inf))
+            entry["recall_rerank"] = _recall((np.stack(reranked), np.stack(reranked_distances)), truth)
+        logger.info("Precision %s: %s", precision, entry)
+        report.append(entry)
+    return report
+
+
+class CalibrationTables:
+    """按知识库目录缓存校准表，文件更新后重新读取"""
+
+    def __init__(self):
+        self._tables: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path(vector_store_path: str) -> str:
+        return os.path.join(vector_store_path, CALIBRATION_FILE)
+
+    def get(self, vector_store_path: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not vector_store_path:
+            return None
+        path = self.path(vector_store_path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._tables.get(path)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        try:
+            with open(path, encoding="utf-8") as f:
+                table = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to load calibration table %s: %s", path, str(e))
+            return None
+        with self._lock:
+            self._tables[path] = (mtime, table)
+        return table
+
+    def save(self, vector_store_path: str, table: Dict[str, Any]):
+        path = self.path(vector_store_path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(table, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+# 全局校准表缓存实例
+calibration_tables = CalibrationTables()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate recall and latency of a knowledge base's vector index")
+    parser.add_argument("--kb-id", type=int, required=True)
+    parser.add_argument("--queries", type=int, default=settings.search_tiers.calibration_queries,
+                        help="number of sampled queries when --queries-file is not given")
+    parser.add_argument("--queries-file", default=None, help="text file with one real query per line")
+    parser.add_argument("--top-k", type=int, default=settings.search_tiers.calibration_top_k)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--precision-report", action="store_true",
+                        help="compare recall and memory of each vector precision instead of calibrating")
+    parser.add_argument("--rows", type=int, default=None,
+                        help="row count used to choose indexes and extrapolate memory in the precision report")
+    parser.add_argument("--rerank-factor", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    # 命令行入口才需要数据库和服务层
+    from sbk.core.database import get_db
+    from sbk.core.embeddings.factory import EmbeddingFactory
+    from sbk.services.knowledge_base_service import KnowledgeBaseService
+    from sbk.services.vector_service import VectorService
+
+    kb = KnowledgeBaseService(next(get_db())).get_knowledge_base(args.kb_id)
+    if kb is None:
+        print(f"Knowledge base {args.kb_id} not found", file=sys.stderr)
+        return 1
+    kb_config = kb.config or {}
+    vector_service = VectorService(
+        collection_name=f"collection_kb_{kb.id}",
+        vector_store_path=kb.vector_store_path,
+        vector_store=kb_config.get("vector_store"),
+        kb_id=kb.id,
+    )
+    vector_service.flush()
+
+    if args.precision_report:
+        report = precision_report(vector_service.store, num_rows=args.rows, num_queries=args.queries,
+                                  top_k=args.top_k, rerank_factor=args.rerank_factor, seed=args.seed)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    queries = None
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        with EmbeddingFactory.acquire(kb_config.get("embedding")) as embedding_model:
+            queries = embedding_model.embed_documents(texts)
+
+    table = calibrate(vector_service.store, args.queries, args.top_k, queries=queries, seed=args.seed)
+    calibration_tables.save(kb.vector_store_path, table)
+    print(json.dumps(table, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+import os
+import json
+import zlib
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from sbk.config import config as settings
+from sbk.core.exceptions import ConfigurationError
+from sbk.core.metadata_filter import Filter, sqlite_where
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = "chunks.sqlite"
+# SQLite 单条语句的参数个数上限较低，按批查询
+SQL_BATCH = 500
+CODECS = ("zstd", "zlib", "none")
+
+
+class _Codec:
+    """chunk 正文的压缩编码"""
+
+    def __init__(self, name: str, level: int = 3):
+        self.name = name
+        self.level = level
+        if name == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ConfigurationError(f"zstd chunk store requires zstandard: {str(e)}")
+            self._zstd = zstandard
+        elif name not in CODECS:
+            raise ConfigurationError(f"Unsupported chunk codec: {name}")
+
+    def encode(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+        if self.name == "zstd":
+            # 压缩器对象不是线程安全的，每次新建
+            return self._zstd.ZstdCompressor(level=self.level).compress(data)
+        if self.name == "zlib":
+            return zlib.compress(data, self.level)
+        return data
+
+    def decode(self, data: bytes) -> str:
+        if self.name == "zstd":
+            data = self._zstd.ZstdDecompressor().decompress(data)
+        elif self.name == "zlib":
+            data = zlib.decompress(data)
+        return data.decode("utf-8")
+
+
+class ChunkStore:
+    """按 chunk id 保存正文和元数据的外部存储，向量库中只保留 id、doc_id 和向量
+
+    正文压缩后保存在 SQLite 中，元数据保存为 JSON 文本以便用 json_extract 过滤；
+    编码方式在创建时写入 meta 表，之后以它为准。多个进程可以共享同一目录。
+    """
+
+    def __init__(self, path: str, codec: str = "zstd", level: int = 3):
+        self.path = path
+        self.codec_name = codec
+        self.level = level
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._open()
+
+    def _open(self):
+        self._pid = os.getpid()
+        self._db = sqlite3.connect(os.path.join(self.path, DB_FILE), check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, doc_id TEXT NOT NULL, "
+            "metadata TEXT NOT NULL, content BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks (doc_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        codec = self.codec_name
+        if codec == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                logger.warning("zstandard is not installed, chunk store %s falls back to zlib", self.path)
+                codec = "zlib"
+        self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('codec', ?)", (codec,))
+        stored = self._db.execute("SELECT value FROM meta WHERE key = 'codec'").fetchone()[0]
+        self._codec = _Codec(stored, self.level)
+
+    def _check_fork(self):
+        # SQLite 连接不能跨进程使用，fork 后重新打开
+        if self._pid != os.getpid():
+            self._open()
+
+    def put(self, ids: Iterable[int], doc_ids: Iterable[str], contents: Iterable[str], metadatas: Iterable[Dict]):
+        """写入一批 chunk，id 已存在时覆盖"""
+        rows = [
+            (int(id), doc_id, json.dumps(metadata, ensure_ascii=False), self._codec.encode(content))
+            for id, doc_id, content, metadata in zip(ids, doc_ids, contents, metadatas)
+        ]
+        with self._lock:
+            self._check_fork()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, doc_id, metadata, content) VALUES (?, ?, ?, ?)", rows
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def get(self, ids: Iterable[int], fields: Optional[Iterable[str]] = None) -> Dict[int, Dict[str, Any]]:
+        """批量读取 chunk，返回以 id 为键的 doc_id、metadata 和 content，不存在的 id 不出现在结果中
+
+        fields 指定时只读取其中的列（id 总是返回），不需要正文时不会解压。
+        """
+        fields = set(fields) if fields is not None else {"doc_id", "metadata", "content"}
+        columns = ["id"] + [name for name in ("doc_id", "metadata", "content") if name in fields]
+        ids = [int(i) for i in ids]
+        payloads = {}
+        with self._lock:
+            self._check_fork()
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = ids[start:start + SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                for row in self._db.execute(f"SELECT {', '.join(columns)} FROM chunks WHERE id IN ({placeholders})", batch):
+                    payload = dict(zip(columns, row))
+                    if "metadata" in payload:
+                        payload["metadata"] = json.loads(payload["metadata"])
+                    if "content" in payload:
+                        payload["content"] = self._codec.decode(payload["content"])
+                    payloads[payload["id"]] = payload
+        return payloads
+
+    def match_ids(self, metadata_filter: Filter) -> np.ndarray:
+        """元数据满足全部过滤条件的 chunk id"""
+        where, params = sqlite_where(metadata_filter)
+        with self._lock:
+            self._check_fork()
+            rows = self._db.execute(f"SELECT id FROM chunks WHERE {where}", params).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def delete(self, ids: Iterable[int]) -> int:
+        ids = [int(i) for i in ids]
+        count = 0
+        with self._lock:
+            self._check_fork()
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = ids[start:start + SQL_BATCH]
+                count += self._db.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                                          batch).rowcount
+        return count
+
+    def delete_doc(self, doc_id: str) -> int:
+        with self._lock:
+            self._check_fork()
+            return self._db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._check_fork()
+            page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+            return {
+                "rows": self._db.execute("SELECT count(*) FROM chunks").fetchone()[0],
+                "codec": self._codec.name,
+                "bytes": page_count * page_size,
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ChunkStoreRegistry:
+    """按知识库目录缓存外部 chunk 存储，同一进程内共享一个实例"""
+
+    def __init__(self, codec: str = "zstd", level: int = 3):
+        self.codec = codec
+        self.level = level
+        self._stores: Dict[str, ChunkStore] = {}
+        self._lock = threading.Lock()
+
+    def get(self, vector_store_path: str) -> ChunkStore:
+        path = os.path.realpath(os.path.join(vector_store_path, "chunks"))
+        with self._lock:
+            store = self._stores.get(path)
+            if store is None:
+                store = ChunkStore(path, codec=self.codec, level=self.level)
+                self._stores[path] = store
+            return store
+
+    def remove(self, path: str):
+        """关闭并移出注册表，知识库删除时调用"""
+        with self._lock:
+            store = self._stores.pop(os.path.realpath(path), None)
+        if store is not None:
+            store.close()
+
+# 全局外部 chunk 存储注册表实例
+chunk_stores = ChunkStoreRegistry(
+    codec=settings.vector_store.chunk_codec,
+    level=settings.vector_store.chunk_compress_level,
+)
@@ -1,15 +1,29 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Any, Dict, List
+
+import numpy as np
 
 class BaseEmbedding(ABC):
     """Embedding 基类"""
     
     @abstractmethod
-    def embed_query(self, text: str) -> List[float]:
-        """将查询文本转换为向量"""
+    def embed_query(self, text: str) -> np.ndarray:
+        """将查询文本转换为向量，返回形状为 (dim,) 的 float32 数组"""
         pass
         
     @abstractmethod
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """将文档文本列表转换为向量列表"""
-        pass 
\ No newline at end of file
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """将文档文本列表转换为向量，返回形状为 (len(texts), dim) 的 float32 数组"""
+        pass
+
+    def memory_bytes(self) -> int:
+        """模型常驻内存的估算字节数，远程模型返回 0"""
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        """模型自身的运行统计（如微批的批大小分布），没有时返回空字典"""
+        return {}
+
+    def close(self):
+        """释放模型占用的资源，模型被注册表卸载时调用"""
+        pass
@@ -0,0 +1,130 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 批大小分布统计的分桶上界
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class MicroBatcher:
+    """动态微批处理器
+
+    并发请求的文本先进入队列，后台线程从第一条到达起最多等待 max_wait_ms，
+    或凑满 max_batch_size 条后调用一次 encode_fn，再把结果分发给各个调用方。
+    """
+
+    def __init__(self,
+                 encode_fn: Callable[[List[str]], Sequence[Any]],
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
+        self._stats = {
+            "batches": 0,
+            "items": 0,
+            "max_batch_size": 0,
+            "queue_delay_total_ms": 0.0,
+            "queue_delay_max_ms": 0.0,
+            "batch_size_histogram": {bucket: 0 for bucket in BATCH_SIZE_BUCKETS + ("inf",)},
+        }
+
+    def embed(self, texts: List[str]) -> List[Any]:
+        """提交文本并等待对应的向量，返回顺序与 texts 一致"""
+        return [future.result() for future in self.submit(texts)]
+
+    def submit(self, texts: List[str]) -> List[Future]:
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        self._ensure_worker()
+        now = time.monotonic()
+        futures = []
+        for text in texts:
+            future: Future = Future()
+            self._queue.put((text, future, now))
+            futures.append(future)
+        return futures
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True, name="embedding-micro-batcher")
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = item[2] + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # 超过等待时间后只取队列中已有的条目
+                    next_item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    stop = True
+                    break
+                batch.append(next_item)
+            self._process(batch)
+            if stop:
+                break
+
+    def _process(self, batch: List[tuple]):
+        started = time.monotonic()
+        delays = [(started - enqueued) * 1000 for _, _, enqueued in batch]
+        try:
+            vectors = self.encode_fn([text for text, _, _ in batch])
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+        except Exception as e:
+            logger.error("Micro-batch encode failed: %s", str(e))
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        self._record(len(batch), delays)
+
+    def _record(self, size: int, delays: List[float]):
+        with self._lock:
+            stats = self._stats
+            stats["batches"] += 1
+            stats["items"] += size
+            stats["max_batch_size"] = max(stats["max_batch_size"], size)
+            stats["queue_delay_total_ms"] += sum(delays)
+            stats["queue_delay_max_ms"] = max(stats["queue_delay_max_ms"], max(delays))
+            bucket = next((b for b in BATCH_SIZE_BUCKETS if size <= b), "inf")
+            stats["batch_size_histogram"][bucket] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取批大小和排队延迟统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            # 键转为字符串，便于以 JSON 输出
+            stats["batch_size_histogram"] = {str(bucket): count
+                                             for bucket, count in self._stats["batch_size_histogram"].items()}
+        stats["avg_batch_size"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_queue_delay_ms"] = stats["queue_delay_total_ms"] / stats["items"] if stats["items"] else 0.0
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def close(self):
+        """停止后台线程，已在队列中的请求会先处理完"""
+        self._closed = True
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join()
@@ -0,0 +1,347 @@
+import os
+import time
+import re
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+
+import numpy as np
+
+from sbk.config import config as settings
+from sbk.core.cache import LRUCache
+from sbk.core.embeddings.base import BaseEmbedding
+from sbk.core.embeddings.registry import config_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def text_digest(text: str) -> str:
+    """计算 chunk 文本的内容地址"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _VectorStore:
+    """单个 embedding 配置的向量缓存
+
+    向量按固定大小的槽位写入 vectors.bin 并以内存映射方式读取，
+    index.sqlite 记录 内容地址 -> 槽位 的映射和最近访问时间，被淘汰的槽位会被复用。
+    """
+
+    GROW_SLOTS = 1024
+
+    def __init__(self, path: Path, max_bytes: int, dtype: str):
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.dim: Optional[int] = None
+        self._mm: Optional[np.memmap] = None
+        self._db = sqlite3.connect(str(self.path / "index.sqlite"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (digest TEXT PRIMARY KEY, slot INTEGER NOT NULL, last_access REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries (last_access)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER PRIMARY KEY)")
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        if row:
+            self.dim = int(row[0])
+            stored_dtype = self._db.execute("SELECT value FROM meta WHERE key = 'dtype'").fetchone()
+            if stored_dtype:
+                self.dtype = np.dtype(stored_dtype[0])
+
+    @property
+    def _blob_path(self) -> Path:
+        return self.path / "vectors.bin"
+
+    @property
+    def _slot_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.max_bytes // self._slot_bytes)
+
+    def _init_dim(self, dim: int):
+        self.dim = dim
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dtype', ?)", (self.dtype.name,))
+
+    def _mapped_slots(self) -> int:
+        return 0 if self._mm is None else self._mm.shape[0]
+
+    def _remap(self):
+        """文件被本进程或其他进程扩容后重新映射"""
+        size = self._blob_path.stat().st_size if self._blob_path.exists() else 0
+        slots = size // self._slot_bytes
+        if slots == self._mapped_slots():
+            return
+        self._mm = np.memmap(self._blob_path, dtype=self.dtype, mode="r+", shape=(slots, self.dim)) if slots else None
+
+    def _allocated_slots(self) -> int:
+        size = self._blob_path.stat().st_size if self._blob_path.exists() else 0
+        return size // self._slot_bytes
+
+    def _lookup(self, digests: List[str]) -> List[tuple]:
+        rows = []
+        for start in range(0, len(digests), 500):
+            batch = digests[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(self._db.execute(
+                f"SELECT digest, slot FROM entries WHERE digest IN ({placeholders})", batch
+            ).fetchall())
+        return rows
+
+    def get_many(self, digests: List[str]) -> Dict[str, np.ndarray]:
+        if self.dim is None or not digests:
+            return {}
+        found: Dict[str, np.ndarray] = {}
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = self._lookup(digests)
+            if rows:
+                slots = np.array([slot for _, slot in rows], dtype=np.int64)
+                if slots.max() >= self._mapped_slots():
+                    self._remap()
+                vectors = np.asarray(self._mm[slots], dtype=np.float32)
+                found = {digest: vectors[i] for i, (digest, _) in enumerate(rows)}
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_access = ? WHERE digest = ?",
+                                     [(now, digest) for digest, _ in rows])
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return found
+
+    def put_many(self, digests: List[str], vectors: np.ndarray) -> int:
+        """写入向量，返回为腾出空间而淘汰的条目数"""
+        if not digests:
+            return 0
+        if self.dim is None:
+            self._init_dim(vectors.shape[1])
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}")
+
+        evicted = 0
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            # 其他进程可能已经写入了相同内容
+            existing = {digest for digest, _ in self._lookup(digests)}
+            pending = [(digest, vector) for digest, vector in zip(digests, vectors) if digest not in existing]
+            if not pending:
+                self._db.execute("COMMIT")
+                return 0
+
+            slots = [row[0] for row in self._db.execute(
+                "SELECT slot FROM free_slots ORDER BY slot LIMIT ?", (len(pending),)
+            ).fetchall()]
+            if slots:
+                self._db.executemany("DELETE FROM free_slots WHERE slot = ?", [(slot,) for slot in slots])
+
+            allocated = self._allocated_slots()
+            needed = len(pending) - len(slots)
+            if needed > 0 and allocated < self.capacity:
+                # 按块扩容，多出来的槽位记入空闲列表
+                grow = min(self.capacity, max(allocated + needed, allocated + self.GROW_SLOTS, allocated * 2))
+                with open(self._blob_path, "ab") as f:
+                    f.truncate(grow * self._slot_bytes)
+                take = min(needed, grow - allocated)
+                slots.extend(range(allocated, allocated + take))
+                self._db.executemany("INSERT OR IGNORE INTO free_slots (slot) VALUES (?)",
+                                     [(slot,) for slot in range(allocated + take, grow)])
+                needed -= take
+
+            if needed > 0:
+                # 容量已满，淘汰最久未访问的条目
+                victims = self._db.execute(
+                    "SELECT digest, slot FROM entries ORDER BY last_access LIMIT ?", (needed,)
+                ).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE digest = ?", [(digest,) for digest, _ in victims])
+                slots.extend(slot for _, slot in victims)
+                evicted = len(victims)
+
+            pending = pending[:len(slots)]
+            self._remap()
+            self._mm[np.array(slots, dtype=np.int64)] = np.stack([vector for _, vector in pending]).astype(self.dtype)
+            self._mm.flush()
+            now = time.time()
+            self._db.executemany("INSERT OR REPLACE INTO entries (digest, slot, last_access) VALUES (?, ?, ?)",
+                                 [(digest, slot, now) for (digest, _), slot in zip(pending, slots)])
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def size(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class EmbeddingCache:
+    """磁盘持久化、按内容寻址的 chunk 向量缓存
+
+    键为 (embedding 配置指纹, chunk 文本 sha256)，只有未命中的文本才会调用模型。
+    dtype 低于 float32 时，新计算的向量也按该精度取整后返回，保证命中与否结果一致。
+    """
+
+    def __init__(self, root_path: str, max_bytes: int, dtype: str = "float32"):
+        self.root_path = Path(os.path.expanduser(root_path))
+        self.max_bytes = max_bytes
+        self.dtype = dtype
+        self._stores: Dict[str, _VectorStore] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _store(self, embedding_config: Optional[Dict[str, Any]]) -> _VectorStore:
+        fingerprint = config_fingerprint(embedding_config)
+        store = self._stores.get(fingerprint)
+        if store is None:
+            store = _VectorStore(self.root_path / fingerprint, self.max_bytes, self.dtype)
+            self._stores[fingerprint] = store
+        return store
+
+    def embed_documents(self,
+                        model: BaseEmbedding,
+                        embedding_config: Optional[Dict[str, Any]],
+                        texts: List[str]) -> np.ndarray:
+        """带缓存的 embed_documents，返回顺序与 texts 一致
+
+        Args:
+            model: embedding 模型
+            embedding_config: 模型对应的 embedding 配置
+            texts: chunk 文本列表
+
+        Returns:
+            np.ndarray: 形状为 (len(texts), dim) 的 float32 数组
+        """
+        if not self.enabled or not texts:
+            return model.embed_documents(texts)
+
+        digests = [text_digest(text) for text in texts]
+        with self._lock:
+            try:
+                store = self._store(embedding_config)
+                found = store.get_many(list(dict.fromkeys(digests)))
+            except Exception as e:
+                logger.error("Embedding cache lookup failed: %s", str(e))
+                self._stats["errors"] += 1
+                return model.embed_documents(texts)
+
+        # 同一批内重复的文本只计算一次
+        missing: Dict[str, str] = {}
+        for digest, text in zip(digests, texts):
+            if digest not in found and digest not in missing:
+                missing[digest] = text
+
+        if missing:
+            computed = model.embed_documents(list(missing.values()))
+            if store.dtype != np.float32:
+                computed = np.asarray(computed).astype(store.dtype).astype(np.float32)
+            for digest, vector in zip(missing.keys(), computed):
+                found[digest] = vector
+            with self._lock:
+                try:
+                    self._stats["evictions"] += store.put_many(list(missing.keys()), computed)
+                    self._stats["writes"] += len(missing)
+                except Exception as e:
+                    logger.error("Embedding cache write failed: %s", str(e))
+                    self._stats["errors"] += 1
+
+        with self._lock:
+            self._stats["misses"] += len(missing)
+            self._stats["hits"] += len(texts) - len(missing)
+        logger.debug("Embedding cache: %d texts, %d computed", len(texts), len(missing))
+        # 磁盘上可能是 float16，这里统一填入 float32 结果数组
+        embeddings = np.empty((len(digests), found[digests[0]].shape[0]), dtype=np.float32)
+        for i, digest in enumerate(digests):
+            embeddings[i] = found[digest]
+        return embeddings
+
+    def stats(self) -> Dict[str, Any]:
+        """获取缓存命中率等统计信息"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": {fingerprint: store.size() for fingerprint, store in self._stores.items()},
+            }
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本：统一全角/半角等 Unicode 形式并合并空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class QueryEmbeddingCache:
+    """进程内查询向量缓存
+
+    按 (embedding 配置指纹, 规范化后的查询文本) 缓存，使用相同 embedding 配置的知识库共享缓存。
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=max_bytes, ttl=ttl)
+
+    def embed(self,
+              embedding_config: Optional[Dict[str, Any]],
+              queries: List[str],
+              compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """获取查询向量，未命中的查询通过 compute 批量计算
+
+        Args:
+            embedding_config: embedding 配置
+            queries: 查询文本列表
+            compute: 计算向量的函数，接收规范化后的文本列表
+
+        Returns:
+            np.ndarray: 与 queries 顺序一致的 float32 向量数组
+        """
+        fingerprint = config_fingerprint(embedding_config)
+        normalized = [normalize_query(query) for query in queries]
+        vectors: Dict[str, Any] = {}
+        missing: List[str] = []
+        for text in normalized:
+            if text in vectors or text in missing:
+                continue
+            vector = self.cache.get((fingerprint, text))
+            if vector is None:
+                missing.append(text)
+            else:
+                vectors[text] = vector
+
+        if missing:
+            for text, vector in zip(missing, compute(missing)):
+                # 复制单行，避免缓存条目持有整批数组
+                vector = np.array(vector, dtype=np.float32)
+                self.cache.set((fingerprint, text), vector)
+                vectors[text] = vector
+
+        return np.stack([vectors[text] for text in normalized])
+
+    def stats(self) -> Dict[str, Any]:
+        """获取命中、未命中和淘汰统计"""
+        return self.cache.stats()
+
+# 全局 chunk 向量缓存实例
+embedding_cache = EmbeddingCache(
+    root_path=settings.embedding.cache_path,
+    max_bytes=settings.embedding.cache_max_bytes,
+    dtype=settings.embedding.cache_dtype,
+)
+
+# 全局查询向量缓存实例
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=settings.embedding.query_cache_max_entries,
+    max_bytes=settings.embedding.query_cache_max_bytes,
+    ttl=settings.embedding.query_cache_ttl,
+)
@@ -1,31 +1,73 @@
-from typing import Dict, Any
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator
+from sbk.config import config as settings
 from sbk.core.embeddings.base import BaseEmbedding
+from sbk.core.embeddings.registry import EmbeddingRegistry, normalize_config
 from sbk.core.embeddings.sentence_transformer import SentenceTransformerEmbedding
 from sbk.core.embeddings.openai import OpenAIEmbedding
+from sbk.core.embeddings.onnx import ONNXEmbedding
 
 class EmbeddingFactory:
     """Embedding 工厂类"""
-    
+
+    @staticmethod
+    @contextmanager
+    def acquire(config: Dict[str, Any] = None) -> Iterator[BaseEmbedding]:
+        """
+        获取共享的 Embedding 实例，同一配置的模型在进程内只加载一次
+
+        模型在 with 块内不会被注册表卸载：
+
+            with EmbeddingFactory.acquire(config) as model:
+                vectors = model.embed_documents(texts)
+
+        Args:
+            config: 配置参数，同 build
+        """
+        with embedding_registry.lease(config) as model:
+            yield model
+
     @staticmethod
-    def create(config: Dict[str, Any] = None) -> BaseEmbedding:
+    def build(config: Dict[str, Any] = None) -> BaseEmbedding:
         """
-        创建 Embedding 实例
-        
+        新建 Embedding 实例，不经过模型注册表，由注册表加载模型时调用
+
+        业务代码应通过 acquire 获取共享实例
+
         Args:
-            embedding_type: embedding 类型，支持 "sentence_transformer" 和 "openai"
-            config: 配置参数
+            config: 配置参数，type 支持 "sentence_transformer"、"openai" 和 "onnx"
         """
-        embedding_type = config.get("type", "sentence_tansformer")
-        
+        config = normalize_config(config)
+        embedding_type = config["type"]
+
         if embedding_type == "sentence_transformer":
             return SentenceTransformerEmbedding(
-                model_name=config.get("model_name", "all-MiniLM-L6-v2")
+                model_name=config["model_name"],
+                micro_batch=settings.embedding.micro_batch,
+                max_batch_size=settings.embedding.micro_batch_max_size,
+                max_wait_ms=settings.embedding.micro_batch_max_wait_ms,
+                num_workers=settings.embedding.num_workers,
+                bulk_min_texts=settings.embedding.bulk_min_texts
             )
         elif embedding_type == "openai":
             return OpenAIEmbedding(
                 api_key=config.get("api_key"),
                 base_url=config.get("base_url"),
-                model_name=config.get("model_name", "text-embedding-3-small")
+                model_name=config["model_name"],
+                dim=config["dim"]
+            )
+        elif embedding_type == "onnx":
+            return ONNXEmbedding(
+                model_name=config["model_name"],
+                quantize=config["quantize"],
+                num_threads=config.get("num_threads") or settings.embedding.onnx_threads or None
             )
         else:
-            raise ValueError(f"Unsupported embedding type: {embedding_type}") 
\ No newline at end of file
+            raise ValueError(f"Unsupported embedding type: {embedding_type}")
+
+# 全局 embedding 模型注册表
+embedding_registry = EmbeddingRegistry(
+    loader=EmbeddingFactory.build,
+    max_models=settings.embedding.max_resident_models,
+    idle_ttl=settings.embedding.idle_ttl,
+)
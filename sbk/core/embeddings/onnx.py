@@ -0,0 +1,244 @@
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from sbk.config import config as settings
+from sbk.core.embeddings.base import BaseEmbedding
+from sbk.core.exceptions import ConfigurationError
+
+logger = logging.getLogger(__name__)
+
+# 导出目录中记录池化方式等信息的文件
+META_FILE = "sbk_onnx.json"
+
+DEFAULT_PARITY_TEXTS = [
+    "What is retrieval-augmented generation?",
+    "向量数据库如何支持语义检索？",
+    "The quick brown fox jumps over the lazy dog.",
+    "知识库文档上传后会自动分段并向量化存储。",
+    "Milvus supports IVF, HNSW and product quantization indexes.",
+    "a",
+]
+
+
+def default_model_dir(model_name: str) -> Path:
+    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+    return Path(os.path.expanduser(settings.embedding.onnx_path)) / safe_name
+
+
+def export_model(model_name: str, output_dir: Path) -> Path:
+    """把 SentenceTransformer 模型的 Transformer 部分导出为 ONNX
+
+    池化方式、是否归一化和最大长度写入 sbk_onnx.json，推理时在 NumPy 中完成池化。
+
+    Returns:
+        Path: 导出的 model.onnx 路径
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    st = SentenceTransformer(model_name, device="cpu")
+    modules = list(st)
+    transformer = modules[0]
+    pooling = next((m for m in modules if isinstance(m, models.Pooling)), None)
+    unsupported = [type(m).__name__ for m in modules[1:] if not isinstance(m, (models.Pooling, models.Normalize))]
+    if not isinstance(transformer, models.Transformer) or pooling is None or unsupported:
+        raise ConfigurationError(f"Model {model_name} cannot be exported to ONNX, unsupported modules: {unsupported}")
+
+    if pooling.pooling_mode_cls_token:
+        pooling_mode = "cls"
+    elif pooling.pooling_mode_max_tokens:
+        pooling_mode = "max"
+    else:
+        pooling_mode = "mean"
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(str(output_dir))
+
+    sample = tokenizer(["hello world"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = output_dir / "model.onnx"
+
+    hf_model = transformer.auto_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(sample[name] for name in input_names),
+            str(model_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    meta = {
+        "model_name": model_name,
+        "pooling": pooling_mode,
+        "normalize": any(isinstance(m, models.Normalize) for m in modules),
+        "max_seq_length": transformer.max_seq_length,
+        "dim": st.get_sentence_embedding_dimension(),
+    }
+    (output_dir / META_FILE).write_text(json.dumps(meta, ensure_ascii=False, indent=2))
+    logger.info("Exported %s to %s", model_name, model_path)
+    return model_path
+
+
+def quantize_model(model_path: Path) -> Path:
+    """对 ONNX 模型做动态 int8 量化"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantized_path = model_path.with_name("model.int8.onnx")
+    quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QInt8)
+    logger.info("Quantized %s to %s", model_path, quantized_path)
+    return quantized_path
+
+
+class ONNXEmbedding(BaseEmbedding):
+    """基于 ONNX Runtime 的 CPU Embedding 实现
+
+    首次使用时从 SentenceTransformer 模型导出 ONNX，可选动态 int8 量化，
+    推理只依赖 onnxruntime 和 tokenizer，不加载 PyTorch。
+    """
+
+    def __init__(self,
+                 model_name: str = "all-MiniLM-L6-v2",
+                 model_dir: Optional[str] = None,
+                 quantize: bool = True,
+                 num_threads: Optional[int] = None,
+                 batch_size: int = 32):
+        """
+        Args:
+            model_name: SentenceTransformer 模型名称
+            model_dir: 导出目录，默认位于 KBS_ONNX_MODEL_PATH 下
+            quantize: 是否使用动态 int8 量化后的模型
+            num_threads: onnxruntime 算子内线程数，None 表示由 onnxruntime 决定
+            batch_size: 每次推理的条数
+        """
+        try:
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ConfigurationError(f"onnx embedding requires onnxruntime and transformers: {str(e)}")
+
+        self.model_name = model_name
+        self.model_dir = Path(model_dir) if model_dir else default_model_dir(model_name)
+        self.batch_size = batch_size
+
+        model_path = self.model_dir / "model.onnx"
+        if not model_path.exists() or not (self.model_dir / META_FILE).exists():
+            model_path = export_model(model_name, self.model_dir)
+        if quantize:
+            quantized_path = self.model_dir / "model.int8.onnx"
+            model_path = quantized_path if quantized_path.exists() else quantize_model(model_path)
+        self.model_path = model_path
+
+        meta = json.loads((self.model_dir / META_FILE).read_text())
+        self.pooling = meta["pooling"]
+        self.normalize = meta["normalize"]
+        self.max_seq_length = meta["max_seq_length"]
+        self.dim = meta["dim"]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self.input_names = [item.name for item in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.model_dir))
+        logger.debug("ONNXEmbedding initialized with %s", model_path)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        # 按长度排序后分批，减少 padding
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        for start in range(0, len(texts), self.batch_size):
+            index = order[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in index],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names if name in encoded}
+            if "token_type_ids" in self.input_names and "token_type_ids" not in feeds:
+                feeds["token_type_ids"] = np.zeros_like(feeds["input_ids"])
+            hidden = self.session.run(None, feeds)[0]
+            embeddings[index] = self._pool(hidden, encoded["attention_mask"])
+        return embeddings
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        elif self.pooling == "max":
+            masked = np.where(attention_mask[..., None] > 0, hidden, -1e9)
+            pooled = masked.max(axis=1)
+        else:
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._encode([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        return self._encode(texts)
+
+    def memory_bytes(self) -> int:
+        return self.model_path.stat().st_size
+
+
+def check_parity(model_name: str,
+                 texts: Optional[List[str]] = None,
+                 threshold: float = 0.99,
+                 quantize: bool = True,
+                 num_threads: Optional[int] = None) -> Dict[str, Any]:
+    """比较 ONNX 与 PyTorch (SentenceTransformer) 输出的余弦相似度
+
+    Returns:
+        Dict[str, Any]: 最小/平均余弦相似度以及是否通过阈值
+    """
+    from sentence_transformers import SentenceTransformer
+
+    texts = texts or DEFAULT_PARITY_TEXTS
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, convert_to_numpy=True)
+    candidate = ONNXEmbedding(model_name, quantize=quantize, num_threads=num_threads).embed_documents(texts)
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = (reference * candidate).sum(axis=1)
+    return {
+        "model_name": model_name,
+        "quantize": quantize,
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "threshold": threshold,
+        "passed": bool(cosine.min() >= threshold),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check ONNX embedding parity against SentenceTransformer")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--threshold", type=float, default=0.99)
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    report = check_parity(args.model, threshold=args.threshold, quantize=not args.no_quantize, num_threads=args.threads)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    sys.exit(0 if report["passed"] else 1)
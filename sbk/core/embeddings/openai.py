@@ -1,65 +1,216 @@
 import os
-from typing import List, Union
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Union, Optional, Callable, Any
 import logging
 
+import numpy as np
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+import openai
 from openai import OpenAI
 from sbk.core.embeddings.base import BaseEmbedding
 
 logger = logging.getLogger(__name__)
 
+# 需要重试的 HTTP 状态码
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# 端点不接受批量/SDK 请求格式时返回的状态码，出现后才整体切换到逐条 HTTP 模式
+BATCH_UNSUPPORTED_STATUS_CODES = {400, 404, 405, 415, 422}
+
+
+class _RetryableError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
 class OpenAIEmbedding(BaseEmbedding):
-    """基于 OpenAI API 的 Embedding 实现"""
-    
-    def __init__(self, api_key: str = None, base_url: str = None, model_name: str = "text-embedding-3-small", dim: int = 1024):
+    """基于 OpenAI API 的 Embedding 实现
+
+    按 tiktoken 计算的 token 数切分批次，在线程池中并发发送请求，
+    每个实例复用一个连接池，遇到 429/5xx 时按指数退避加随机抖动重试。
+    """
+
+    def __init__(self,
+                 api_key: str = None,
+                 base_url: str = None,
+                 model_name: str = "text-embedding-3-small",
+                 dim: int = 1024,
+                 max_batch_tokens: int = None,
+                 max_batch_size: int = None,
+                 max_concurrency: int = None,
+                 max_retries: int = None,
+                 timeout: float = 60.0):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.base_url = base_url
         self.dim = dim
         if not self.api_key:
             raise ValueError("OpenAI API key is required")
-            
+
         self.model = model_name
+        self.max_batch_tokens = max_batch_tokens or int(os.getenv("OPENAI_EMBEDDING_MAX_BATCH_TOKENS", "64000"))
+        self.max_batch_size = max_batch_size or int(os.getenv("OPENAI_EMBEDDING_MAX_BATCH_SIZE", "256"))
+        self.max_concurrency = max_concurrency or int(os.getenv("OPENAI_EMBEDDING_CONCURRENCY", "4"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("OPENAI_EMBEDDING_MAX_RETRIES", "5"))
+
+        # 每个实例一个长连接池，重试由本类负责
+        self._http_client = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency * 2,
+                                max_keepalive_connections=self.max_concurrency),
+        )
+        self.client = OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url or os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1"),
+            max_retries=0,
+            http_client=self._http_client,
+        )
+        self._session = requests.Session()
+        self._session.mount("http://", HTTPAdapter(pool_maxsize=self.max_concurrency))
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=self.max_concurrency))
+        self._timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="openai-embedding")
+        self._encoding = None
+        self._encoding_lock = threading.Lock()
+        # 端点明确拒绝批量请求格式后改用逐条 HTTP 请求的兼容模式
+        self._raw_http = False
         logger.debug("OpenAIEmbedding initialized with model: %s", self.model)
-        
-    def embed_query(self, text: str) -> List[float]:
+
+    def embed_query(self, text: str) -> np.ndarray:
         logger.debug("Embedding query: %s", text)
-        response = self.client.embeddings.create(
-            model=self.model,
-            input=text
-        )
-        logger.debug("Query embedded successfully.")
-        return response.data[0].embedding
-        
-    def embed_documents(self, texts: Union[str, List[str]]) -> List[List[float]]:
-        logger.debug("Embedding documents: %s", texts)
+        return self.embed_documents([text])[0]
+
+    def embed_documents(self, texts: Union[str, List[str]]) -> np.ndarray:
         if isinstance(texts, str):
             texts = [texts]
-        embeddings = []
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        batches = self._make_batches(texts)
+        logger.debug("Embedding %d documents in %d batches", len(texts), len(batches))
+
+        if len(batches) == 1:
+            results = [self._embed_batch(texts)]
+        else:
+            futures = [self._executor.submit(self._embed_batch, texts[start:end]) for start, end in batches]
+            results = [future.result() for future in futures]
+        # 批次按输入顺序切分，直接拼接即可保持原始顺序
+        embeddings = np.concatenate([np.asarray(vectors, dtype=np.float32) for vectors in results])
+        logger.debug("Documents embedded successfully.")
+        return embeddings
+
+    def _token_counts(self, texts: List[str]) -> List[int]:
+        """计算每段文本的 token 数，tokenizer 不可用时按字符数保守估计"""
+        with self._encoding_lock:
+            if self._encoding is None:
+                try:
+                    import tiktoken
+                    try:
+                        self._encoding = tiktoken.encoding_for_model(self.model)
+                    except KeyError:
+                        self._encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    logger.warning("tiktoken unavailable, estimating token counts: %s", str(e))
+                    self._encoding = False
+        if self._encoding is False:
+            return [len(text) for text in texts]
+        return [len(tokens) for tokens in self._encoding.encode_ordinary_batch(texts)]
+
+    def _make_batches(self, texts: List[str]) -> List[tuple]:
+        """按 token 上限和条数上限顺序切分批次，返回 (start, end) 列表"""
+        batches = []
+        start = 0
+        tokens = 0
+        for i, count in enumerate(self._token_counts(texts)):
+            if i > start and (tokens + count > self.max_batch_tokens or i - start >= self.max_batch_size):
+                batches.append((start, i))
+                start, tokens = i, 0
+            tokens += count
+        batches.append((start, len(texts)))
+        return batches
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if not self._raw_http:
+            try:
+                return self._with_retry(lambda: self._sdk_request(texts))
+            except Exception as e:
+                # 限流或服务端错误重试耗尽、鉴权失败等直接抛出，逐条请求只会放大已经过载的端点的压力
+                if not self.base_url or not self._batch_unsupported(e):
+                    raise
+                logger.warning("Endpoint rejected the batch request format, switching to raw HTTP: %s", str(e))
+                embeddings = [self._with_retry(lambda text=text: self._raw_request(text)) for text in texts]
+                self._raw_http = True
+                return embeddings
+        return [self._with_retry(lambda text=text: self._raw_request(text)) for text in texts]
+
+    @staticmethod
+    def _batch_unsupported(error: Exception) -> bool:
+        """判断 SDK 请求失败是否因为端点不接受该请求格式（如不支持批量 input）"""
+        return (isinstance(error, openai.APIStatusError)
+                and error.status_code in BATCH_UNSUPPORTED_STATUS_CODES)
+
+    def _sdk_request(self, texts: List[str]) -> List[List[float]]:
         try:
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url or os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
-            )
             response = self.client.embeddings.create(
                 model=self.model,
                 input=texts,
                 dimensions=self.dim
             )
-            logger.debug("Documents embedded successfully.")
-            return [data.embedding for data in response.data] 
-        except Exception as e:
-            import requests
-            for text in texts:
-                payload = {
-                    "model": self.model,
-                    "input": text,
-                    "encoding_format": "float"
-                }
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-
-                response = requests.request("POST", self.base_url, json=payload, headers=headers)
-                # logger.debug(f"response: {response.text}")
-                embeddings.append(response.json()["data"][0]["embedding"])
-        return embeddings
\ No newline at end of file
+        except openai.APIStatusError as e:
+            if e.status_code in RETRY_STATUS_CODES:
+                raise _RetryableError(str(e), self._retry_after(e.response.headers)) from e
+            raise
+        except (openai.APIConnectionError, openai.APITimeoutError) as e:
+            raise _RetryableError(str(e)) from e
+        data = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in data]
+
+    def _raw_request(self, text: str) -> List[float]:
+        payload = {
+            "model": self.model,
+            "input": text,
+            "encoding_format": "float"
+        }
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        try:
+            response = self._session.post(self.base_url, json=payload, headers=headers, timeout=self._timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise _RetryableError(str(e)) from e
+        if response.status_code in RETRY_STATUS_CODES:
+            raise _RetryableError(f"HTTP {response.status_code}: {response.text[:200]}",
+                                  self._retry_after(response.headers))
+        response.raise_for_status()
+        return response.json()["data"][0]["embedding"]
+
+    @staticmethod
+    def _retry_after(headers: Any) -> Optional[float]:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+    def _with_retry(self, request: Callable[[], Any]) -> Any:
+        """执行请求，可重试错误按指数退避加全抖动重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return request()
+            except _RetryableError as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = random.uniform(0, min(30.0, 0.5 * (2 ** attempt)))
+                if e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                logger.warning("Embedding request failed (attempt %d/%d), retrying in %.2fs: %s",
+                               attempt + 1, self.max_retries + 1, delay, str(e))
+                time.sleep(delay)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._http_client.close()
+        self._session.close()
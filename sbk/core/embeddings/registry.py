@@ -0,0 +1,249 @@
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from sbk.core.embeddings.base import BaseEmbedding
+
+logger = logging.getLogger(__name__)
+
+# 参与模型身份判定的配置字段
+KEY_FIELDS = ("type", "model_name", "base_url", "dim")
+# 仅部分类型使用的身份字段，未设置时不参与计算，保证已有指纹不变
+OPTIONAL_KEY_FIELDS = ("quantize",)
+
+DEFAULT_MODEL_NAMES = {
+    "sentence_transformer": "all-MiniLM-L6-v2",
+    "openai": "text-embedding-3-small",
+    "onnx": "all-MiniLM-L6-v2",
+}
+
+DEFAULT_DIMS = {
+    "openai": 1024,
+}
+
+
+def normalize_config(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """规范化 embedding 配置，补全默认值并去掉与模型身份无关的差异"""
+    config = dict(config or {})
+    embedding_type = (config.get("type") or "sentence_transformer").strip().lower()
+    normalized = dict(config)
+    normalized["type"] = embedding_type
+    normalized["model_name"] = config.get("model_name") or DEFAULT_MODEL_NAMES.get(embedding_type)
+    normalized["base_url"] = (config.get("base_url") or "").rstrip("/") or None
+    dim = config.get("dim") or DEFAULT_DIMS.get(embedding_type)
+    normalized["dim"] = int(dim) if dim else None
+    if embedding_type == "onnx":
+        normalized["quantize"] = bool(config.get("quantize", True))
+    else:
+        normalized.pop("quantize", None)
+    return normalized
+
+
+def _identity(normalized: Dict[str, Any]) -> list:
+    identity = [normalized.get(field) for field in KEY_FIELDS]
+    identity.extend(normalized[field] for field in OPTIONAL_KEY_FIELDS if normalized.get(field) is not None)
+    return identity
+
+
+def config_fingerprint(config: Optional[Dict[str, Any]]) -> str:
+    """计算 embedding 配置的指纹，相同指纹的配置产生相同的向量"""
+    normalized = normalize_config(config)
+    payload = json.dumps(_identity(normalized), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def registry_key(config: Optional[Dict[str, Any]]) -> Tuple:
+    """计算注册表键，不同 API 密钥使用不同的客户端实例"""
+    normalized = normalize_config(config)
+    api_key = normalized.get("api_key")
+    api_key_digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12] if api_key else None
+    return tuple(_identity(normalized)) + (api_key_digest,)
+
+
+class _Entry:
+    __slots__ = ("model", "refcount", "last_used", "bytes")
+
+    def __init__(self, model: BaseEmbedding, nbytes: int):
+        self.model = model
+        self.refcount = 0
+        self.last_used = time.monotonic()
+        self.bytes = nbytes
+
+
+class EmbeddingRegistry:
+    """进程内共享的 embedding 模型注册表
+
+    同一配置的模型只加载一次；通过引用计数防止使用中的模型被卸载，
+    超过常驻数量上限时按 LRU 卸载，空闲超过 idle_ttl 的模型由后台线程卸载。
+    """
+
+    def __init__(self,
+                 loader: Callable[[Dict[str, Any]], BaseEmbedding],
+                 max_models: int = 4,
+                 idle_ttl: float = 1800.0):
+        self.loader = loader
+        self.max_models = max(1, max_models)
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.RLock()
+        self._stats = {"loads": 0, "hits": 0, "evictions": 0, "load_seconds": 0.0}
+        self._sweeper: Optional[threading.Thread] = None
+
+    def acquire(self, config: Optional[Dict[str, Any]]) -> BaseEmbedding:
+        """获取共享模型实例并增加引用计数，使用完毕后需调用 release"""
+        return self._get_or_load(config)
+
+    def release(self, config: Optional[Dict[str, Any]]):
+        """释放一次 acquire 获得的引用"""
+        key = registry_key(config)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.monotonic()
+            self._enforce_capacity()
+
+    @contextmanager
+    def lease(self, config: Optional[Dict[str, Any]]):
+        """在 with 块内持有模型，期间模型不会被卸载"""
+        model = self.acquire(config)
+        try:
+            yield model
+        finally:
+            self.release(config)
+
+    def _get_or_load(self, config: Optional[Dict[str, Any]]) -> BaseEmbedding:
+        key = registry_key(config)
+        with self._lock:
+            entry = self._touch(key)
+            if entry is not None:
+                return entry.model
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # 同一模型只允许一个线程加载，其他模型的查找不受影响
+        with key_lock:
+            with self._lock:
+                entry = self._touch(key)
+                if entry is not None:
+                    return entry.model
+
+            started = time.monotonic()
+            model = self.loader(normalize_config(config))
+            elapsed = time.monotonic() - started
+            try:
+                nbytes = model.memory_bytes()
+            except Exception:
+                nbytes = 0
+            logger.info("Loaded embedding model %s in %.2fs (%d bytes)", key[:2], elapsed, nbytes)
+
+            with self._lock:
+                entry = _Entry(model, nbytes)
+                entry.refcount = 1
+                self._entries[key] = entry
+                self._stats["loads"] += 1
+                self._stats["load_seconds"] += elapsed
+                self._key_locks.pop(key, None)
+                self._enforce_capacity()
+            self._ensure_sweeper()
+            return model
+
+    def _touch(self, key: Tuple) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        entry.last_used = time.monotonic()
+        entry.refcount += 1
+        self._stats["hits"] += 1
+        return entry
+
+    def _enforce_capacity(self):
+        """按 LRU 顺序卸载未被引用的模型，直到不超过常驻上限"""
+        if len(self._entries) <= self.max_models:
+            return
+        for key in list(self._entries.keys()):
+            if len(self._entries) <= self.max_models:
+                break
+            if self._entries[key].refcount == 0:
+                self._evict(key)
+        if len(self._entries) > self.max_models:
+            logger.warning("All %d resident embedding models are in use, exceeding limit %d",
+                           len(self._entries), self.max_models)
+
+    def _evict(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self._stats["evictions"] += 1
+        logger.info("Evicting embedding model %s", key[:2])
+        try:
+            entry.model.close()
+        except Exception as e:
+            logger.error("Error closing embedding model %s: %s", key[:2], str(e))
+
+    def evict_idle(self) -> int:
+        """卸载空闲超过 idle_ttl 且未被引用的模型，返回卸载数量"""
+        if self.idle_ttl <= 0:
+            return 0
+        now = time.monotonic()
+        evicted = 0
+        with self._lock:
+            for key in list(self._entries.keys()):
+                entry = self._entries[key]
+                if entry.refcount == 0 and now - entry.last_used > self.idle_ttl:
+                    self._evict(key)
+                    evicted += 1
+        return evicted
+
+    def _ensure_sweeper(self):
+        if self.idle_ttl <= 0 or self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+
+            def sweep():
+                interval = max(1.0, min(60.0, self.idle_ttl / 2))
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.evict_idle()
+                    except Exception as e:
+                        logger.error("Embedding registry sweep failed: %s", str(e))
+
+            self._sweeper = threading.Thread(target=sweep, daemon=True)
+            self._sweeper.start()
+
+    def clear(self):
+        """卸载所有未被引用的模型"""
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if self._entries[key].refcount == 0:
+                    self._evict(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """获取注册表统计信息"""
+        now = time.monotonic()
+        with self._lock:
+            models = [
+                {
+                    "type": key[0],
+                    "model_name": key[1],
+                    "refcount": entry.refcount,
+                    "bytes": entry.bytes,
+                    "idle_seconds": now - entry.last_used,
+                    **entry.model.stats(),
+                }
+                for key, entry in self._entries.items()
+            ]
+            return {
+                **self._stats,
+                "resident_models": len(models),
+                "resident_bytes": sum(model["bytes"] for model in models),
+                "models": models,
+            }
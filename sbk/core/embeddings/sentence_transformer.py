@@ -1,15 +1,141 @@
-from typing import List
+import os
+import math
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
 from sentence_transformers import SentenceTransformer as ST
 from .base import BaseEmbedding
+from .batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# 工作进程内的模型实例
+_worker_model = None
+
+
+def _init_worker(model_name: str, num_threads: int):
+    global _worker_model
+    import torch
+    torch.set_num_threads(num_threads)
+    _worker_model = ST(model_name, device="cpu")
+
+
+def _encode_chunk(texts: List[str], batch_size: int) -> np.ndarray:
+    return _worker_model.encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False)
 
 class SentenceTransformerEmbedding(BaseEmbedding):
     """基于 SentenceTransformer 的 Embedding 实现"""
     
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self,
+                 model_name: str = "all-MiniLM-L6-v2",
+                 micro_batch: bool = False,
+                 max_batch_size: int = 32,
+                 max_wait_ms: float = 5.0,
+                 num_workers: int = 0,
+                 bulk_min_texts: int = 256,
+                 batch_size: int = 32):
+        """
+        Args:
+            model_name: 模型名称
+            micro_batch: 是否把并发的小请求合并成一次 encode
+            max_batch_size: 微批最大条数
+            max_wait_ms: 微批从第一条请求到达起的最长等待时间（毫秒）
+            num_workers: 批量入库时使用的编码进程数，小于 2 表示不使用多进程
+            bulk_min_texts: 文本数达到该值时才使用多进程编码
+            batch_size: 编码时每批的条数
+        """
+        self.model_name = model_name
         self.model = ST(model_name)
-        
-    def embed_query(self, text: str) -> List[float]:
-        return self.model.encode(text).tolist()
-        
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        return self.model.encode(texts).tolist() 
\ No newline at end of file
+        self.batcher = MicroBatcher(self._encode, max_batch_size, max_wait_ms) if micro_batch else None
+        self.num_workers = num_workers
+        self.bulk_min_texts = bulk_min_texts
+        self.batch_size = batch_size
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _encode(self, texts: List[str], batch_size: int = None) -> np.ndarray:
+        embeddings = self.model.encode(texts, batch_size=batch_size or len(texts), convert_to_numpy=True)
+        return embeddings.astype(np.float32, copy=False)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        if self.batcher is not None:
+            return self.batcher.embed([text])[0]
+        return self._encode([text])[0]
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        if self.batcher is not None and len(texts) <= self.batcher.max_batch_size:
+            return np.stack(self.batcher.embed(texts))
+        if self.num_workers > 1 and len(texts) >= self.bulk_min_texts:
+            return self.encode_bulk(texts)
+        return self._encode(texts, self.batch_size)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # 每个进程分到的 torch 线程数，避免进程数 × 线程数超过核数
+                num_threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+                logger.info("Starting %d encoding processes with %d threads each", self.num_workers, num_threads)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.model_name, num_threads),
+                )
+            return self._pool
+
+    def _token_lengths(self, texts: List[str]) -> List[int]:
+        try:
+            encoded = self.model.tokenizer(texts, add_special_tokens=False, truncation=True,
+                                           max_length=self.model.max_seq_length)
+            return [len(ids) for ids in encoded["input_ids"]]
+        except Exception:
+            return [len(text) for text in texts]
+
+    def encode_bulk(self, texts: List[str]) -> np.ndarray:
+        """面向批量入库的编码
+
+        按 token 长度排序后切成长度相近的桶，由多个进程并行编码以减少 padding，
+        结果按输入顺序返回为连续的 float32 数组。
+        """
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = np.argsort(self._token_lengths(texts), kind="stable")
+        sorted_texts = [texts[i] for i in order]
+
+        # 桶的数量为进程数的若干倍，让先完成的进程继续领取任务
+        chunk_size = max(self.batch_size, math.ceil(len(texts) / (self.num_workers * 4)))
+        pool = self._get_pool()
+        futures = [
+            pool.submit(_encode_chunk, sorted_texts[start:start + chunk_size], self.batch_size)
+            for start in range(0, len(sorted_texts), chunk_size)
+        ]
+        encoded = np.concatenate([future.result() for future in futures])
+
+        embeddings = np.empty(encoded.shape, dtype=np.float32)
+        embeddings[order] = encoded
+        return embeddings
+
+    def memory_bytes(self) -> int:
+        total = 0
+        for tensor in list(self.model.parameters()) + list(self.model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        if self.batcher is None:
+            return {}
+        return {"micro_batch": self.batcher.stats()}
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
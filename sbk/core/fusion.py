@@ -0,0 +1,106 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Candidates:
+    """单路检索的候选集合
+
+    ids 和 scores 按检索器返回的顺序排列，fetch(i) 读取第 i 个候选的完整结果，
+    融合阶段只对最终入选的候选调用它。
+    """
+    ids: np.ndarray
+    scores: np.ndarray
+    fetch: Callable[[int], Dict[str, Any]]
+    # L2 距离越小越相似，BM25 分数越大越相关
+    higher_is_better: bool = True
+
+    @classmethod
+    def from_hits(cls, hits: List[Dict[str, Any]], higher_is_better: bool = True) -> "Candidates":
+        """由已经展开的结果列表构造候选集合"""
+        return cls(
+            ids=np.fromiter((hit["id"] for hit in hits), dtype=np.int64, count=len(hits)),
+            scores=np.fromiter((hit["score"] for hit in hits), dtype=np.float32, count=len(hits)),
+            fetch=hits.__getitem__,
+            higher_is_better=higher_is_better,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def normalize_scores(scores: np.ndarray, higher_is_better: bool = True) -> np.ndarray:
+    """把分数线性映射到 [0, 1]，1 表示该路检索中最相关的候选"""
+    scores = np.asarray(scores, dtype=np.float32)
+    if len(scores) == 0:
+        return scores
+    if not higher_is_better:
+        scores = -scores
+    low, high = scores.min(), scores.max()
+    if high - low <= 1e-12:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def reciprocal_ranks(scores: np.ndarray, higher_is_better: bool = True, k: int = 60) -> np.ndarray:
+    """按 RRF 计算每个候选的 1 / (k + 名次)，名次从 1 开始"""
+    scores = np.asarray(scores, dtype=np.float32)
+    order = np.argsort(-scores if higher_is_better else scores, kind="stable")
+    ranks = np.empty(len(scores), dtype=np.float32)
+    ranks[order] = np.arange(1, len(scores) + 1, dtype=np.float32)
+    return 1.0 / (k + ranks)
+
+
+def fuse(candidates: Sequence[Candidates],
+         weights: Sequence[float],
+         top_k: int,
+         method: str = "weighted",
+         rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """融合多路检索结果，返回分数最高的 top_k 个
+
+    Args:
+        candidates: 每路检索的候选集合
+        weights: 每路检索的权重
+        top_k: 返回结果数量
+        method: weighted 为归一化分数加权求和，rrf 为倒数排名融合
+        rrf_k: RRF 的平滑常数
+
+    Returns:
+        List[Dict]: 融合后的结果，score 为融合分数
+    """
+    if method not in ("weighted", "rrf"):
+        raise ValueError(f"Unsupported fusion method: {method}")
+    sources = [(c, w) for c, w in zip(candidates, weights) if len(c)]
+    if not sources or top_k <= 0:
+        return []
+
+    # 所有候选拼成一个数组，同一个 id 的贡献用 bincount 累加
+    all_ids = np.concatenate([c.ids for c, _ in sources])
+    contributions = np.concatenate([
+        weight * (normalize_scores(c.scores, c.higher_is_better) if method == "weighted"
+                  else reciprocal_ranks(c.scores, c.higher_is_better, rrf_k))
+        for c, weight in sources
+    ])
+    source_no = np.repeat(np.arange(len(sources)), [len(c) for c, _ in sources])
+    position = np.concatenate([np.arange(len(c)) for c, _ in sources])
+
+    unique_ids, first, inverse = np.unique(all_ids, return_index=True, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions, minlength=len(unique_ids))
+
+    k = min(top_k, len(unique_ids))
+    winners = np.argpartition(-fused, k - 1)[:k] if k < len(unique_ids) else np.arange(len(unique_ids))
+    winners = winners[np.argsort(-fused[winners], kind="stable")]
+
+    # 只为入选的候选读取完整结果，优先取排在前面的检索器
+    results = []
+    for winner in winners:
+        c, _ = sources[source_no[first[winner]]]
+        hit = dict(c.fetch(int(position[first[winner]])))
+        hit["score"] = float(fused[winner])
+        results.append(hit)
+    return results
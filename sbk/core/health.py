@@ -4,12 +4,28 @@ from typing import Dict, Any, List
 from threading import Thread
 import psutil
 import requests
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from pymilvus import connections
 
 logger = logging.getLogger(__name__)
 
+
+def cache_metrics() -> Dict[str, Any]:
+    """汇总 embedding 模型注册表（含微批统计）、各级缓存和写缓冲的统计信息"""
+    from sbk.core.embeddings.factory import embedding_registry
+    from sbk.core.embeddings.cache import embedding_cache, query_embedding_cache
+    from sbk.core.write_buffer import write_buffers
+    from sbk.services.retrieval_service import search_result_cache
+    return {
+        "embedding_models": embedding_registry.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "search_result_cache": search_result_cache.stats(),
+        "write_buffers": write_buffers.stats(),
+    }
+
+
 class HealthCheck:
     def __init__(self, check_interval: int = 60):
         self.check_interval = check_interval
@@ -37,12 +53,15 @@ class HealthCheck:
         # 检查系统资源
         self._check_system_resources()
 
+        # 记录模型和缓存统计
+        self._check_caches()
+
     def _check_database(self):
         """检查数据库连接状态"""
         try:
-            from core.database import engine
+            from sbk.core.database import engine
             with engine.connect() as conn:
-                conn.execute("SELECT 1")
+                conn.execute(text("SELECT 1"))
             self.services["database"] = {
                 "status": "healthy",
                 "last_check": time.time(),
@@ -102,6 +121,23 @@ class HealthCheck:
             }
             logger.error(f"System resources check failed: {e}")
 
+    def _check_caches(self):
+        """记录模型注册表和缓存的统计信息"""
+        try:
+            self.services["caches"] = {
+                "status": "healthy",
+                "last_check": time.time(),
+                "metrics": cache_metrics(),
+                "error": None
+            }
+        except Exception as e:
+            self.services["caches"] = {
+                "status": "warning",
+                "last_check": time.time(),
+                "error": str(e)
+            }
+            logger.error(f"Cache metrics collection failed: {e}")
+
     def get_health_status(self) -> Dict[str, Any]:
         """获取所有服务的健康状态"""
         overall_status = "healthy"
@@ -0,0 +1,300 @@
+import os
+import re
+import json
+import math
+import time
+import zlib
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from sbk.config import config as settings
+
+logger = logging.getLogger(__name__)
+
+# HNSW 构建参数
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+# nlist 的取值范围（Milvus 上限 65536）
+MIN_NLIST = 16
+MAX_NLIST = 65536
+# 向量存储精度
+PRECISIONS = ("float32", "float16", "sq8", "pq")
+
+
+@dataclass(frozen=True)
+class IndexPlan:
+    """向量索引方案：索引类型及其构建参数，检索参数由它推导
+
+    precision 为 float16 时向量以半精度保存（FAISS 用 SQfp16 编码，Milvus 用 FLOAT16_VECTOR 字段），
+    sq8 和 pq 精度分别对应 IVF_SQ8 和 IVF_PQ 索引类型。
+    """
+    index_type: str = "FLAT"
+    nlist: int = 0
+    m: int = 0
+    precision: str = "float32"
+
+    def __post_init__(self):
+        # SQ8/PQ 编码与原始向量的精度无关，统一记为 float32，便于比较方案
+        if self.index_type in ("IVF_SQ8", "IVF_PQ"):
+            object.__setattr__(self, "precision", "float32")
+
+    @property
+    def is_ivf(self) -> bool:
+        return self.index_type in ("IVF_FLAT", "IVF_SQ8", "IVF_PQ")
+
+    @property
+    def is_lossy(self) -> bool:
+        """索引中的向量是否经过压缩，压缩后的距离只是近似值，可以用全精度向量重排"""
+        return self.precision == "float16" or self.index_type in ("IVF_SQ8", "IVF_PQ")
+
+    def build_params(self) -> Dict[str, Any]:
+        if self.index_type in ("IVF_FLAT", "IVF_SQ8"):
+            return {"nlist": self.nlist}
+        if self.index_type == "IVF_PQ":
+            return {"nlist": self.nlist, "m": self.m, "nbits": 8}
+        if self.index_type == "HNSW":
+            return {"M": HNSW_M, "efConstruction": HNSW_EF_CONSTRUCTION}
+        return {}
+
+    def to_milvus(self, metric_type: str = "L2") -> Dict[str, Any]:
+        """Milvus create_index 使用的 index_params"""
+        return {"metric_type": metric_type, "index_type": self.index_type, "params": self.build_params()}
+
+    def faiss_factory(self) -> str:
+        """faiss.index_factory 描述串
+
+        FAISS 的 HNSW 不支持按 id 删除，这里用 HNSW 作为 IVF 的粗量化器代替。
+        """
+        codec = "SQfp16" if self.precision == "float16" else "Flat"
+        if self.index_type == "IVF_FLAT":
+            return f"IVF{self.nlist},{codec}"
+        if self.index_type == "IVF_SQ8":
+            return f"IVF{self.nlist},SQ8"
+        if self.index_type == "IVF_PQ":
+            return f"IVF{self.nlist},PQ{self.m}"
+        if self.index_type == "HNSW":
+            return f"IVF{self.nlist}_HNSW32,{codec}"
+        return codec
+
+    @property
+    def nprobe(self) -> int:
+        return max(1, min(self.nlist, max(16, math.ceil(self.nlist * settings.index.nprobe_ratio))))
+
+    def search_params(self, top_k: int, override: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """按当前实际使用的索引推导检索参数
+
+        override 为按请求的召回档位或延迟预算选出的 nprobe/ef，只采用与该索引相符的项，
+        并限制在有效范围内（nprobe 不超过 nlist，ef 不小于 top_k）。
+        """
+        override = override or {}
+        if self.is_ivf:
+            return {"nprobe": max(1, min(self.nlist, int(override.get("nprobe", self.nprobe))))}
+        if self.index_type == "HNSW":
+            return {"ef": max(int(override.get("ef", settings.index.hnsw_ef)), top_k)}
+        return {}
+
+    @property
+    def train_size(self) -> int:
+        """FAISS 训练 IVF/PQ 使用的样本数"""
+        return max(self.nlist * 64, 256 * 64 if self.index_type == "IVF_PQ" else 0, 10000)
+
+    def needs_rebuild(self, target: "IndexPlan") -> bool:
+        """索引类型或精度变化、nlist 相差一倍以上时重建，避免行数小幅波动引起反复重建"""
+        if self.index_type != target.index_type or self.precision != target.precision:
+            return True
+        if self.nlist and target.nlist:
+            return max(self.nlist, target.nlist) / min(self.nlist, target.nlist) >= 2
+        return False
+
+    @classmethod
+    def from_milvus(cls, index_params: Optional[Dict[str, Any]], precision: str = "float32") -> "IndexPlan":
+        """由 Milvus 集合上已有索引的参数还原方案，precision 为 float16 或 float32，由向量字段类型决定"""
+        if not index_params:
+            return cls(precision=precision)
+        params = index_params.get("params") or {}
+        if isinstance(params, str):
+            params = json.loads(params)
+        return cls(
+            index_type=str(index_params.get("index_type", "FLAT")).upper(),
+            nlist=int(params.get("nlist", 0)),
+            m=int(params.get("m", 0)),
+            precision=precision,
+        )
+
+
+def _pq_m(dim: int, bytes_per_row: float) -> int:
+    """选择能放进内存预算的最大 PQ 子空间数，须整除 dim"""
+    candidates = [m for m in range(1, dim + 1) if dim % m == 0 and m <= max(1, dim // 2)]
+    fitting = [m for m in candidates if m <= bytes_per_row]
+    return max(fitting) if fitting else min(candidates)
+
+
+def choose_index(num_rows: int, dim: int, precision: str = "float32") -> IndexPlan:
+    """按行数、精度和内存预算选择索引：FLAT → IVF_FLAT(nlist≈√N) → HNSW 或 IVF_PQ
+
+    sq8 和 pq 精度在行数超过 FLAT 阈值后分别固定使用 IVF_SQ8 和 IVF_PQ；
+    float16 的 FLAT 仍是精确检索（Milvus）或半精度扁平索引（FAISS）。
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported vector precision: {precision}")
+    policy = settings.index
+    # sq8/pq 只作用于索引，向量本身仍以 float32 保存
+    storage = "float16" if precision == "float16" else "float32"
+    if num_rows <= policy.flat_max_rows:
+        return IndexPlan("FLAT", precision=storage)
+    nlist = int(min(MAX_NLIST, max(MIN_NLIST, round(math.sqrt(num_rows)))))
+    if precision == "sq8":
+        return IndexPlan("IVF_SQ8", nlist=nlist)
+    if precision == "pq":
+        return IndexPlan("IVF_PQ", nlist=nlist, m=_pq_m(dim, settings.vector_store.pq_bytes or dim / 4))
+    raw_bytes = num_rows * dim * (2 if storage == "float16" else 4)
+    if num_rows <= policy.ivf_max_rows and raw_bytes <= policy.memory_budget:
+        return IndexPlan("IVF_FLAT", nlist=nlist, precision=storage)
+    # HNSW 第 0 层每个节点约 2M 个 int32 邻居
+    if raw_bytes + num_rows * HNSW_M * 2 * 4 <= policy.memory_budget:
+        return IndexPlan("HNSW", nlist=nlist, precision=storage)
+    return IndexPlan("IVF_PQ", nlist=nlist, m=_pq_m(dim, policy.memory_budget / num_rows))
+
+
+class IndexMaintainer:
+    """后台索引维护：写入后按间隔检查集合的索引方案，需要时在后台线程重建
+
+    被维护的向量库需要提供 index_key、dim、precision、num_rows()、current_index() 和 rebuild_index(plan)；
+    共用集合的多个知识库 index_key 相同，只调度一次重建。
+    """
+
+    def __init__(self, check_interval: float = 60.0):
+        self.check_interval = check_interval
+        self._last_check: Dict[str, float] = {}
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, store) -> bool:
+        """写入后调用；距上次检查不足 check_interval 或重建进行中时直接返回"""
+        if not settings.index.auto:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if store.index_key in self._running or now - self._last_check.get(store.index_key, -math.inf) < self.check_interval:
+                return False
+            self._last_check[store.index_key] = now
+            self._running.add(store.index_key)
+        threading.Thread(target=self._check, args=(store,), name=f"reindex-{store.index_key}", daemon=True).start()
+        return True
+
+    def _check(self, store):
+        try:
+            num_rows = store.num_rows()
+            current = store.current_index()
+            target = choose_index(num_rows, store.dim, store.precision)
+            if current.needs_rebuild(target):
+                logger.info("Rebuilding index of %s: %s -> %s (%d rows)", store.index_key, current, target, num_rows)
+                started = time.monotonic()
+                store.rebuild_index(target)
+                logger.info("Rebuilt index of %s in %.1fs", store.index_key, time.monotonic() - started)
+        except Exception as e:
+            logger.error("Index maintenance failed for %s: %s", store.index_key, str(e))
+        finally:
+            with self._lock:
+                self._running.discard(store.index_key)
+
+    def is_running(self, key: str) -> bool:
+        with self._lock:
+            return key in self._running
+
+# 全局索引维护实例
+index_maintainer = IndexMaintainer(check_interval=settings.index.check_interval)
+
+
+class IndexLocks:
+    """按 index_key 区分的进程间文件锁
+
+    rebuild 锁保证同一集合同时只有一个进程在重建；write 锁由写入方共享持有，
+    重建在切换前独占持有，期间的写入等待切换完成。flock 锁属于打开的文件，同一进程的不同线程之间同样互斥。
+    重建期间写入方把删除追加到 journal 文件，重建据此在新集合上重放，不必比较两边的全部主键。
+    """
+
+    def __init__(self, lock_dir: str):
+        self.lock_dir = lock_dir
+
+    def _path(self, key: str, kind: str, suffix: str = "lock") -> str:
+        os.makedirs(self.lock_dir, exist_ok=True)
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", key)[:64]
+        return os.path.join(self.lock_dir, f"{safe}_{zlib.crc32(key.encode('utf-8')):08x}.{kind}.{suffix}")
+
+    @contextmanager
+    def rebuild(self, key: str):
+        """非阻塞地获取重建锁，产出是否获取成功"""
+        with open(self._path(key, "rebuild"), "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def writes(self, key: str, exclusive: bool = False):
+        with open(self._path(key, "write"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def start_journal(self, key: str):
+        """开始记录写入方的删除，重建在独占写锁内调用"""
+        open(self._path(key, "journal", "jsonl"), "w").close()
+
+    def end_journal(self, key: str):
+        try:
+            os.remove(self._path(key, "journal", "jsonl"))
+        except FileNotFoundError:
+            pass
+
+    def record(self, key: str, entry: Dict[str, Any]):
+        """重建进行中时追加一条删除记录，写入方在共享写锁内调用
+
+        重建进程异常退出会留下 journal 文件，此时 rebuild 锁空闲，删除该文件而不是一直追加。
+        """
+        path = self._path(key, "journal", "jsonl")
+        if not os.path.exists(path):
+            return
+        with open(self._path(key, "rebuild"), "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass
+            else:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                logger.warning("Removing journal of interrupted index rebuild: %s", path)
+                self.end_journal(key)
+                return
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        try:
+            # O_APPEND 保证多个写入方的记录各自完整地追加在末尾
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            return
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def read_journal(self, key: str, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """读取 offset 之后完整的记录，返回记录和下次读取的位置"""
+        with open(self._path(key, "journal", "jsonl"), "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        return [json.loads(line) for line in data[:end].splitlines() if line], offset + end
+
+# 全局索引文件锁实例
+index_locks = IndexLocks(settings.index.lock_dir)
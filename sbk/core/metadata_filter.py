@@ -0,0 +1,220 @@
+import re
+import json
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+# 过滤操作符及其在 Milvus 表达式中的写法
+OPERATORS = {
+    "eq": "==",
+    "ne": "!=",
+    "gt": ">",
+    "gte": ">=",
+    "lt": "<",
+    "lte": "<=",
+    "in": "in",
+    "nin": "not in",
+}
+SQL_OPERATORS = {"eq": "=", "ne": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "in": "IN", "nin": "NOT IN"}
+# 元数据键的最大长度，键中不允许出现引号、反斜杠和控制字符
+MAX_KEY_LENGTH = 128
+# 可提升为标量字段的元数据类型，以及键缺失或类型不符时写入的默认值
+PROMOTED_TYPES = {"varchar": "", "int64": 0, "double": 0.0, "bool": False}
+# 提升字段在 Milvus 集合中的字段名前缀，避免与 id、doc_id 等固定字段冲突
+PROMOTED_PREFIX = "meta_"
+# 提升字段的键同时用作 Milvus 字段名和 SQLite 索引名，只允许标识符
+PROMOTED_KEY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]{0,63}$")
+VARCHAR_MAX_LENGTH = 512
+
+
+@dataclass(frozen=True)
+class Condition:
+    """单个过滤条件：metadata[key] op value，in/nin 的 value 为元组"""
+    key: str
+    op: str
+    value: Any
+
+
+Filter = Union[Dict[str, Any], List[Condition]]
+
+
+def _check_value(key: str, value: Any) -> Any:
+    if isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float) and math.isfinite(value):
+        return value
+    raise ValueError(f"Unsupported filter value for {key}: {value!r}")
+
+
+def _check_key(key: Any):
+    if (not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH
+            or '"' in key or "\\" in key or not key.isprintable()):
+        raise ValueError(f"Invalid metadata key: {key!r}")
+
+
+def parse_filter(metadata_filter: Optional[Filter]) -> List[Condition]:
+    """解析元数据过滤条件，各键之间为且关系
+
+    每个键的值可以是标量（等于）、列表（属于其中之一），或 {"gte": 3, "lt": 10} 这样的
+    操作符字典，操作符见 OPERATORS。键和值在这里校验，之后只以转义后的字面量或参数拼入表达式。
+    """
+    if not metadata_filter:
+        return []
+    if isinstance(metadata_filter, list):
+        return metadata_filter
+    if not isinstance(metadata_filter, dict):
+        raise ValueError("metadata_filter must be an object")
+    conditions = []
+    for key, spec in metadata_filter.items():
+        _check_key(key)
+        if isinstance(spec, dict):
+            if not spec:
+                raise ValueError(f"Empty filter for {key}")
+            items = spec.items()
+        else:
+            items = [("in" if isinstance(spec, list) else "eq", spec)]
+        for op, value in items:
+            if op not in OPERATORS:
+                raise ValueError(f"Unsupported filter operator for {key}: {op}")
+            if op in ("in", "nin"):
+                if not isinstance(value, list) or not value:
+                    raise ValueError(f"{op} filter on {key} requires a non-empty list")
+                value = tuple(_check_value(key, item) for item in value)
+            else:
+                value = _check_value(key, value)
+            conditions.append(Condition(key, op, value))
+    return conditions
+
+
+def check_promoted(promoted: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """校验提升字段配置 {元数据键: 类型}"""
+    promoted = dict(promoted or {})
+    for key, field_type in promoted.items():
+        if not PROMOTED_KEY_PATTERN.match(key):
+            raise ValueError(f"Promoted metadata key must be an identifier: {key!r}")
+        if field_type not in PROMOTED_TYPES:
+            raise ValueError(f"Unsupported promoted metadata type for {key}: {field_type}")
+    return promoted
+
+
+def _fits(field_type: str, value: Any) -> bool:
+    """值能否直接与该类型的标量字段比较"""
+    if isinstance(value, tuple):
+        return all(_fits(field_type, item) for item in value)
+    if field_type == "bool":
+        return isinstance(value, bool)
+    if isinstance(value, bool):
+        return False
+    if field_type == "varchar":
+        return isinstance(value, str)
+    if field_type == "int64":
+        return isinstance(value, int)
+    return isinstance(value, (int, float))
+
+
+def promoted_value(metadata: Optional[Dict[str, Any]], key: str, field_type: str) -> Any:
+    """写入提升字段的值，键缺失或类型不符时为该类型的默认值"""
+    value = (metadata or {}).get(key)
+    if value is None or not _fits(field_type, value):
+        return PROMOTED_TYPES[field_type]
+    if field_type == "varchar" and len(value) > VARCHAR_MAX_LENGTH:
+        raise ValueError(f"Metadata {key} is longer than {VARCHAR_MAX_LENGTH} characters and cannot be promoted")
+    return float(value) if field_type == "double" else value
+
+
+def holds(condition: Condition, actual: Any) -> bool:
+    """在 Python 中求值单个条件，键缺失时任何条件都不成立（与 Milvus 和 SQLite 一致）"""
+    if actual is None:
+        return False
+    value = condition.value
+    try:
+        if condition.op == "eq":
+            return actual == value
+        if condition.op == "ne":
+            return actual != value
+        if condition.op == "in":
+            return actual in value
+        if condition.op == "nin":
+            return actual not in value
+        if condition.op == "gt":
+            return actual > value
+        if condition.op == "gte":
+            return actual >= value
+        if condition.op == "lt":
+            return actual < value
+        return actual <= value
+    except TypeError:
+        return False
+
+
+def matches(metadata: Optional[Dict[str, Any]], metadata_filter: Optional[Filter]) -> bool:
+    metadata = metadata or {}
+    return all(holds(condition, metadata.get(condition.key)) for condition in parse_filter(metadata_filter))
+
+
+def split_promoted(metadata_filter: Optional[Filter],
+                   promoted: Dict[str, str]) -> Tuple[List[Condition], List[Condition]]:
+    """把条件分为可以直接比较提升字段的和需要检查原始元数据的两部分
+
+    提升字段中缺失的键写入了默认值，条件对默认值也成立时（如 page == 0）无法区分，
+    这类条件同时放入两部分：标量字段用于走索引，原始元数据保证结果准确。
+    """
+    scalar, residual = [], []
+    for condition in parse_filter(metadata_filter):
+        field_type = promoted.get(condition.key)
+        if field_type is None or not _fits(field_type, condition.value):
+            residual.append(condition)
+            continue
+        scalar.append(condition)
+        if holds(condition, PROMOTED_TYPES[field_type]):
+            residual.append(condition)
+    return scalar, residual
+
+
+def milvus_literal(value: Any) -> str:
+    """Milvus 表达式中的字面量，字符串按 JSON 规则转义引号和反斜杠"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (tuple, list)):
+        return "[" + ", ".join(milvus_literal(item) for item in value) + "]"
+    return repr(value)
+
+
+def milvus_expr(conditions: List[Condition], promoted: Optional[Dict[str, str]] = None) -> Optional[str]:
+    """把条件转换为 Milvus 表达式，promoted 中的键比较标量字段，其余比较 metadata JSON 字段"""
+    parts = []
+    for condition in conditions:
+        if promoted and condition.key in promoted:
+            target = PROMOTED_PREFIX + condition.key
+        else:
+            target = f"metadata[{json.dumps(condition.key, ensure_ascii=False)}]"
+        parts.append(f"{target} {OPERATORS[condition.op]} {milvus_literal(condition.value)}")
+    return " && ".join(parts) or None
+
+
+def json_path(key: str, column: str = "metadata") -> str:
+    """SQLite 中读取元数据键的表达式，路径以字面量写入，才能命中同样写法的表达式索引"""
+    path = '$."' + key + '"'
+    return f"json_extract({column}, '{path.replace(chr(39), chr(39) * 2)}')"
+
+
+def sqlite_where(metadata_filter: Optional[Filter], column: str = "metadata") -> Tuple[str, List[Any]]:
+    """把过滤条件转换为 SQLite 条件，值以参数传入"""
+    parts, params = [], []
+    for condition in parse_filter(metadata_filter):
+        target = json_path(condition.key, column)
+        if condition.op in ("in", "nin"):
+            placeholders = ",".join("?" * len(condition.value))
+            parts.append(f"{target} {SQL_OPERATORS[condition.op]} ({placeholders})")
+            params.extend(condition.value)
+        else:
+            parts.append(f"{target} {SQL_OPERATORS[condition.op]} ?")
+            params.append(condition.value)
+    return " AND ".join(parts) or "1", params
+
+
+def sqlite_index(key: str, table: str = "chunks", column: str = "metadata") -> str:
+    """为提升的元数据键建立表达式索引的语句，key 须先经 check_promoted 校验"""
+    return f"CREATE INDEX IF NOT EXISTS idx_{table}_meta_{key} ON {table} ({json_path(key, column)})"
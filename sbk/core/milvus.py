@@ -0,0 +1,117 @@
+import os
+import logging
+import threading
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from pymilvus import connections, utility, Collection
+
+from sbk.config import config as settings
+
+logger = logging.getLogger(__name__)
+
+
+class MilvusConnectionManager:
+    """进程内共享的 Milvus 连接和集合句柄
+
+    每个 Milvus 地址只建立一个连接（gRPC 通道本身支持多线程并发复用），
+    集合句柄和加载状态按集合名缓存，避免每个请求重复 connect、has_collection、
+    describe 和 load。fork 出的工作进程首次使用时会重新建立自己的连接。
+    """
+
+    def __init__(self, timeout: float = 10.0):
+        self.timeout = timeout
+        self._aliases: Dict[Tuple[str, str], str] = {}
+        self._collections: Dict[Tuple[str, str], Collection] = {}
+        self._loaded: Set[Tuple[str, str]] = set()
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # gRPC 通道不能跨进程使用，fork 后丢弃继承来的连接和句柄
+        if self._pid == os.getpid():
+            return
+        logger.debug("Process forked, resetting Milvus connections")
+        for alias in self._aliases.values():
+            try:
+                connections.remove_connection(alias)
+            except Exception:
+                pass
+        self._aliases.clear()
+        self._collections.clear()
+        self._loaded.clear()
+        self._pid = os.getpid()
+
+    def connect(self, host: Optional[str] = None, port: Optional[str] = None) -> str:
+        """获取指定地址的连接别名，首次调用时建立连接"""
+        endpoint = (host or settings.milvus.host, str(port or settings.milvus.port))
+        with self._lock:
+            self._check_fork()
+            alias = self._aliases.get(endpoint)
+            if alias is None:
+                alias = f"sbk-{endpoint[0]}:{endpoint[1]}"
+                connections.connect(alias=alias, host=endpoint[0], port=endpoint[1], timeout=self.timeout)
+                logger.debug("Connected to Milvus server at %s:%s", *endpoint)
+                self._aliases[endpoint] = alias
+            return alias
+
+    def get_collection(self,
+                       alias: str,
+                       name: str,
+                       create_fn: Optional[Callable[[str], Collection]] = None) -> Collection:
+        """获取缓存的集合句柄，集合不存在时调用 create_fn(alias) 创建"""
+        key = (alias, name)
+        with self._lock:
+            self._check_fork()
+            collection = self._collections.get(key)
+            if collection is not None:
+                return collection
+            if not utility.has_collection(name, using=alias):
+                if create_fn is None:
+                    raise ValueError(f"Collection {name} does not exist")
+                collection = create_fn(alias)
+            else:
+                collection = Collection(name, using=alias)
+            self._collections[key] = collection
+            return collection
+
+    def ensure_loaded(self, alias: str, collection: Collection):
+        """集合只在本进程第一次检索前加载一次
+
+        重建索引时新集合在切换别名前已经加载，别名切换后这里记录的状态仍然有效。
+        """
+        key = (alias, collection.name)
+        if key in self._loaded:
+            return
+        with self._lock:
+            if key not in self._loaded:
+                collection.load()
+                self._loaded.add(key)
+
+    def invalidate(self, alias: str, name: str):
+        """集合被删除或重建后丢弃缓存的句柄和加载状态"""
+        with self._lock:
+            self._collections.pop((alias, name), None)
+            self._loaded.discard((alias, name))
+
+    def close(self):
+        """断开所有连接"""
+        with self._lock:
+            for alias in self._aliases.values():
+                try:
+                    connections.disconnect(alias)
+                except Exception as e:
+                    logger.error("Error during disconnection: %s", str(e))
+            self._aliases.clear()
+            self._collections.clear()
+            self._loaded.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "connections": len(self._aliases),
+                "collections": len(self._collections),
+                "loaded": len(self._loaded),
+            }
+
+# 全局 Milvus 连接管理器实例
+milvus_connections = MilvusConnectionManager(timeout=settings.milvus.timeout)
@@ -0,0 +1,92 @@
+import re
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sbk.config import config as settings
+
+# 分区方式
+PARTITION_BY = ("doc_hash", "metadata", "ingest_date")
+GRANULARITIES = {"day": "%Y%m%d", "month": "%Y%m"}
+# Milvus 集合自带的分区，按元数据分区时缺少该键的行写入这里
+DEFAULT_PARTITION = "_default"
+# 分区名只能包含字母、数字和下划线
+_UNSAFE_CHARS = re.compile(r"[^A-Za-z0-9_]")
+MAX_VALUE_LENGTH = 64
+
+
+@dataclass(frozen=True)
+class Partitioner:
+    """把写入的行分配到 Milvus 分区，并把检索、删除请求中的分区取值换算为分区名
+
+    doc_hash 按 crc32(doc_id) % buckets 分桶，同一文档总在同一分区，删除文档只扫描一个分区；
+    metadata 按元数据 key 的取值（如租户）分区；ingest_date 按写入时的 UTC 日期分区，
+    粒度为 day 或 month。分区方式在集合写入数据后不能更改。
+    """
+    by: str
+    key: str = ""
+    buckets: int = 16
+    granularity: str = "month"
+
+    def __post_init__(self):
+        if self.by not in PARTITION_BY:
+            raise ValueError(f"Unsupported partitioning: {self.by}")
+        if self.by == "metadata" and not self.key:
+            raise ValueError("Partitioning by metadata requires partition_key")
+        if self.buckets < 1:
+            raise ValueError("partition_buckets must be positive")
+        if self.granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported partition granularity: {self.granularity}")
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> Optional["Partitioner"]:
+        """由知识库的 vector_store 配置构造，未开启分区时返回 None"""
+        config = config or {}
+        by = config.get("partition_by")
+        if not by:
+            return None
+        return cls(
+            by=by,
+            key=config.get("partition_key") or "",
+            buckets=int(config.get("partition_buckets") or settings.vector_store.partition_buckets),
+            granularity=(config.get("partition_granularity") or settings.vector_store.partition_granularity).lower(),
+        )
+
+    def partition_of(self, doc_id: str, metadata: Optional[Dict[str, Any]], now: Optional[float] = None) -> str:
+        """写入行所在的分区"""
+        if self.by == "doc_hash":
+            return self._bucket(doc_id)
+        if self.by == "metadata":
+            value = (metadata or {}).get(self.key)
+            return DEFAULT_PARTITION if value is None else self._value(value)
+        return "p_date_" + time.strftime(GRANULARITIES[self.granularity], time.gmtime(now))
+
+    def partition_for(self, value: str) -> str:
+        """请求中的分区取值对应的分区名
+
+        doc_hash 的取值为 doc_id，metadata 为该键的取值，ingest_date 为 YYYY-MM-DD 或 YYYY-MM
+        （按月分区时日期中的日被忽略）。
+        """
+        if self.by == "doc_hash":
+            return self._bucket(value)
+        if self.by == "metadata":
+            return self._value(value)
+        digits = str(value).replace("-", "")
+        length = 8 if self.granularity == "day" else 6
+        if not digits.isdigit() or len(digits) not in (6, 8) or len(digits) < length:
+            raise ValueError(f"Invalid ingest date for {self.granularity} partitions: {value}")
+        return "p_date_" + digits[:length]
+
+    def _bucket(self, doc_id: str) -> str:
+        # crc32 在各进程中一致，内置 hash 对字符串加了随机盐
+        return f"p_hash_{zlib.crc32(str(doc_id).encode('utf-8')) % self.buckets}"
+
+    @staticmethod
+    def _value(value: Any) -> str:
+        """取值中不能出现在分区名里的字符替换为下划线，替换或截断过时追加 crc32 以免冲突"""
+        text = str(value)
+        safe = _UNSAFE_CHARS.sub("_", text)[:MAX_VALUE_LENGTH]
+        if safe != text:
+            safe = f"{safe}_{zlib.crc32(text.encode('utf-8')):08x}"
+        return f"p_val_{safe}"
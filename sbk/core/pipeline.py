@@ -0,0 +1,82 @@
+import queue
+import logging
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 队列结束标记
+_DONE = object()
+
+
+class _Failure:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def batched(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """把可迭代对象按 size 切成列表批次"""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch(items: Iterable[T], maxsize: int = 2, name: str = "pipeline-stage") -> Iterator[T]:
+    """在后台线程中迭代 items，通过有界队列把结果交给调用方
+
+    多个 prefetch 串联即构成各阶段并行执行的流水线；队列满时上游阻塞，
+    内存占用与队列长度成正比而与输入总量无关。上游异常会在调用方重新抛出，
+    调用方提前停止迭代时上游也会停止并关闭生成器。
+    """
+    buffer: "queue.Queue" = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    break
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logger.error("Error closing %s source: %s", name, str(e))
+
+    worker = threading.Thread(target=run, daemon=True, name=name)
+    worker.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        worker.join()
@@ -1,12 +1,18 @@
-from typing import Dict, Any, Optional
-import asyncio
-from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+import time
+import uuid
+from functools import partial
+from datetime import datetime, timedelta
 import logging
 from queue import Queue
-from threading import Thread
+from threading import Thread, Lock, Event
 from concurrent.futures import ThreadPoolExecutor
 import traceback
 
+from sbk.config import config as settings
+from sbk.core.database import SessionLocal
+from sbk.models.task import TaskRecord
+
 logger = logging.getLogger(__name__)
 
 class TaskStatus:
@@ -21,30 +27,82 @@ class Task:
         self.task_type = task_type
         self.params = params
         self.status = TaskStatus.PENDING
+        self.stage: Optional[str] = None
+        self.progress: Dict[str, Any] = {}
         self.result: Optional[Any] = None
         self.error: Optional[str] = None
         self.created_at = datetime.now()
         self.started_at: Optional[datetime] = None
         self.completed_at: Optional[datetime] = None
+        self._lock = Lock()
+        self._saved_at = 0.0
+
+    def update_progress(self, stage: str, **counts) -> bool:
+        """记录当前阶段及该阶段的计数，供任务执行函数回调；返回阶段是否发生变化"""
+        with self._lock:
+            changed = stage != self.stage
+            self.stage = stage
+            self.progress.update(counts)
+            return changed
+
+    def snapshot_progress(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.progress)
+
+    def to_record(self) -> Dict[str, Any]:
+        """需要写入数据库的任务状态"""
+        return {
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.snapshot_progress(),
+            "result": self.result,
+            "error": self.error,
+            "started_at": self.started_at,
+            "completed_at": self.completed_at,
+        }
 
 class TaskManager:
-    def __init__(self, max_workers: int = 4):
+    """后台任务管理器
+
+    任务状态保存在数据库的 tasks 表中，处理请求的任何工作进程都能查询；
+    内存中只保留本进程尚未结束的任务。已结束超过 retention 秒的任务在提交新任务时清理。
+
+    进程每隔 orphan_timeout / 3 秒为自己的未结束任务写入心跳；启动时和每次心跳时，
+    超过 orphan_timeout 秒没有心跳的 pending/running 任务被标记为 failed，
+    避免进程退出后任务永远停留在执行中。
+    """
+
+    def __init__(self,
+                 max_workers: int = 4,
+                 retention: float = 86400.0,
+                 progress_interval: float = 1.0,
+                 orphan_timeout: float = 300.0,
+                 session_factory: Callable = SessionLocal):
         self.task_queue = Queue()
+        # 本进程中排队或执行中的任务，结束后移除
         self.tasks: Dict[str, Task] = {}
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._tasks_lock = Lock()
+        self.retention = retention
+        self.progress_interval = progress_interval
+        self.orphan_timeout = orphan_timeout
+        self.session_factory = session_factory
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sbk-task")
         self.running = True
+        self._stopped = Event()
         self._start_worker_thread()
+        self._start_heartbeat_thread()
 
     def _start_worker_thread(self):
+        # 调度线程只负责把任务交给线程池，任务之间并行执行
         def worker():
             while self.running:
                 try:
                     task = self.task_queue.get()
                     if task is None:
                         break
-                    self._process_task(task)
+                    self.executor.submit(self._process_task, task)
                 except Exception as e:
-                    logger.error(f"Error processing task: {e}")
+                    logger.error(f"Error dispatching task: {e}")
                     logger.error(traceback.format_exc())
                 finally:
                     self.task_queue.task_done()
@@ -52,19 +110,119 @@ class TaskManager:
         self.worker_thread = Thread(target=worker, daemon=True)
         self.worker_thread.start()
 
+    def _start_heartbeat_thread(self):
+        self.heartbeat_thread = None
+        if self.orphan_timeout <= 0:
+            return
+
+        def heartbeat():
+            # 启动时先处理上次退出时遗留的任务，不阻塞进程启动
+            self._reconcile()
+            while not self._stopped.wait(self.orphan_timeout / 3):
+                self._heartbeat()
+                self._reconcile()
+
+        self.heartbeat_thread = Thread(target=heartbeat, daemon=True, name="sbk-task-heartbeat")
+        self.heartbeat_thread.start()
+
+    def _heartbeat(self):
+        """刷新本进程中排队或执行中任务的心跳时间"""
+        with self._tasks_lock:
+            task_ids = list(self.tasks)
+        if not task_ids:
+            return
+        db = self.session_factory()
+        try:
+            db.query(TaskRecord).filter(TaskRecord.task_id.in_(task_ids)).update(
+                {"heartbeat_at": datetime.now()}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to record task heartbeat: {e}")
+        finally:
+            db.close()
+
+    def _reconcile(self) -> int:
+        """把超过 orphan_timeout 没有心跳的未结束任务标记为失败，返回标记的任务数"""
+        now = datetime.now()
+        cutoff = now - timedelta(seconds=self.orphan_timeout)
+        db = self.session_factory()
+        try:
+            count = db.query(TaskRecord).filter(
+                TaskRecord.status.in_([TaskStatus.PENDING, TaskStatus.RUNNING]),
+                TaskRecord.heartbeat_at < cutoff,
+            ).update({
+                "status": TaskStatus.FAILED,
+                "error": "Task was interrupted: the worker process running it stopped",
+                "completed_at": now,
+            }, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to reconcile orphaned tasks: {e}")
+            return 0
+        finally:
+            db.close()
+        if count:
+            logger.warning(f"Marked {count} orphaned tasks as failed")
+        return count
+
+    def _save(self, task: Task):
+        """把任务状态写入数据库，写入失败只记录日志，不影响任务执行"""
+        db = self.session_factory()
+        try:
+            db.query(TaskRecord).filter(TaskRecord.task_id == task.task_id).update(
+                {**task.to_record(), "heartbeat_at": datetime.now()})
+            db.commit()
+            task._saved_at = time.monotonic()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to save state of task {task.task_id}: {e}")
+        finally:
+            db.close()
+
+    def _report_progress(self, task: Task, stage: str, **counts):
+        """任务执行函数的进度回调：阶段变化时立即写入，计数按 progress_interval 节流写入"""
+        changed = task.update_progress(stage, **counts)
+        if changed or time.monotonic() - task._saved_at >= self.progress_interval:
+            self._save(task)
+
+    def _prune(self):
+        """删除结束时间早于保留期的任务"""
+        if self.retention <= 0:
+            return
+        cutoff = datetime.now() - timedelta(seconds=self.retention)
+        db = self.session_factory()
+        try:
+            db.query(TaskRecord).filter(TaskRecord.completed_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Failed to prune finished tasks: {e}")
+        finally:
+            db.close()
+
     def _process_task(self, task: Task):
         task.status = TaskStatus.RUNNING
         task.started_at = datetime.now()
+        self._save(task)
+        progress = partial(self._report_progress, task)
 
         try:
             if task.task_type == "process_document":
-                from services.document_service import DocumentService
-                doc_service = DocumentService()
-                result = doc_service.process_document(**task.params)
+                from sbk.services.document_service import DocumentService
+                params = dict(task.params)
+                doc_service = DocumentService(
+                    params.pop("kb_id"),
+                    params.pop("document_store_path"),
+                    params.pop("vector_store_path"),
+                    params.pop("config"),
+                )
+                result = doc_service.ingest(**params, progress=progress)
                 task.result = result
                 task.status = TaskStatus.COMPLETED
             elif task.task_type == "update_embeddings":
-                from services.vector_service import VectorService
+                from sbk.services.vector_service import VectorService
                 vector_service = VectorService()
                 result = vector_service.update_embeddings(**task.params)
                 task.result = result
@@ -80,34 +238,69 @@ class TaskManager:
 
         finally:
             task.completed_at = datetime.now()
+            self._save(task)
+            with self._tasks_lock:
+                self.tasks.pop(task.task_id, None)
 
     def submit_task(self, task_type: str, params: Dict[str, Any]) -> str:
-        """提交一个新任务到队列"""
-        task_id = f"{task_type}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        """提交一个新任务到队列，任务状态先写入数据库"""
+        self._prune()
+        task_id = f"{task_type}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
         task = Task(task_id, task_type, params)
-        self.tasks[task_id] = task
+        db = self.session_factory()
+        try:
+            db.add(TaskRecord(task_id=task_id, task_type=task_type, created_at=task.created_at,
+                              heartbeat_at=task.created_at, **task.to_record()))
+            db.commit()
+        finally:
+            db.close()
+        with self._tasks_lock:
+            self.tasks[task_id] = task
         self.task_queue.put(task)
         return task_id
 
     def get_task_status(self, task_id: str) -> Dict[str, Any]:
-        """获取任务状态"""
-        task = self.tasks.get(task_id)
-        if not task:
+        """获取任务状态，任务可以由任何工作进程提交和执行"""
+        db = self.session_factory()
+        try:
+            record = db.query(TaskRecord).filter(TaskRecord.task_id == task_id).first()
+        finally:
+            db.close()
+        if not record:
             return {"error": "Task not found"}
 
+        with self._tasks_lock:
+            task = self.tasks.get(task_id)
+        # 本进程执行中的任务直接读取内存中的进度，比节流写入的数据库更新
+        progress = task.snapshot_progress() if task else (record.progress or {})
+        stage = task.stage if task else record.stage
         return {
-            "task_id": task.task_id,
-            "status": task.status,
-            "result": task.result,
-            "error": task.error,
-            "created_at": task.created_at.isoformat(),
-            "started_at": task.started_at.isoformat() if task.started_at else None,
-            "completed_at": task.completed_at.isoformat() if task.completed_at else None
+            "task_id": record.task_id,
+            "task_type": record.task_type,
+            "status": record.status,
+            "stage": stage,
+            "progress": progress,
+            "result": record.result,
+            "error": record.error,
+            "created_at": record.created_at.isoformat(),
+            "started_at": record.started_at.isoformat() if record.started_at else None,
+            "completed_at": record.completed_at.isoformat() if record.completed_at else None
         }
 
     def shutdown(self):
         """关闭任务管理器"""
         self.running = False
+        self._stopped.set()
         self.task_queue.put(None)  # 发送终止信号
         self.worker_thread.join()
-        self.executor.shutdown() 
\ No newline at end of file
+        if self.heartbeat_thread is not None:
+            self.heartbeat_thread.join()
+        self.executor.shutdown()
+
+# 全局任务管理器实例
+task_manager = TaskManager(
+    max_workers=settings.tasks.max_workers,
+    retention=settings.tasks.retention,
+    progress_interval=settings.tasks.progress_interval,
+    orphan_timeout=settings.tasks.orphan_timeout,
+)
@@ -0,0 +1,39 @@
+import re
+import unicodedata
+from typing import List
+
+# 连续的中日韩字符
+_CJK_RANGES = (
+    "\u3040-\u30ff"  # 平假名、片假名
+    "\u3400-\u4dbf"  # CJK 扩展 A
+    "\u4e00-\u9fff"  # CJK 统一汉字
+    "\uac00-\ud7af"  # 韩文音节
+    "\uf900-\ufaff"  # CJK 兼容汉字
+)
+_TOKEN_PATTERN = re.compile(rf"[{_CJK_RANGES}]+|[^\W_{_CJK_RANGES}]+(?:['.][^\W_{_CJK_RANGES}]+)*")
+_CJK_PATTERN = re.compile(rf"[{_CJK_RANGES}]")
+
+# 常见英文停用词，只在检索时影响极小的高频词
+ENGLISH_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词
+
+    文本先做 NFKC 规范化并转小写；拉丁字母和数字按单词切分并去掉常见停用词，
+    中日韩字符按相邻二元组切分（单字时保留单字），无需额外的分词词典。
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens: List[str] = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if _CJK_PATTERN.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        elif token not in ENGLISH_STOPWORDS:
+            tokens.append(token)
+    return tokens
@@ -0,0 +1,145 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from sbk.core.index_policy import IndexPlan
+from sbk.core.partitioning import Partitioner
+
+# 可以按需读取的 chunk 字段，id 和 score 总是返回
+PAYLOAD_FIELDS = ("doc_id", "metadata", "content")
+
+
+def payload_fields(fields: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+    """规范化字段投影，None 表示全部字段，未知字段忽略"""
+    if fields is None:
+        return PAYLOAD_FIELDS
+    fields = set(fields)
+    return tuple(name for name in PAYLOAD_FIELDS if name in fields)
+
+
+def rerank_hits(query: np.ndarray, hits: List[Dict[str, Any]], vectors: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+    """用全精度向量重新计算候选的 L2 距离（平方），按新距离排序后截取 top_k"""
+    if not hits:
+        return hits
+    distances = ((np.asarray(vectors, dtype=np.float32) - query[None, :]) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:top_k]
+    return [{**hits[i], "score": float(distances[i])} for i in order]
+
+
+class BaseVectorStore(ABC):
+    """向量库后端基类
+
+    写入的行为 (doc_id, content, metadata, embedding) 元组；检索命中为包含
+    score、doc_id、metadata、content 和 id 的字典，score 为 L2 距离，越小越相似。
+    """
+
+    # 写缓冲和 BM25 索引绑定使用的唯一标识
+    key: str
+    # 向量维度，尚未写入数据时可能未知
+    dim: Optional[int]
+    # 向量存储精度：float32、float16、sq8 或 pq，决定 choose_index 选择的索引
+    precision: str = "float32"
+    # 有损索引的候选倍数，大于 1 时用全精度向量重排候选
+    rerank_factor: int = 0
+    # 分区方式，None 表示不分区
+    partitioner: Optional[Partitioner] = None
+
+    @abstractmethod
+    def insert(self, rows: List[tuple]) -> List[int]:
+        """写入一批行，返回与行顺序一致的主键"""
+        pass
+
+    @abstractmethod
+    def search(self,
+               embeddings: np.ndarray,
+               top_ks: List[int],
+               metadata_filter: Optional[Dict[str, Any]] = None,
+               read_your_writes: bool = False,
+               search_params: Optional[Dict[str, Any]] = None,
+               fields: Optional[Sequence[str]] = None,
+               partitions: Optional[Sequence[str]] = None,
+               consistency_level: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """批量检索，embeddings 形状为 (查询数, dim)，每个查询返回各自 top_k 个命中
+
+        metadata_filter 的写法见 metadata_filter.parse_filter，在向量检索之前生效，不满足条件的行不参与排名。
+        partitions 为分区取值（见 Partitioner.partition_for），指定时只检索这些分区，未分区的向量库不支持。
+
+        search_params 覆盖按索引推导的 nprobe/ef，键名与 search_knob 一致。
+        fields 为命中需要携带的 chunk 字段（见 PAYLOAD_FIELDS），None 表示全部，只读取需要的字段；
+        其余字段之后可以用 fetch 读取。consistency_level 为后端的一致性级别（如 Milvus 的 Strong），
+        优先于 read_your_writes，不支持的后端忽略。
+        """
+        pass
+
+    @abstractmethod
+    def fetch(self, ids: Iterable[int], fields: Optional[Sequence[str]] = None) -> Dict[int, Dict[str, Any]]:
+        """按主键批量读取 chunk，结果包含 id 和 fields 中的字段，已删除的行不出现在结果中"""
+        pass
+
+    @abstractmethod
+    def match_ids(self, metadata_filter: Optional[Dict[str, Any]],
+                  partitions: Optional[Sequence[str]] = None) -> np.ndarray:
+        """满足元数据过滤条件（且位于 partitions 中）的全部主键，用于 BM25 等其他检索路径的预过滤"""
+        pass
+
+    def drop_partition(self, value: str) -> np.ndarray:
+        """删除取值对应的整个分区，返回被删除行的主键"""
+        raise ValueError(f"{type(self).__name__} does not support partitions")
+
+    @property
+    def index_key(self) -> str:
+        """向量索引的唯一标识，index_maintainer 按它调度重建；多个知识库共用集合时它们的 index_key 相同"""
+        return self.key
+
+    @abstractmethod
+    def drop(self) -> int:
+        """删除本知识库的全部数据，返回删除行数"""
+        pass
+
+    def search_knob(self, plan: IndexPlan) -> Optional[str]:
+        """该索引上调节召回和延迟的检索参数名，FLAT 为精确检索，没有可调参数"""
+        if plan.is_ivf:
+            return "nprobe"
+        if plan.index_type == "HNSW":
+            return "ef"
+        return None
+
+    @abstractmethod
+    def iter_embeddings(self, batch_size: int = 10000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """按批遍历全部行的 (id 数组, 向量矩阵)，用于离线校准的精确检索"""
+        pass
+
+    @abstractmethod
+    def delete_by_ids(self, ids: Iterable[int]) -> int:
+        """按主键删除，返回删除行数"""
+        pass
+
+    @abstractmethod
+    def delete_by_doc_id(self, doc_id: str) -> int:
+        """删除某个文档的全部行，返回删除行数"""
+        pass
+
+    @abstractmethod
+    def delete_by_metadata(self, metadata_filter: Dict[str, Any]) -> int:
+        """删除满足元数据过滤条件的行，返回删除行数"""
+        pass
+
+    @abstractmethod
+    def num_rows(self) -> int:
+        """当前行数，用于选择索引方案，可以是近似值"""
+        pass
+
+    @abstractmethod
+    def current_index(self) -> IndexPlan:
+        """当前实际使用的向量索引方案"""
+        pass
+
+    @abstractmethod
+    def rebuild_index(self, plan: IndexPlan):
+        """按新方案重建向量索引，由后台线程调用"""
+        pass
+
+    def close(self):
+        """释放后端占用的资源"""
+        pass
@@ -0,0 +1,134 @@
+from typing import Any, Callable, Dict, Optional
+
+from sbk.config import config as settings
+from sbk.core.exceptions import VectorStoreError
+from sbk.core.index_policy import PRECISIONS
+from sbk.core.chunk_store import chunk_stores
+from sbk.core.metadata_filter import check_promoted
+from sbk.core.partitioning import Partitioner
+from sbk.core.vector_stores.base import BaseVectorStore
+from sbk.core.vector_stores.milvus import MilvusVectorStore
+from sbk.core.vector_stores.faiss_store import faiss_stores
+
+# Milvus 集合的组织方式
+COLLECTION_LAYOUTS = ("per_kb", "shared")
+# 未指定向量维度时 Milvus 建集合使用的维度
+DEFAULT_DIM = 1024
+
+
+class VectorStoreFactory:
+    """向量库后端工厂类"""
+
+    @staticmethod
+    def layout(config: Optional[Dict[str, Any]] = None) -> str:
+        """知识库实际使用的集合组织方式
+
+        只有未分区、未提升元数据的 Milvus 知识库才能共用集合，其余知识库始终独占集合。
+        """
+        config = config or {}
+        layout = (config.get("layout") or settings.vector_store.collection_layout).lower()
+        if layout not in COLLECTION_LAYOUTS:
+            raise ValueError(f"Unsupported collection layout: {layout}")
+        store_type = (config.get("type") or settings.vector_store.type).lower()
+        if store_type != "milvus" or config.get("partition_by") or config.get("promoted_metadata"):
+            return "per_kb"
+        return layout
+
+    @staticmethod
+    def pin_layout(config: Optional[Dict[str, Any]], dim_fn: Callable[[], int]) -> Dict[str, Any]:
+        """创建知识库时确定集合的组织方式，返回写入知识库配置的 vector_store 配置
+
+        之后修改 KBS_COLLECTION_LAYOUT 等配置不影响已有知识库。共享集合模式下同时确定集合名称、维度、
+        精度和正文存放方式：精度决定向量字段类型和索引，正文存放方式决定 schema，二者不同的知识库不能共用集合。
+        dim_fn 返回知识库 embedding 的向量维度，只在共享集合模式下调用。
+        """
+        config = dict(config or {})
+        config["layout"] = VectorStoreFactory.layout(config)
+        if config["layout"] == "shared":
+            dim = int(dim_fn())
+            precision = (config.get("precision") or settings.vector_store.precision).lower()
+            chunk_store = (config.get("chunk_store") or settings.vector_store.chunk_store).lower()
+            name = f"{settings.vector_store.shared_collection_prefix}_{dim}_{precision}"
+            if chunk_store == "external":
+                name += "_ext"
+            config.update(collection=name, dim=dim, precision=precision, chunk_store=chunk_store)
+        return config
+
+    @staticmethod
+    def create(config: Optional[Dict[str, Any]] = None,
+               collection_name: str = "document_segments",
+               dim: Optional[int] = None,
+               vector_store_path: Optional[str] = None,
+               host: Optional[str] = None,
+               port: Optional[str] = None,
+               index_params: Optional[dict] = None,
+               kb_id: Optional[int] = None) -> BaseVectorStore:
+        """
+        获取向量库后端实例
+
+        Args:
+            config: 知识库的 vector_store 配置，type 支持 "milvus" 和 "faiss"，未指定时取 KBS_VECTOR_STORE；
+                precision 和 rerank_factor 未指定时取 KBS_VECTOR_PRECISION 和 KBS_VECTOR_RERANK_FACTOR，
+                chunk_store 未指定时取 KBS_CHUNK_STORE（只对 Milvus 生效）；promoted_metadata 为需要提升为
+                标量字段并建立索引的元数据键及其类型；partition_by 等分区配置只对 Milvus 生效；
+                layout 为 shared 时写入维度、精度和正文存放方式相同的知识库共用的集合，未指定时取 KBS_COLLECTION_LAYOUT，
+                所用集合的名称 collection 和维度 dim 由 pin_layout 在创建知识库时写入配置
+            collection_name: Milvus 集合名称，共享集合模式下不使用
+            dim: 向量维度，Milvus 建集合时使用，未指定时为 DEFAULT_DIM，共享集合模式下以配置中的 dim 为准；
+                FAISS 按首次写入的向量确定
+            vector_store_path: 知识库的向量库目录，FAISS 的索引和内容保存在其下
+            kb_id: 知识库 ID，共享集合模式下用于限定读写范围
+        """
+        config = config or {}
+        store_type = (config.get("type") or settings.vector_store.type).lower()
+        precision = (config.get("precision") or settings.vector_store.precision).lower()
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unsupported vector precision: {precision}")
+        rerank_factor = config.get("rerank_factor")
+        if rerank_factor is None:
+            rerank_factor = settings.vector_store.rerank_factor
+        promoted_metadata = config.get("promoted_metadata")
+        if promoted_metadata is not None:
+            promoted_metadata = check_promoted(promoted_metadata)
+        partitioner = Partitioner.from_config(config)
+
+        if store_type == "milvus":
+            chunk_store = None
+            if (config.get("chunk_store") or settings.vector_store.chunk_store).lower() == "external":
+                if not vector_store_path:
+                    raise ValueError("External chunk store requires vector_store_path")
+                chunk_store = chunk_stores.get(vector_store_path)
+            shared_kb_id = None
+            if VectorStoreFactory.layout(config) == "shared":
+                if kb_id is None:
+                    raise ValueError("Shared collection layout requires kb_id")
+                collection_name = config.get("collection")
+                if not collection_name or not config.get("dim"):
+                    raise ValueError("Shared collection layout requires the collection pinned by pin_layout")
+                if dim is not None and dim != config["dim"]:
+                    raise VectorStoreError(f"Vector dimension {dim} does not match dimension {config['dim']} "
+                                           f"of shared collection {collection_name}")
+                dim = config["dim"]
+                shared_kb_id = kb_id
+            return MilvusVectorStore(
+                collection_name=collection_name,
+                dim=dim or DEFAULT_DIM,
+                host=host,
+                port=port,
+                index_params=index_params,
+                precision=precision,
+                rerank_factor=rerank_factor,
+                chunk_store=chunk_store,
+                promoted_metadata=promoted_metadata,
+                partitioner=partitioner,
+                kb_id=shared_kb_id,
+            )
+        elif store_type == "faiss":
+            if not vector_store_path:
+                raise ValueError("FAISS vector store requires vector_store_path")
+            if partitioner is not None:
+                raise ValueError("Partitioning requires the Milvus vector store")
+            return faiss_stores.get(vector_store_path, precision=precision, rerank_factor=rerank_factor,
+                                    promoted_metadata=promoted_metadata)
+        else:
+            raise ValueError(f"Unsupported vector store type: {store_type}")
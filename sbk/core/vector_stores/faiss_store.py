@@ -0,0 +1,616 @@
+import os
+import re
+import json
+import fcntl
+import shutil
+import sqlite3
+import logging
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from sbk.config import config as settings
+from sbk.core.index_policy import IndexPlan, choose_index, index_maintainer
+from sbk.core.metadata_filter import Filter, sqlite_index, sqlite_where
+from sbk.core.vector_stores.base import BaseVectorStore, payload_fields, rerank_hits
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = "chunks.sqlite"
+LOCK_FILE = ".lock"
+# 快照文件名记录其包含的最大行 id、已经合并的墓碑序号、写出时间和索引种类（flat/ivf）
+SNAPSHOT_PATTERN = re.compile(r"^index-(\d+)-(\d+)-(\d+)-(flat|ivf)\.faiss$")
+# SQLite 单条语句的参数个数上限较低，按批查询
+SQL_BATCH = 500
+# 重建索引时每批读取的行数
+REBUILD_BATCH = 50000
+# 元数据过滤后的行数不超过该值时不检索索引，直接在这些行的原始向量上精确计算
+EXACT_SEARCH_MAX_ROWS = 4096
+
+
+def _decode(rows: List[tuple], dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """把 (id, embedding) 行转换为 id 数组和向量矩阵"""
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    vectors = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32).reshape(len(rows), dim)
+    return ids, vectors
+
+
+def _plan_of(index) -> IndexPlan:
+    """由 FAISS 索引对象还原索引方案"""
+    ivf = faiss.try_extract_index_ivf(index) if index is not None else None
+    if ivf is None:
+        # 扁平索引由 IndexIDMap2 包装，半精度时内部为 SQfp16 编码
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+        if isinstance(inner, faiss.IndexScalarQuantizer) and inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16:
+            return IndexPlan("FLAT", precision="float16")
+        return IndexPlan("FLAT")
+    ivf = faiss.downcast_index(ivf)
+    if isinstance(ivf, faiss.IndexIVFPQ):
+        return IndexPlan("IVF_PQ", nlist=ivf.nlist, m=ivf.pq.M)
+    precision = "float32"
+    if isinstance(ivf, faiss.IndexIVFScalarQuantizer):
+        if ivf.sq.qtype == faiss.ScalarQuantizer.QT_8bit:
+            return IndexPlan("IVF_SQ8", nlist=ivf.nlist)
+        precision = "float16"
+    if isinstance(faiss.downcast_index(ivf.quantizer), faiss.IndexHNSW):
+        return IndexPlan("HNSW", nlist=ivf.nlist, precision=precision)
+    return IndexPlan("IVF_FLAT", nlist=ivf.nlist, precision=precision)
+
+
+class FaissVectorStore(BaseVectorStore):
+    """进程内的 FAISS 向量库，索引和 chunk 内容都保存在知识库目录下
+
+    chunk 的内容、元数据和原始向量保存在 SQLite 中，是唯一的数据来源；
+    index-*.faiss 是截至某个行 id 的索引快照（FLAT 或按行数选择的 IVF 系列），以只读 mmap
+    方式加载，之后写入的行放在内存中的扁平增量索引里，删除记为墓碑并在检索时用 IDSelector 排除。
+    增量或墓碑达到 checkpoint_rows 时合并写出新快照，行数跨过阈值时由 index_maintainer
+    在后台按新方案重建快照。多个进程共享同一目录，每次检索前按 SQLite 中的新行和墓碑追平，
+    快照变化时重新加载。
+
+    precision 只影响快照索引的编码（SQfp16、SQ8 或 PQ），SQLite 中始终保存 float32 原始向量，
+    用于重建和重排。
+
+    元数据过滤在检索前进行：先在 SQLite 中得到满足条件的 id（提升的元数据键有表达式索引），
+    行数较少时直接精确计算，否则作为 IDSelector 交给索引。
+    """
+
+    def __init__(self, path: str, use_mmap: bool = True, checkpoint_rows: int = 10000,
+                 precision: str = "float32", rerank_factor: int = 0):
+        self.path = path
+        self.use_mmap = use_mmap
+        self.checkpoint_rows = checkpoint_rows
+        self.precision = precision
+        self.rerank_factor = rerank_factor
+        self.promoted_metadata: Dict[str, str] = {}
+        self.key = f"faiss:{path}"
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._open()
+
+    def _open(self):
+        self._pid = os.getpid()
+        self._db = sqlite3.connect(os.path.join(self.path, DB_FILE), check_same_thread=False,
+                                   isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, "
+            "content TEXT NOT NULL, metadata TEXT NOT NULL, embedding BLOB NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks (doc_id)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS tombstones (seq INTEGER PRIMARY KEY AUTOINCREMENT, id INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+        self._dim: Optional[int] = int(row[0]) if row else None
+        self._base = None
+        self._base_plan = IndexPlan("FLAT")
+        self._base_name: Optional[str] = None
+        self._base_last_id = 0
+        self._delta = None
+        self._delta_last_id = 0
+        self._deleted = np.empty(0, dtype=np.int64)
+        self._tombstone_seq = 0
+
+    def _check_fork(self):
+        # SQLite 连接不能跨进程使用，fork 后重新打开并重新加载快照
+        if self._pid != os.getpid():
+            logger.debug("Process forked, reopening FAISS store %s", self.path)
+            self._open()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(os.path.join(self.path, LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    def _snapshots(self) -> List[Tuple[int, int, int, str]]:
+        snapshots = []
+        for name in os.listdir(self.path):
+            match = SNAPSHOT_PATTERN.match(name)
+            if match:
+                snapshots.append((int(match.group(1)), int(match.group(2)), int(match.group(3)), name))
+        return sorted(snapshots)
+
+    def _load_snapshot(self, snapshot: Optional[Tuple[int, int, int, str]]):
+        if snapshot is None:
+            self._base, self._base_name, self._base_last_id, self._tombstone_seq = None, None, 0, 0
+        else:
+            last_id, seq, _, name = snapshot
+            flags = 0
+            if self.use_mmap:
+                # 扁平索引映射向量数组，IVF 映射倒排表
+                flags = faiss.IO_FLAG_MMAP if name.endswith("-ivf.faiss") else getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            self._base = faiss.read_index(os.path.join(self.path, name), flags)
+            self._base_name, self._base_last_id, self._tombstone_seq = name, last_id, seq
+        self._base_plan = _plan_of(self._base)
+        self._delta = None
+        self._delta_last_id = self._base_last_id
+        self._deleted = np.empty(0, dtype=np.int64)
+
+    def _new_index(self, plan: Optional[IndexPlan] = None):
+        """增量索引始终是 float32 扁平索引；IVF 自带 id，扁平索引用 IndexIDMap2 包装"""
+        plan = plan or IndexPlan("FLAT")
+        if plan.index_type == "FLAT":
+            return faiss.IndexIDMap2(faiss.index_factory(self._dim, plan.faiss_factory(), faiss.METRIC_L2))
+        return faiss.index_factory(self._dim, plan.faiss_factory(), faiss.METRIC_L2)
+
+    def _refresh(self):
+        """追平其他进程（或本进程其他线程）的写入和删除，调用方需持有 self._lock"""
+        if self._dim is None:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+            if row is None:
+                return
+            self._dim = int(row[0])
+        while True:
+            snapshots = self._snapshots()
+            latest = snapshots[-1] if snapshots else None
+            if (latest[3] if latest else None) == self._base_name:
+                break
+            try:
+                self._load_snapshot(latest)
+                break
+            except RuntimeError:
+                # 快照刚被新的检查点替换并删除，重新列目录
+                if os.path.exists(os.path.join(self.path, latest[3])):
+                    raise
+
+        # 新写入的行加入增量索引
+        rows = self._db.execute("SELECT id, embedding FROM chunks WHERE id > ? ORDER BY id",
+                                (self._delta_last_id,)).fetchall()
+        if rows:
+            ids, vectors = _decode(rows, self._dim)
+            if self._delta is None:
+                self._delta = self._new_index()
+            self._delta.add_with_ids(vectors, ids)
+            self._delta_last_id = int(ids[-1])
+
+        # 新的墓碑：快照中的行在检索时排除，增量中的行直接移除
+        rows = self._db.execute("SELECT seq, id FROM tombstones WHERE seq > ? ORDER BY seq",
+                                (self._tombstone_seq,)).fetchall()
+        if rows:
+            ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+            self._tombstone_seq = rows[-1][0]
+            self._deleted = np.union1d(self._deleted, ids[ids <= self._base_last_id])
+            if self._delta is not None:
+                self._delta.remove_ids(ids[ids > self._base_last_id])
+
+    def _maybe_checkpoint(self):
+        pending = (self._delta.ntotal if self._delta is not None else 0) + len(self._deleted)
+        if pending >= self.checkpoint_rows:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """把快照、增量行和墓碑合并成新快照，缩短其他进程启动时的追平时间"""
+        with self._lock, self._file_lock():
+            self._check_fork()
+            self._refresh()
+            if self._dim is None:
+                return
+            if self._base_name is not None:
+                index = faiss.read_index(os.path.join(self.path, self._base_name))
+            else:
+                index = self._new_index(choose_index(0, self._dim, self.precision))
+            self._install_snapshot(index, self._base_last_id, force=False)
+
+    def _install_snapshot(self, index, covered_last_id: int, force: bool = True):
+        """补上 covered_last_id 之后的新行、移除墓碑并写出新快照
+
+        调用方需持有 self._lock 和文件锁。index 已包含截至 covered_last_id 的行（可能含已删除的行）。
+        """
+        tombstones = self._db.execute("SELECT seq, id FROM tombstones").fetchall()
+        rows = self._db.execute("SELECT id, embedding FROM chunks WHERE id > ? ORDER BY id",
+                                (covered_last_id,)).fetchall()
+        if not force and not rows and not tombstones:
+            return
+        if tombstones:
+            index.remove_ids(np.fromiter((row[1] for row in tombstones), dtype=np.int64, count=len(tombstones)))
+        last_id = covered_last_id
+        if rows:
+            ids, vectors = _decode(rows, self._dim)
+            index.add_with_ids(vectors, ids)
+            last_id = int(ids[-1])
+        seq = max([self._tombstone_seq] + [row[0] for row in tombstones])
+
+        kind = "flat" if _plan_of(index).index_type == "FLAT" else "ivf"
+        name = f"index-{last_id:012d}-{seq:012d}-{time.time_ns()}-{kind}.faiss"
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        # 新快照已包含这些删除，墓碑可以清理；旧快照可能仍被其他进程映射，unlink 不影响它们
+        self._db.execute("DELETE FROM tombstones WHERE seq <= ?", (seq,))
+        for *_, old_name in self._snapshots():
+            if old_name != name:
+                os.remove(os.path.join(self.path, old_name))
+        self._base_name = None
+        self._refresh()
+        logger.debug("FAISS store %s wrote snapshot %s (%d vectors)", self.path, name, index.ntotal)
+
+    def num_rows(self) -> int:
+        with self._lock:
+            self._check_fork()
+            return self._db.execute("SELECT count(*) FROM chunks").fetchone()[0]
+
+    def current_index(self) -> IndexPlan:
+        with self._lock:
+            self._check_fork()
+            self._refresh()
+            return self._base_plan
+
+    def rebuild_index(self, plan: IndexPlan):
+        """按新方案从 SQLite 重建快照
+
+        构建在独立的 SQLite 连接上进行，不持有 self._lock，检索继续使用旧快照和增量索引；
+        构建完成后补上期间的新写入和删除，再原子替换快照。
+        """
+        with self._lock:
+            self._check_fork()
+            self._refresh()
+            if self._dim is None:
+                return
+            cut_id = self._delta_last_id
+        index = self._new_index(plan)
+        db = sqlite3.connect(os.path.join(self.path, DB_FILE), timeout=30)
+        try:
+            if not index.is_trained:
+                ids = np.fromiter((row[0] for row in db.execute("SELECT id FROM chunks WHERE id <= ?", (cut_id,))),
+                                  dtype=np.int64)
+                sample = np.sort(np.random.default_rng().choice(ids, size=min(len(ids), plan.train_size), replace=False))
+                vectors = []
+                for start in range(0, len(sample), SQL_BATCH):
+                    batch = [int(i) for i in sample[start:start + SQL_BATCH]]
+                    rows = db.execute(f"SELECT id, embedding FROM chunks WHERE id IN ({','.join('?' * len(batch))})",
+                                      batch).fetchall()
+                    if rows:
+                        vectors.append(_decode(rows, self._dim)[1])
+                index.train(np.concatenate(vectors))
+            last = 0
+            while True:
+                rows = db.execute("SELECT id, embedding FROM chunks WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                                  (last, cut_id, REBUILD_BATCH)).fetchall()
+                if not rows:
+                    break
+                ids, vectors = _decode(rows, self._dim)
+                index.add_with_ids(vectors, ids)
+                last = int(ids[-1])
+        finally:
+            db.close()
+        with self._lock, self._file_lock():
+            self._check_fork()
+            self._refresh()
+            self._install_snapshot(index, cut_id)
+
+    def _ensure_dim(self, dim: int):
+        self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+        stored = int(self._db.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()[0])
+        if stored != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match store dimension {stored}")
+        self._dim = stored
+
+    def insert(self, rows: List[tuple]) -> List[int]:
+        embeddings = np.asarray(np.stack([row[3] for row in rows]), dtype=np.float32)
+        with self._lock:
+            self._check_fork()
+            ids = []
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._ensure_dim(embeddings.shape[1])
+                for (doc_id, content, metadata, _), embedding in zip(rows, embeddings):
+                    cursor = self._db.execute(
+                        "INSERT INTO chunks (doc_id, content, metadata, embedding) VALUES (?, ?, ?, ?)",
+                        (doc_id, content, json.dumps(metadata, ensure_ascii=False), embedding.tobytes())
+                    )
+                    ids.append(cursor.lastrowid)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._refresh()
+            self._maybe_checkpoint()
+        index_maintainer.schedule(self)
+        return ids
+
+    def search(self,
+               embeddings: np.ndarray,
+               top_ks: List[int],
+               metadata_filter: Optional[Dict[str, Any]] = None,
+               read_your_writes: bool = False,
+               search_params: Optional[Dict[str, Any]] = None,
+               fields: Optional[Sequence[str]] = None,
+               partitions: Optional[Sequence[str]] = None,
+               consistency_level: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """同一进程内的写入立即可见，read_your_writes 和 consistency_level 不需要额外处理；FAISS 向量库不分区
+
+        快照为有损索引且 rerank_factor 大于 1 时，每个查询召回 top_k * rerank_factor 个候选，
+        再用 SQLite 中的 float32 向量重新计算距离。
+        """
+        if partitions is not None:
+            raise ValueError("FAISS vector store does not support partitions")
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        all_hits: List[List[Dict[str, Any]]] = [[] for _ in top_ks]
+        with self._lock:
+            self._check_fork()
+            self._refresh()
+            base, base_plan, deleted = self._base, self._base_plan, self._deleted
+            rerank = self.rerank_factor > 1 and base is not None and base_plan.is_lossy
+            candidate_ks = [k * self.rerank_factor for k in top_ks] if rerank else list(top_ks)
+            limit = max(candidate_ks, default=0)
+            if self._dim is None or limit <= 0:
+                return all_hits
+            allowed = exact = None
+            if metadata_filter:
+                allowed = self._match_ids(metadata_filter)
+                if len(allowed) == 0:
+                    return all_hits
+                if len(allowed) <= EXACT_SEARCH_MAX_ROWS:
+                    # 过滤后只剩少量行时直接用原始向量精确计算，比带选择器检索索引更快，也不受 nprobe 影响
+                    exact = self._fetch(allowed, (), with_embedding=True)
+            if exact is None:
+                # 增量索引会被写入线程修改，只在锁内检索
+                results = [self._search_index(self._delta, embeddings, limit, allowed, None)]
+        if exact is not None:
+            return self._exact_search(embeddings, top_ks, exact, fields)
+        # 快照只读，替换时旧对象仍然有效，可以在锁外并发检索；检索参数按快照实际的索引推导
+        results.append(self._search_index(base, embeddings, limit, allowed, deleted, base_plan, search_params))
+        results = [result for result in results if result is not None]
+        if not results:
+            return all_hits
+
+        distances = np.concatenate([result[0] for result in results], axis=1)
+        ids = np.concatenate([result[1] for result in results], axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")[:, :limit]
+        distances = np.take_along_axis(distances, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+
+        # 只为命中的行读取内容；读取前被其他进程删除的行直接跳过
+        payloads = self._fetch(np.unique(ids[ids >= 0]), fields, with_embedding=rerank)
+        for i, (hits, row_ids, row_distances, k) in enumerate(zip(all_hits, ids, distances, candidate_ks)):
+            for id, distance in zip(row_ids, row_distances):
+                if len(hits) >= k:
+                    break
+                payload = payloads.get(int(id))
+                if payload is None:
+                    continue
+                hits.append({"score": float(distance), **payload})
+            if rerank and hits:
+                vectors = np.stack([hit.pop("embedding") for hit in hits])
+                all_hits[i] = rerank_hits(embeddings[i], hits, vectors, top_ks[i])
+        return all_hits
+
+    def _exact_search(self, embeddings: np.ndarray, top_ks: List[int], rows: Dict[int, Dict[str, Any]],
+                      fields: Optional[Sequence[str]]) -> List[List[Dict[str, Any]]]:
+        """在过滤后的少量行上精确计算 L2 距离（平方），与索引返回的 score 含义相同"""
+        all_hits: List[List[Dict[str, Any]]] = [[] for _ in top_ks]
+        if not rows:
+            return all_hits
+        ids = np.fromiter(rows.keys(), dtype=np.int64, count=len(rows))
+        vectors = np.stack([row["embedding"] for row in rows.values()])
+        distances = ((embeddings ** 2).sum(axis=1)[:, None] - 2 * embeddings @ vectors.T
+                     + (vectors ** 2).sum(axis=1)[None, :])
+        np.maximum(distances, 0, out=distances)
+        orders = [np.argsort(row, kind="stable")[:k] for row, k in zip(distances, top_ks)]
+        # 只为命中的行读取内容，读取前被删除的行跳过
+        payloads = self.fetch(ids[np.unique(np.concatenate(orders))].tolist(), fields)
+        for hits, row, order in zip(all_hits, distances, orders):
+            for i in order:
+                payload = payloads.get(int(ids[i]))
+                if payload is not None:
+                    hits.append({"score": float(row[i]), **payload})
+        return all_hits
+
+    def _search_index(self, index, embeddings: np.ndarray, limit: int,
+                      allowed: Optional[np.ndarray], excluded: Optional[np.ndarray],
+                      plan: Optional[IndexPlan] = None, search_params: Optional[Dict[str, Any]] = None):
+        if index is None or index.ntotal == 0:
+            return None
+        # IDSelector 只保存指针，局部变量保证它们在检索结束前不被回收
+        selector = inner = None
+        if allowed is not None:
+            selector = faiss.IDSelectorBatch(allowed)
+        elif excluded is not None and len(excluded):
+            inner = faiss.IDSelectorBatch(excluded)
+            selector = faiss.IDSelectorNot(inner)
+        if plan is not None and plan.index_type != "FLAT":
+            nprobe = int((search_params or {}).get("nprobe", plan.nprobe))
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=max(1, min(plan.nlist, nprobe)))
+        else:
+            params = faiss.SearchParameters(sel=selector) if selector is not None else None
+        return index.search(embeddings, min(limit, index.ntotal), params=params)
+
+    def search_knob(self, plan: IndexPlan) -> Optional[str]:
+        # HNSW 方案在 FAISS 中是以 HNSW 为粗量化器的 IVF，同样按 nprobe 调节
+        return "nprobe" if plan.index_type != "FLAT" else None
+
+    def iter_embeddings(self, batch_size: int = 10000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """在独立的 SQLite 连接上按 id 分页读取，不阻塞写入和检索"""
+        with self._lock:
+            self._check_fork()
+            self._refresh()
+        if self._dim is None:
+            return
+        db = sqlite3.connect(os.path.join(self.path, DB_FILE), timeout=30)
+        try:
+            last = 0
+            while True:
+                rows = db.execute("SELECT id, embedding FROM chunks WHERE id > ? ORDER BY id LIMIT ?",
+                                  (last, batch_size)).fetchall()
+                if not rows:
+                    break
+                ids, vectors = _decode(rows, self._dim)
+                yield ids, vectors
+                last = int(ids[-1])
+        finally:
+            db.close()
+
+    def fetch(self, ids: Iterable[int], fields: Optional[Sequence[str]] = None) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            self._check_fork()
+            return self._fetch([int(i) for i in ids], fields)
+
+    def _fetch(self, ids, fields: Optional[Sequence[str]] = None, with_embedding: bool = False) -> Dict[int, Dict[str, Any]]:
+        """读取命中行的 id 和 fields 中的字段，with_embedding 时附带 float32 原始向量（键为 embedding）用于重排"""
+        payloads = {}
+        columns = ["id"] + list(payload_fields(fields)) + (["embedding"] if with_embedding else [])
+        with self._lock:
+            for start in range(0, len(ids), SQL_BATCH):
+                batch = [int(i) for i in ids[start:start + SQL_BATCH]]
+                placeholders = ",".join("?" * len(batch))
+                for row in self._db.execute(f"SELECT {', '.join(columns)} FROM chunks WHERE id IN ({placeholders})",
+                                            batch):
+                    payload = dict(zip(columns, row))
+                    if "metadata" in payload:
+                        payload["metadata"] = json.loads(payload["metadata"])
+                    if with_embedding:
+                        payload["embedding"] = np.frombuffer(payload["embedding"], dtype=np.float32)
+                    payloads[payload["id"]] = payload
+        return payloads
+
+    def match_ids(self, metadata_filter: Optional[Filter], partitions: Optional[Sequence[str]] = None) -> np.ndarray:
+        if partitions is not None:
+            raise ValueError("FAISS vector store does not support partitions")
+        with self._lock:
+            self._check_fork()
+            return self._match_ids(metadata_filter)
+
+    def _match_ids(self, metadata_filter: Filter) -> np.ndarray:
+        where, params = sqlite_where(metadata_filter)
+        rows = self._db.execute(f"SELECT id FROM chunks WHERE {where}", params).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def index_metadata(self, promoted: Dict[str, str]):
+        """为提升的元数据键建立 SQLite 表达式索引，FAISS 后端不区分类型，已建立的索引保留"""
+        if promoted == self.promoted_metadata:
+            return
+        with self._lock:
+            self._check_fork()
+            for key in promoted:
+                if key not in self.promoted_metadata:
+                    self._db.execute(sqlite_index(key))
+            self.promoted_metadata = dict(promoted)
+
+    def _delete_where(self, where: str, params: List[Any]) -> int:
+        with self._lock:
+            self._check_fork()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [(row[0],) for row in self._db.execute(f"SELECT id FROM chunks WHERE {where}", params)]
+                if ids:
+                    self._db.executemany("DELETE FROM chunks WHERE id = ?", ids)
+                    self._db.executemany("INSERT INTO tombstones (id) VALUES (?)", ids)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._refresh()
+            self._maybe_checkpoint()
+        return len(ids)
+
+    def delete_by_ids(self, ids: Iterable[int]) -> int:
+        ids = [int(i) for i in ids]
+        count = 0
+        for start in range(0, len(ids), SQL_BATCH):
+            batch = ids[start:start + SQL_BATCH]
+            count += self._delete_where(f"id IN ({','.join('?' * len(batch))})", batch)
+        return count
+
+    def delete_by_doc_id(self, doc_id: str) -> int:
+        return self._delete_where("doc_id = ?", [doc_id])
+
+    def delete_by_metadata(self, metadata_filter: Filter) -> int:
+        if not metadata_filter:
+            return 0
+        return self._delete_where(*sqlite_where(metadata_filter))
+
+    def drop(self) -> int:
+        with self._lock:
+            self._check_fork()
+            count = self._db.execute("SELECT count(*) FROM chunks").fetchone()[0]
+        faiss_stores.remove(self.path)
+        shutil.rmtree(self.path, ignore_errors=True)
+        return count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+            self._base = self._delta = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._check_fork()
+            self._refresh()
+            return {
+                "rows": self._db.execute("SELECT count(*) FROM chunks").fetchone()[0],
+                "snapshot": self._base_name,
+                "snapshot_vectors": self._base.ntotal if self._base is not None else 0,
+                "index": self._base_plan.index_type,
+                "precision": self._base_plan.precision,
+                "delta_vectors": self._delta.ntotal if self._delta is not None else 0,
+                "tombstones": len(self._deleted),
+            }
+
+
+class FaissStoreRegistry:
+    """按知识库目录缓存 FAISS 向量库，同一进程内共享一个实例"""
+
+    def __init__(self, use_mmap: bool = True, checkpoint_rows: int = 10000):
+        self.use_mmap = use_mmap
+        self.checkpoint_rows = checkpoint_rows
+        self._stores: Dict[str, FaissVectorStore] = {}
+        self._lock = threading.Lock()
+
+    def get(self, vector_store_path: str, precision: str = "float32", rerank_factor: int = 0,
+            promoted_metadata: Optional[Dict[str, str]] = None) -> FaissVectorStore:
+        """精度和重排倍数取最近一次的知识库配置，精度变化后由 index_maintainer 在后台重建快照；
+        promoted_metadata 中的键建立表达式索引"""
+        path = os.path.realpath(os.path.join(vector_store_path, "faiss"))
+        with self._lock:
+            store = self._stores.get(path)
+            if store is None:
+                store = FaissVectorStore(path, use_mmap=self.use_mmap, checkpoint_rows=self.checkpoint_rows,
+                                         precision=precision, rerank_factor=rerank_factor)
+                self._stores[path] = store
+            store.precision, store.rerank_factor = precision, rerank_factor
+        store.index_metadata(promoted_metadata or {})
+        return store
+
+    def remove(self, path: str):
+        """关闭并移出注册表，知识库删除时调用"""
+        with self._lock:
+            store = self._stores.pop(os.path.realpath(path), None)
+        if store is not None:
+            store.close()
+
+# 全局 FAISS 向量库注册表实例
+faiss_stores = FaissStoreRegistry(
+    use_mmap=settings.vector_store.faiss_mmap,
+    checkpoint_rows=settings.vector_store.faiss_checkpoint_rows,
+)
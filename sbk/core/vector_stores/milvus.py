@@ -0,0 +1,849 @@
+import os
+import time
+import zlib
+import socket
+import logging
+import threading
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pymilvus import (
+    Collection,
+    CollectionSchema,
+    FieldSchema,
+    DataType,
+    MilvusException,
+    utility
+)
+
+from sbk.config import config as settings
+from sbk.core.milvus import milvus_connections
+from sbk.core.chunk_store import ChunkStore, chunk_stores
+from sbk.core.exceptions import VectorStoreError
+from sbk.core.index_policy import IndexPlan, choose_index, index_locks, index_maintainer
+from sbk.core.partitioning import Partitioner
+from sbk.core.metadata_filter import (
+    PROMOTED_PREFIX,
+    VARCHAR_MAX_LENGTH,
+    Filter,
+    milvus_expr,
+    milvus_literal,
+    promoted_value,
+    split_promoted,
+)
+from sbk.core.vector_stores.base import BaseVectorStore, payload_fields, rerank_hits
+
+logger = logging.getLogger(__name__)
+
+# 半精度向量字段需要 pymilvus 2.4 / Milvus 2.4 及以上
+FLOAT16_VECTOR = getattr(DataType, "FLOAT16_VECTOR", None)
+# Milvus 单次检索的 limit 上限
+MAX_SEARCH_LIMIT = 16384
+# 按主键读取时每批的 id 数
+FETCH_BATCH = 1000
+# 外部 chunk 存储过滤出的 id 超过该数量时不再下推为 id in [...] 表达式，改为扩大召回后在本地过滤
+MAX_PUSHDOWN_IDS = FETCH_BATCH
+# 过滤条件不可能满足时使用的表达式，生成的主键都是正数
+MATCH_NOTHING = "id < 0"
+# 物理集合名称的版本后缀，集合名称本身是指向当前版本的别名
+VERSION_SUFFIX = "__v"
+# 这些错误码说明缓存的集合句柄或分区信息已过期（别名正在切换、分区已被其他进程删除），刷新后重试一次：
+# 集合不存在、集合未加载、分区不存在、分区未加载
+STALE_ERROR_CODES = (100, 101, 200, 201)
+# Milvus 2.2 只返回旧的 commonpb.ErrorCode：CollectionNotExists、CollectionNameNotFound
+STALE_COMPATIBLE_CODES = (4, 28)
+STALE_RETRY_DELAY = 0.2
+# 提升的元数据类型对应的标量字段类型
+PROMOTED_DTYPES = {
+    "varchar": DataType.VARCHAR,
+    "int64": DataType.INT64,
+    "double": DataType.DOUBLE,
+    "bool": DataType.BOOL,
+}
+
+
+def _is_stale(error: MilvusException) -> bool:
+    return error.code in STALE_ERROR_CODES or getattr(error, "compatible_code", None) in STALE_COMPATIBLE_CODES
+
+
+def _iter_query(collection: Collection,
+                expr: str,
+                output_fields: List[str],
+                partition_names: Optional[List[str]] = None,
+                batch_size: int = FETCH_BATCH * 10,
+                **kwargs) -> Iterator[List[Dict[str, Any]]]:
+    """用 query_iterator 分批读取满足条件的行"""
+    iterator = collection.query_iterator(batch_size=batch_size, expr=expr, output_fields=output_fields,
+                                         partition_names=partition_names, **kwargs)
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            yield rows
+    finally:
+        iterator.close()
+
+
+def _ids_of(rows: List[Dict[str, Any]]) -> np.ndarray:
+    return np.fromiter((row["id"] for row in rows), dtype=np.int64, count=len(rows))
+
+
+def _query_all_ids(collection: Collection,
+                   expr: str,
+                   partition_names: Optional[List[str]] = None,
+                   **kwargs) -> np.ndarray:
+    batches = [_ids_of(rows) for rows in _iter_query(collection, expr, ["id"], partition_names, **kwargs)]
+    return np.concatenate(batches) if batches else np.empty(0, dtype=np.int64)
+
+
+class PrimaryKeyAllocator:
+    """客户端生成的主键：毫秒时间戳 << 20 | 12 位进程标识 << 8 | 毫秒内序号
+
+    重建索引时行连同主键复制到新集合，新建的集合因此不使用 auto_id。生成的主键大于
+    Milvus 自动主键（毫秒时间戳 << 18），同一毫秒内序号用尽时顺延到下一毫秒。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._node = 0
+        self._ms = 0
+        self._seq = 0
+
+    def allocate(self, n: int) -> List[int]:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._node = zlib.crc32(f"{socket.gethostname()}:{self._pid}".encode("utf-8")) & 0xFFF
+                self._ms = 0
+            ms = max(int(time.time() * 1000), self._ms)
+            if ms > self._ms:
+                self._seq = 0
+            keys = []
+            for _ in range(n):
+                if self._seq > 0xFF:
+                    ms += 1
+                    self._seq = 0
+                keys.append(ms << 20 | self._node << 8 | self._seq)
+                self._seq += 1
+            self._ms = ms
+            return keys
+
+# 全局主键分配器实例
+primary_keys = PrimaryKeyAllocator()
+
+
+class MilvusVectorStore(BaseVectorStore):
+    """基于 Milvus 集合的向量库，连接和集合句柄由 milvus_connections 复用
+
+    precision 为 float16 时向量字段为 FLOAT16_VECTOR，写入和检索时自动转换；sq8 和 pq 只改变索引，
+    集合中仍保存 float32 原始向量，rerank_factor 大于 1 时用它们重排有损索引的候选。
+
+    提供 chunk_store 时集合只保存 id、doc_id 和向量，正文和元数据写入外部 chunk 存储，
+    检索时按最终命中批量读取，元数据过滤先在 chunk 存储中得到 id 再交给 Milvus。
+
+    promoted_metadata 中的元数据键在建集合时提升为带标量索引的 meta_<键> 字段（两种存放方式都适用），
+    过滤这些键时直接比较标量字段。过滤表达式在 Milvus 中先于向量检索求值。
+
+    提供 partitioner 时写入的行按其分配到分区（首次用到时创建），检索可以只在指定分区中进行，
+    整组删除直接删除分区。
+
+    提供 kb_id 时为共享集合模式：多个知识库共用一个集合，kb_id 字段是 Milvus 的分区键，
+    写入时带上 kb_id，检索、读取和删除都自动附加 kb_id 条件，Milvus 按分区键只扫描对应的物理分区。
+
+    集合名称是指向物理集合 <名称>__v<N> 的别名，重建索引时在新版本上建好索引再切换别名；
+    早期版本直接以名称建立的集合在第一次重建时迁移为这种形式。
+    """
+
+    def __init__(self,
+                 collection_name: str,
+                 dim: int = 1024,
+                 host: Optional[str] = None,
+                 port: Optional[str] = None,
+                 index_params: Optional[dict] = None,
+                 precision: str = "float32",
+                 rerank_factor: int = 0,
+                 chunk_store: Optional[ChunkStore] = None,
+                 promoted_metadata: Optional[Dict[str, str]] = None,
+                 partitioner: Optional[Partitioner] = None,
+                 kb_id: Optional[int] = None):
+        self.collection_name = collection_name
+        self.kb_id = kb_id
+        self.dim = dim
+        self.precision = precision
+        self.rerank_factor = rerank_factor
+        self.chunk_store = chunk_store
+        self.promoted_metadata = dict(promoted_metadata or {})
+        self.partitioner = partitioner
+        # 检索时已知存在的分区，遇到未知分区或分区不存在的错误时从服务端刷新
+        self._partitions = set()
+        self._partition_lock = threading.Lock()
+        # 新集合从 FLAT 开始，数据增长后由 index_maintainer 在后台换成合适的索引，
+        # 避免 IVF 在第一批少量数据上训练
+        self.index_params = index_params or choose_index(0, dim, precision).to_milvus()
+        # 连接和集合句柄在进程内复用，这里通常不会产生网络请求
+        self.alias = milvus_connections.connect(host, port)
+        self.collection = milvus_connections.get_collection(
+            self.alias, self.collection_name, create_fn=self._create_collection
+        )
+        field_names = {field.name for field in self.collection.schema.fields}
+        if ("kb_id" in field_names) != (kb_id is not None):
+            raise VectorStoreError(f"Collection {collection_name} is {'' if 'kb_id' in field_names else 'not '}"
+                                   f"a shared collection, check vector_store.layout")
+        # 集合的 schema 在创建时确定，之后以集合为准
+        if "content" in field_names and self.chunk_store is not None:
+            logger.warning("Collection %s stores chunk content inline, ignoring the external chunk store",
+                           collection_name)
+            self.chunk_store = None
+        elif "content" not in field_names and self.chunk_store is None:
+            raise VectorStoreError(f"Collection {collection_name} keeps chunk content in an external chunk store, "
+                                   f"set vector_store.chunk_store to external")
+        # 提升字段同样在建集合时确定
+        dtypes = {dtype: name for name, dtype in PROMOTED_DTYPES.items()}
+        promoted = {
+            field.name[len(PROMOTED_PREFIX):]: dtypes[field.dtype]
+            for field in self.collection.schema.fields
+            if field.name.startswith(PROMOTED_PREFIX) and field.dtype in dtypes
+        }
+        if promoted != self.promoted_metadata:
+            if promoted_metadata is not None:
+                logger.warning("Collection %s promotes metadata %s, ignoring configured %s",
+                               collection_name, promoted, self.promoted_metadata)
+            self.promoted_metadata = promoted
+        self.float16 = False
+        for field in self.collection.schema.fields:
+            if field.name == "embedding":
+                self.dim = field.params.get("dim", dim)
+                self.float16 = FLOAT16_VECTOR is not None and field.dtype == FLOAT16_VECTOR
+        # 向量字段类型在建集合时确定，之后以集合为准
+        if self.float16 != (precision == "float16"):
+            logger.warning("Collection %s stores %s vectors, ignoring precision %s",
+                           collection_name, "float16" if self.float16 else "float32", precision)
+            self.precision = "float16" if self.float16 else "float32"
+        # 写缓冲和 BM25 按知识库区分，共享集合中每个知识库有自己的 key
+        self.key = self.index_key if kb_id is None else f"{self.index_key}#kb{kb_id}"
+        self._auto_id = self._read_auto_id()
+        self._index_plan: Optional[IndexPlan] = None
+        self._index_checked = 0.0
+
+    def _read_auto_id(self) -> bool:
+        """早期版本建立的集合由 Milvus 自动生成主键，之后建立的集合由 primary_keys 生成"""
+        return any(field.name == "id" and getattr(field, "auto_id", False) for field in self.collection.schema.fields)
+
+    def _refresh(self):
+        """丢弃缓存的集合句柄和分区信息，别名可能已切换到新集合，分区可能已被其他进程删除"""
+        milvus_connections.invalidate(self.alias, self.collection_name)
+        self.collection = milvus_connections.get_collection(self.alias, self.collection_name)
+        self._auto_id = self._read_auto_id()
+        with self._partition_lock:
+            self._partitions = set()
+        self._index_plan = None
+
+    def _retrying(self, operation, write: bool = False):
+        """执行集合操作，句柄或分区信息过期时刷新后重试一次
+
+        写入的其他错误不重试，除非刷新后发现别名已切换到主键生成方式不同的集合（早期集合迁移后），
+        这种写入在校验 schema 时就失败，没有写入任何行，重试不会产生重复。
+        """
+        try:
+            return operation()
+        except MilvusException as e:
+            if not _is_stale(e):
+                if not write:
+                    raise
+                auto_id = self._auto_id
+                self._refresh()
+                if self._auto_id == auto_id:
+                    raise
+            else:
+                time.sleep(STALE_RETRY_DELAY)
+                self._refresh()
+            logger.info("Retrying with refreshed collection handle of %s: %s", self.index_key, str(e))
+            return operation()
+
+    @property
+    def index_key(self) -> str:
+        return f"{self.alias}/{self.collection_name}"
+
+    def _scoped(self, expr: Optional[str]) -> Optional[str]:
+        """共享集合中为表达式附加本知识库的 kb_id 条件"""
+        if self.kb_id is None:
+            return expr
+        kb_expr = f"kb_id == {int(self.kb_id)}"
+        return f"{kb_expr} && ({expr})" if expr else kb_expr
+
+    def _create_collection(self, alias: str) -> Collection:
+        """创建物理集合 <名称>__v1，并建立以集合名称命名、指向它的别名"""
+        physical_name = f"{self.collection_name}{VERSION_SUFFIX}1"
+        self._build_collection(alias, physical_name, self.index_params)
+        try:
+            utility.create_alias(physical_name, self.collection_name, using=alias)
+        except Exception as e:
+            raise VectorStoreError(f"Failed to create collection alias: {str(e)}")
+        return Collection(self.collection_name, using=alias)
+
+    def _build_collection(self, alias: str, name: str, index_params: Dict[str, Any]) -> Collection:
+        """按本库的 schema 创建物理集合及其索引，主键由客户端生成"""
+        if self.precision == "float16" and FLOAT16_VECTOR is None:
+            raise VectorStoreError("float16 precision requires pymilvus with FLOAT16_VECTOR support (Milvus 2.4+)")
+        try:
+            fields = [
+                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=False),
+            ]
+            collection_kwargs = {}
+            if self.kb_id is not None:
+                fields.append(FieldSchema(name="kb_id", dtype=DataType.INT64, is_partition_key=True))
+                collection_kwargs["num_partitions"] = settings.vector_store.shared_num_partitions
+            fields.append(FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=200))
+            for key, field_type in self.promoted_metadata.items():
+                kwargs = {"max_length": VARCHAR_MAX_LENGTH} if field_type == "varchar" else {}
+                fields.append(FieldSchema(name=PROMOTED_PREFIX + key, dtype=PROMOTED_DTYPES[field_type], **kwargs))
+            if self.chunk_store is None:
+                fields += [
+                    FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=65535),
+                    FieldSchema(name="metadata", dtype=DataType.JSON),
+                ]
+            fields.append(FieldSchema(name="embedding",
+                                      dtype=FLOAT16_VECTOR if self.precision == "float16" else DataType.FLOAT_VECTOR,
+                                      dim=self.dim))
+            schema = CollectionSchema(fields=fields, description="Document segments for RAG")
+            collection = Collection(name=name, schema=schema, using=alias, **collection_kwargs)
+
+            # 创建索引
+            collection.create_index(field_name="embedding", index_params=index_params)
+
+            # 创建node_id索引
+            collection.create_index(field_name="doc_id")
+            # 提升字段的标量索引，布尔字段只有两个取值，不建索引
+            for key, field_type in self.promoted_metadata.items():
+                if field_type != "bool":
+                    collection.create_index(field_name=PROMOTED_PREFIX + key)
+            return collection
+
+        except Exception as e:
+            raise VectorStoreError(f"Failed to create collection: {str(e)}")
+
+    def insert(self, rows: List[tuple]) -> List[int]:
+        """按列插入一批行，字段顺序与 schema 一致
+
+        使用外部 chunk 存储时先写入向量取得主键，再以主键写入正文；两步之间失败留下的
+        无正文向量会在检索时被跳过。分区集合中每个分区的行各自一次 insert。
+        """
+        if self.partitioner is None:
+            primary_keys = self._retrying(lambda: self._insert_rows(rows), write=True)
+        else:
+            groups: Dict[str, List[int]] = {}
+            now = time.time()
+            for i, (doc_id, _, metadata, _) in enumerate(rows):
+                groups.setdefault(self.partitioner.partition_of(doc_id, metadata, now), []).append(i)
+            primary_keys = [0] * len(rows)
+            for partition_name, positions in groups.items():
+                keys = self._retrying(partial(self._insert_partition, [rows[i] for i in positions], partition_name),
+                                      write=True)
+                for i, key in zip(positions, keys):
+                    primary_keys[i] = key
+        index_maintainer.schedule(self)
+        return primary_keys
+
+    def _insert_rows(self, rows: List[tuple], partition_name: Optional[str] = None) -> List[int]:
+        doc_ids, contents, metadatas, embeddings = zip(*rows)
+        vectors = self._to_field(np.stack(embeddings))
+        promoted = [[promoted_value(metadata, key, field_type) for metadata in metadatas]
+                    for key, field_type in self.promoted_metadata.items()]
+        leading = [[self.kb_id] * len(rows)] if self.kb_id is not None else []
+        if self.chunk_store is None:
+            columns = [*leading, list(doc_ids), *promoted, list(contents), list(metadatas), vectors]
+        else:
+            columns = [*leading, list(doc_ids), *promoted, vectors]
+        # 重建索引在切换前独占写锁，补齐复制期间的写入；主键在锁内生成，
+        # 重建开始后写入的行主键中的时间戳都不早于重建记录的水位
+        with index_locks.writes(self.index_key):
+            if not self._auto_id:
+                columns.insert(0, primary_keys.allocate(len(rows)))
+            result = self.collection.insert(columns, partition_name=partition_name)
+        if self.chunk_store is not None:
+            self.chunk_store.put(result.primary_keys, doc_ids, contents, metadatas)
+        return result.primary_keys
+
+    def _insert_partition(self, rows: List[tuple], partition_name: str) -> List[int]:
+        self._ensure_partition(partition_name)
+        return self._insert_rows(rows, partition_name)
+
+    def _ensure_partition(self, partition_name: str):
+        """分区不存在时创建；Milvus 2.3 起已加载集合中新建的分区会自动加载
+
+        分区可能已被其他进程删除，每次写入前都向服务端确认，不使用进程内缓存；
+        多个进程同时创建同一分区时，后到者的创建失败但分区已经存在，忽略该错误。
+        """
+        with index_locks.writes(self.index_key):
+            if not self.collection.has_partition(partition_name):
+                try:
+                    self.collection.create_partition(partition_name)
+                except MilvusException:
+                    if not self.collection.has_partition(partition_name):
+                        raise
+        with self._partition_lock:
+            self._partitions.add(partition_name)
+
+    def _scope(self, partitions: Optional[Sequence[str]]) -> Tuple[Optional[List[str]], Optional[str]]:
+        """把请求中的分区取值换算为存在的分区名，以及需要附加的过滤表达式
+
+        不存在的分区没有数据，直接略去；doc_hash 分区由多个文档共享，附加 doc_id 条件。
+        """
+        if partitions is None:
+            return None, None
+        if self.partitioner is None:
+            raise ValueError(f"Collection {self.collection_name} is not partitioned")
+        names = list(dict.fromkeys(self.partitioner.partition_for(value) for value in partitions))
+        if any(name not in self._partitions for name in names):
+            with self._partition_lock:
+                self._partitions = {partition.name for partition in self.collection.partitions}
+        names = [name for name in names if name in self._partitions]
+        if self.partitioner.by == "doc_hash":
+            return names, f"doc_id in {milvus_literal(list(partitions))}"
+        return names, None
+
+    def _to_field(self, vectors: np.ndarray):
+        """转换为向量字段接受的格式：半精度字段为逐行的 float16 数组"""
+        if self.float16:
+            return list(np.asarray(vectors, dtype=np.float16))
+        # pymilvus 2.3 会在 Python 中展开向量列，这里只在边界处转换一次
+        return np.asarray(vectors, dtype=np.float32).tolist()
+
+    @staticmethod
+    def _from_field(value) -> np.ndarray:
+        """半精度字段返回的是字节串"""
+        if isinstance(value, list) and value and isinstance(value[0], (bytes, bytearray)):
+            value = value[0]
+        if isinstance(value, (bytes, bytearray)):
+            return np.frombuffer(value, dtype=np.float16).astype(np.float32)
+        return np.asarray(value, dtype=np.float32)
+
+    def num_rows(self) -> int:
+        return self.collection.num_entities
+
+    def current_index(self) -> IndexPlan:
+        """集合上实际的向量索引，其他进程可能已重建，按检查间隔重新读取"""
+        now = time.monotonic()
+        if self._index_plan is None or now - self._index_checked >= settings.index.check_interval:
+            params = None
+            for index in self.collection.indexes:
+                if index.field_name == "embedding":
+                    params = index.params
+            self._index_plan = IndexPlan.from_milvus(params, "float16" if self.float16 else "float32")
+            self._index_checked = now
+        return self._index_plan
+
+    def rebuild_index(self, plan: IndexPlan):
+        """在新的物理集合上按方案建索引，建好并加载后把别名切换过去
+
+        Milvus 同一字段只能有一个向量索引，且删除索引前要释放集合。这里把数据连同主键复制到
+        下一个版本的物理集合，在其上建索引并加载，检索和写入在此期间照常使用旧集合。复制开始时
+        记录主键水位并开启删除日志，之后先不加锁追赶一轮，再在独占写锁内追赶剩余的少量写入后切换，
+        追赶只比较水位之后的主键并重放日志中的删除，不再扫描全部主键；切换后等待 KBS_INDEX_SWAP_GRACE
+        秒再删除旧集合。同一集合的重建由文件锁在进程间串行，锁被其他进程持有时直接返回。
+        """
+        with index_locks.rebuild(self.index_key) as acquired:
+            if not acquired:
+                logger.info("Index of %s is being rebuilt by another process", self.index_key)
+                return
+            # 其他进程可能刚完成重建
+            self._refresh()
+            if not self.current_index().needs_rebuild(plan):
+                return
+            current_name, versions = self._physical_collections()
+            # 上次中断的重建留下的集合
+            for name in versions.values():
+                if name != current_name:
+                    utility.drop_collection(name, using=self.alias)
+            new_name = f"{self.collection_name}{VERSION_SUFFIX}{max(versions, default=0) + 1}"
+            target = self._build_collection(self.alias, new_name, plan.to_milvus())
+            source = Collection(current_name, using=self.alias)
+            switched = False
+            try:
+                with index_locks.writes(self.index_key, exclusive=True):
+                    index_locks.start_journal(self.index_key)
+                    watermark = self._watermark()
+                source.load()
+                self._copy_rows(source, target)
+                utility.wait_for_index_building_complete(new_name, using=self.alias)
+                target.load()
+                next_watermark = self._watermark()
+                offset = self._catch_up(source, target, watermark, 0)
+                with index_locks.writes(self.index_key, exclusive=True):
+                    self._catch_up(source, target, next_watermark, offset)
+                    if current_name == self.collection_name:
+                        # 早期版本直接以名称建立的集合：先改名腾出名称再建立同名别名，
+                        # 建立失败时改回原名；其间的检索由 _retrying 重试
+                        legacy_name = f"{self.collection_name}{VERSION_SUFFIX}0"
+                        utility.rename_collection(current_name, legacy_name, using=self.alias)
+                        try:
+                            utility.create_alias(new_name, self.collection_name, using=self.alias)
+                        except Exception:
+                            utility.rename_collection(legacy_name, current_name, using=self.alias)
+                            raise
+                        current_name = legacy_name
+                    else:
+                        utility.alter_alias(new_name, self.collection_name, using=self.alias)
+                    switched = True
+            except Exception:
+                if not switched:
+                    utility.drop_collection(new_name, using=self.alias)
+                raise
+            finally:
+                index_locks.end_journal(self.index_key)
+            self._refresh()
+        self._index_plan = plan
+        self._index_checked = time.monotonic()
+        # 等待仍在旧集合上的检索完成
+        time.sleep(settings.index.swap_grace)
+        try:
+            source = Collection(current_name, using=self.alias)
+            source.release()
+            utility.drop_collection(current_name, using=self.alias)
+        except Exception as e:
+            logger.warning("Failed to drop replaced collection %s: %s", current_name, str(e))
+
+    def _physical_collections(self) -> Tuple[str, Dict[int, str]]:
+        """别名当前指向的物理集合，以及各版本的物理集合；早期版本的集合没有别名，返回集合名称本身"""
+        prefix = self.collection_name + VERSION_SUFFIX
+        versions = {
+            int(name[len(prefix):]): name
+            for name in utility.list_collections(using=self.alias)
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        }
+        for name in versions.values():
+            if self.collection_name in utility.list_aliases(name, using=self.alias):
+                return name, versions
+        return self.collection_name, versions
+
+    def _watermark(self) -> int:
+        """当前时间减去 KBS_INDEX_CLOCK_SKEW 对应的最小主键，之后写入的行主键都不小于它
+
+        客户端生成的主键是毫秒时间戳左移 20 位，早期集合的 Milvus 自动主键是毫秒时间戳左移 18 位。
+        """
+        ms = int((time.time() - settings.index.clock_skew) * 1000)
+        return max(0, ms) << (18 if self._auto_id else 20)
+
+    def _catch_up(self, source: Collection, target: Collection, watermark: int, offset: int) -> int:
+        """把复制开始后 source 上的变化补到 target，返回已重放的删除日志位置
+
+        先重放日志中的删除（可能删掉水位之后刚复制的行），再按水位之后的主键比较两边、补齐差异，
+        水位之前的行不会再写入，只会被删除。
+        """
+        entries, offset = index_locks.read_journal(self.index_key, offset)
+        for entry in entries:
+            if entry["op"] == "drop_partition":
+                if target.has_partition(entry["partition"]):
+                    target.partition(entry["partition"]).release()
+                    target.drop_partition(entry["partition"])
+            else:
+                partition_name = entry.get("partition")
+                if partition_name and not target.has_partition(partition_name):
+                    continue
+                target.delete(entry["expr"], partition_name=partition_name)
+        self._copy_rows(source, target, watermark)
+        return offset
+
+    def _copy_rows(self, source: Collection, target: Collection, watermark: Optional[int] = None):
+        """把 source 的行连同主键复制到 target
+
+        提供 watermark 时只比较主键不小于它的行，补上 target 缺少的行并删除 source 中已不存在的行。
+        分区键集合由 Milvus 按 kb_id 路由，其余集合按分区逐个复制。
+        """
+        names = [field.name for field in target.schema.fields]
+        if "kb_id" in names:
+            partitions = [None]
+        else:
+            partitions = [partition.name for partition in source.partitions]
+            for name in partitions:
+                if not target.has_partition(name):
+                    target.create_partition(name)
+        for partition_name in partitions:
+            partition_names = [partition_name] if partition_name else None
+            if watermark is None:
+                for rows in _iter_query(source, "id >= 0", names, partition_names, consistency_level="Strong"):
+                    self._insert_copied(target, names, rows, partition_name)
+                continue
+            expr = f"id >= {int(watermark)}"
+            source_ids = _query_all_ids(source, expr, partition_names, consistency_level="Strong")
+            target_ids = _query_all_ids(target, expr, partition_names, consistency_level="Strong")
+            removed = np.setdiff1d(target_ids, source_ids)
+            missing = np.setdiff1d(source_ids, target_ids)
+            for start in range(0, len(removed), FETCH_BATCH):
+                target.delete(f"id in {removed[start:start + FETCH_BATCH].tolist()}", partition_name=partition_name)
+            for start in range(0, len(missing), FETCH_BATCH):
+                rows = source.query(expr=f"id in {missing[start:start + FETCH_BATCH].tolist()}", output_fields=names,
+                                    partition_names=partition_names, consistency_level="Strong")
+                self._insert_copied(target, names, rows, partition_name)
+        target.flush()
+
+    def _insert_copied(self, target: Collection, names: List[str], rows: List[Dict[str, Any]],
+                       partition_name: Optional[str]):
+        if not rows:
+            return
+        columns = []
+        for name in names:
+            if name == "embedding":
+                columns.append(self._to_field(np.stack([self._from_field(row[name]) for row in rows])))
+            else:
+                columns.append([row[name] for row in rows])
+        target.insert(columns, partition_name=partition_name)
+
+    def search(self,
+               embeddings: np.ndarray,
+               top_ks: List[int],
+               metadata_filter: Optional[Dict[str, Any]] = None,
+               read_your_writes: bool = False,
+               search_params: Optional[Dict[str, Any]] = None,
+               fields: Optional[Sequence[str]] = None,
+               partitions: Optional[Sequence[str]] = None,
+               consistency_level: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        return self._retrying(partial(self._search, embeddings, top_ks, metadata_filter, read_your_writes,
+                                      search_params, fields, partitions, consistency_level))
+
+    def _search(self,
+                embeddings: np.ndarray,
+                top_ks: List[int],
+                metadata_filter: Optional[Dict[str, Any]],
+                read_your_writes: bool,
+                search_params: Optional[Dict[str, Any]],
+                fields: Optional[Sequence[str]],
+                partitions: Optional[Sequence[str]],
+                consistency_level: Optional[str]) -> List[List[Dict[str, Any]]]:
+        """查询数超过 KBS_MILVUS_MAX_NQ 时按该大小分批请求，partitions 指定时只检索这些分区
+
+        fields 下推为 Milvus 的 output_fields；使用外部 chunk 存储时 metadata 和 content 在检索后
+        一次读取。索引有损且集合保存 float32 向量时，rerank_factor 大于 1 则每个查询召回
+        top_k * rerank_factor 个候选并返回其向量，在本地按精确距离重排。
+        外部 chunk 存储匹配的 id 过多无法下推时，按匹配比例放大 limit，召回后只保留匹配的 id，
+        过滤条件很稀疏时结果可能少于 top_k。
+        """
+        fields = payload_fields(fields)
+        search_kwargs = {}
+        if consistency_level:
+            search_kwargs["consistency_level"] = consistency_level
+        elif read_your_writes:
+            search_kwargs["consistency_level"] = "Session"
+        milvus_connections.ensure_loaded(self.alias, self.collection)
+        partition_names, scope_expr = self._scope(partitions)
+        filter_expr, allowed = self._filter_expr(metadata_filter)
+        if filter_expr == MATCH_NOTHING or partition_names == []:
+            return [[] for _ in top_ks]
+        oversample = 1
+        if allowed is not None:
+            total = max(self.chunk_store.stats()["rows"], len(allowed))
+            oversample = 2 * -(-total // len(allowed))
+            allowed = set(allowed.tolist())
+        filter_expr = self._scoped(" && ".join(expr for expr in (scope_expr, filter_expr) if expr) or None)
+        if partition_names is not None:
+            search_kwargs["partition_names"] = partition_names
+
+        # 检索参数按集合上实际使用的索引推导，search_params 中的 nprobe/ef 优先
+        plan = self.current_index()
+        rerank = self.rerank_factor > 1 and plan.is_lossy and not self.float16
+        # 外部 chunk 存储的集合中只有 doc_id 可以直接返回
+        external_fields = [name for name in fields if name != "doc_id"] if self.chunk_store is not None else []
+        output_fields = [name for name in fields if name not in external_fields] + ["id"]
+        if rerank:
+            output_fields = output_fields + ["embedding"]
+        max_nq = settings.milvus.max_nq
+        all_hits: List[List[Dict[str, Any]]] = []
+        for start in range(0, len(embeddings), max_nq):
+            batch = embeddings[start:start + max_nq]
+            batch_top_ks = top_ks[start:start + max_nq]
+            limit = max(batch_top_ks)
+            if limit <= 0:
+                all_hits.extend([] for _ in batch_top_ks)
+                continue
+            if rerank:
+                limit = limit * self.rerank_factor
+            limit = min(MAX_SEARCH_LIMIT, limit * oversample)
+            # float32 查询向量以数组直接传入，由 pymilvus 按行序列化；
+            # 一批共用最大的 limit，再按各自的 top_k 截断
+            results = self.collection.search(
+                data=self._to_field(batch) if self.float16 else batch,
+                anns_field="embedding",
+                param={"metric_type": "L2", "params": plan.search_params(limit, search_params)},
+                limit=limit,
+                expr=filter_expr,
+                output_fields=output_fields,
+                **search_kwargs
+            )
+
+            # 格式化结果
+            for query, hits, k in zip(batch, results, batch_top_ks):
+                hits = list(hits)
+                if allowed is not None:
+                    hits = [hit for hit in hits if hit.entity.get("id") in allowed]
+                formatted = [
+                    {"score": float(hit.score), **{name: hit.entity.get(name) for name in output_fields
+                                                   if name != "embedding"}}
+                    for hit in (hits if rerank else hits[:k])
+                ]
+                if rerank and formatted:
+                    vectors = np.stack([self._from_field(hit.entity.get("embedding")) for hit in hits])
+                    formatted = rerank_hits(np.asarray(query, dtype=np.float32), formatted, vectors, k)
+                all_hits.append(formatted)
+
+        if external_fields:
+            # 所有查询的命中一次读取正文，读取前已被删除的行跳过
+            payloads = self.chunk_store.get({hit["id"] for hits in all_hits for hit in hits}, external_fields)
+            all_hits = [[{**hit, **payloads[hit["id"]]} for hit in hits if hit["id"] in payloads]
+                        for hits in all_hits]
+        return all_hits
+
+    def _filter_expr(self, metadata_filter: Optional[Filter]) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """把元数据过滤条件转换为 Milvus 表达式
+
+        提升的键比较标量字段；其余的键在集合内联元数据时比较 JSON 字段，
+        使用外部 chunk 存储时先在 chunk 存储中得到匹配的 id，不超过 MAX_PUSHDOWN_IDS 个时下推为
+        id in [...]，否则作为第二个返回值交给调用方在本地过滤。
+
+        Returns:
+            (表达式, 需要调用方本地过滤的 id 或 None)
+        """
+        scalar, residual = split_promoted(metadata_filter, self.promoted_metadata)
+        parts = [milvus_expr(scalar, self.promoted_metadata)]
+        allowed = None
+        if residual and self.chunk_store is None:
+            parts.append(milvus_expr(residual))
+        elif residual:
+            allowed = self.chunk_store.match_ids(residual)
+            if len(allowed) == 0:
+                return MATCH_NOTHING, None
+            if len(allowed) <= MAX_PUSHDOWN_IDS:
+                parts.append(f"id in {allowed.tolist()}")
+                allowed = None
+        return " && ".join(part for part in parts if part) or None, allowed
+
+    def match_ids(self, metadata_filter: Optional[Filter], partitions: Optional[Sequence[str]] = None) -> np.ndarray:
+        return self._retrying(partial(self._match_ids, metadata_filter, partitions))
+
+    def _match_ids(self, metadata_filter: Optional[Filter], partitions: Optional[Sequence[str]]) -> np.ndarray:
+        partition_names, scope_expr = self._scope(partitions)
+        filter_expr, allowed = self._filter_expr(metadata_filter)
+        if filter_expr == MATCH_NOTHING or partition_names == []:
+            return np.empty(0, dtype=np.int64)
+        filter_expr = " && ".join(expr for expr in (scope_expr, filter_expr) if expr) or None
+        ids = self._query_ids(filter_expr, partition_names)
+        return ids if allowed is None else np.intersect1d(ids, allowed)
+
+    def _query_ids(self, expr: Optional[str], partition_names: Optional[List[str]] = None) -> np.ndarray:
+        milvus_connections.ensure_loaded(self.alias, self.collection)
+        return _query_all_ids(self.collection, self._scoped(expr) or "id >= 0", partition_names)
+
+    def fetch(self, ids: Iterable[int], fields: Optional[Sequence[str]] = None) -> Dict[int, Dict[str, Any]]:
+        ids = [int(i) for i in ids]
+        fields = payload_fields(fields)
+        if self.chunk_store is not None:
+            return self.chunk_store.get(ids, fields)
+        milvus_connections.ensure_loaded(self.alias, self.collection)
+        output_fields = ["id"] + list(fields)
+        payloads = {}
+        for start in range(0, len(ids), FETCH_BATCH):
+            batch = ids[start:start + FETCH_BATCH]
+            rows = self._retrying(lambda: self.collection.query(expr=self._scoped(f"id in {batch}"),
+                                                                output_fields=output_fields))
+            for row in rows:
+                payloads[row["id"]] = {name: row.get(name) for name in output_fields}
+        return payloads
+
+    def iter_embeddings(self, batch_size: int = 10000) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        milvus_connections.ensure_loaded(self.alias, self.collection)
+        for rows in _iter_query(self.collection, self._scoped("id >= 0"), ["id", "embedding"], batch_size=batch_size):
+            yield _ids_of(rows), np.stack([self._from_field(row["embedding"]) for row in rows])
+
+    def delete_by_ids(self, ids: Iterable[int]) -> int:
+        ids = [int(i) for i in ids]
+        count = 0
+        # 分批删除，避免表达式长度随 id 数量无限增长
+        for start in range(0, len(ids), FETCH_BATCH):
+            count += self._delete_entities(f"id in {ids[start:start + FETCH_BATCH]}")
+        if self.chunk_store is not None:
+            self.chunk_store.delete(ids)
+        return count
+
+    def delete_by_doc_id(self, doc_id: str) -> int:
+        partition_name = None
+        if self.partitioner is not None and self.partitioner.by == "doc_hash":
+            # 文档只可能在它的哈希桶中，删除只扫描这一个分区
+            names, _ = self._scope([doc_id])
+            if not names:
+                return 0
+            partition_name = names[0]
+        count = self._delete_entities(f"doc_id == {milvus_literal(doc_id)}", partition_name)
+        if self.chunk_store is not None:
+            self.chunk_store.delete_doc(doc_id)
+        return count
+
+    def delete_by_metadata(self, metadata_filter: Filter) -> int:
+        if not metadata_filter:
+            return 0
+        if self.chunk_store is not None:
+            return self.delete_by_ids(self.match_ids(metadata_filter))
+        filter_expr, _ = self._filter_expr(metadata_filter)
+        return 0 if filter_expr == MATCH_NOTHING else self._delete_entities(filter_expr)
+
+    def drop_partition(self, value: str) -> np.ndarray:
+        """删除取值对应的整个分区，返回其中行的主键，供调用方同步 BM25 索引"""
+        if self.partitioner is None:
+            raise ValueError(f"Collection {self.collection_name} is not partitioned")
+        if self.partitioner.by == "doc_hash":
+            raise ValueError("doc_hash partitions are shared by many documents, delete documents by doc_id")
+        names, _ = self._scope([value])
+        if not names:
+            return np.empty(0, dtype=np.int64)
+        ids = self._query_ids(None, names)
+        with index_locks.writes(self.index_key):
+            # 已加载的分区不能删除，先释放
+            self.collection.partition(names[0]).release()
+            self.collection.drop_partition(names[0])
+            index_locks.record(self.index_key, {"op": "drop_partition", "partition": names[0]})
+        with self._partition_lock:
+            self._partitions.discard(names[0])
+        if self.chunk_store is not None:
+            self.chunk_store.delete(ids)
+        return ids
+
+    def drop(self) -> int:
+        """删除本知识库的全部数据：共享集合中按 kb_id 删除，独占的集合直接删除"""
+        if self.kb_id is not None:
+            count = self._delete_entities("id >= 0")
+        else:
+            count = self.num_rows()
+            current_name, versions = self._physical_collections()
+            if current_name != self.collection_name:
+                utility.drop_alias(self.collection_name, using=self.alias)
+            for name in {current_name, *versions.values()}:
+                utility.drop_collection(name, using=self.alias)
+            milvus_connections.invalidate(self.alias, self.collection_name)
+        if self.chunk_store is not None:
+            chunk_stores.remove(self.chunk_store.path)
+        return count
+
+    def _delete_entities(self, expr: str, partition_name: Optional[str] = None) -> int:
+        """删除符合条件的实体
+
+        Args:
+            expr: 删除条件表达式
+            partition_name: 只在该分区中删除
+
+        Returns:
+            int: 删除的实体数量
+        """
+        return self._retrying(partial(self._delete_expr, self._scoped(expr), partition_name))
+
+    def _delete_expr(self, expr: str, partition_name: Optional[str]) -> int:
+        milvus_connections.ensure_loaded(self.alias, self.collection)
+        # 先查询匹配的实体数量
+        partition_names = [partition_name] if partition_name else None
+        count = self.collection.query(expr=expr, output_fields=["count(*)"],
+                                      partition_names=partition_names)[0]["count"]
+        if count > 0:
+            with index_locks.writes(self.index_key):
+                self.collection.delete(expr, partition_name=partition_name)
+                index_locks.record(self.index_key, {"op": "delete", "expr": expr, "partition": partition_name})
+        return count
@@ -0,0 +1,249 @@
+import time
+import atexit
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from sbk.config import config as settings
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """单个集合的写缓冲
+
+    add 只把行放进内存，累计行数或字节数超过阈值、最早的行等待超过 flush_interval，
+    或调用方显式 flush 时，才按 max_batch_bytes 切分成多次 insert 发出，
+    避免每次写入都产生一个小 segment，同时保证单个请求不超过 gRPC 消息上限。
+    """
+
+    def __init__(self,
+                 name: str,
+                 insert_fn: Callable[[List[Any]], Any],
+                 max_rows: int = 2048,
+                 max_bytes: int = 32 * 1024 * 1024,
+                 max_batch_bytes: int = 16 * 1024 * 1024,
+                 flush_interval: float = 1.0,
+                 on_insert: Optional[Callable[[List[Any], Any], None]] = None):
+        """
+        Args:
+            name: 缓冲名称，一般为集合名
+            insert_fn: 实际写入一批行的函数，返回值会传给 on_insert
+            max_rows: 缓冲行数达到该值时立即写入
+            max_bytes: 缓冲字节数达到该值时立即写入
+            max_batch_bytes: 单次 insert 的字节上限
+            flush_interval: 最早一行最多在缓冲中停留的秒数
+            on_insert: 每次 insert 成功后的回调，参数为写入的行和 insert_fn 的返回值；
+                回调抛出异常时该批视为未写入，留在缓冲中重试，回调需要先撤销 insert 的效果
+        """
+        self.name = name
+        self.insert_fn = insert_fn
+        self.max_rows = max(1, max_rows)
+        self.max_bytes = max_bytes
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self.on_insert = on_insert
+        self._rows: List[Any] = []
+        self._sizes: List[int] = []
+        self._bytes = 0
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        # 保证各批次按提交顺序写入
+        self._flush_lock = threading.Lock()
+        self._stats = {"rows": 0, "inserts": 0, "flushes": 0, "errors": 0}
+
+    def bind(self,
+             insert_fn: Callable[[List[Any]], Any],
+             on_insert: Optional[Callable[[List[Any], Any], None]] = None):
+        """换成新的写入函数和回调，之后开始的 flush 使用它们"""
+        with self._lock:
+            self.insert_fn = insert_fn
+            self.on_insert = on_insert
+
+    def add(self, rows: List[Any], sizes: List[int]):
+        """放入一批行，sizes 为每行估算的字节数"""
+        with self._lock:
+            if self._oldest is None and rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            self._sizes.extend(sizes)
+            self._bytes += sum(sizes)
+            full = len(self._rows) >= self.max_rows or (self.max_bytes and self._bytes >= self.max_bytes)
+        if full:
+            self.flush()
+
+    def discard(self, predicate: Callable[[Any], bool]) -> int:
+        """丢弃缓冲中满足 predicate 的行，返回丢弃行数
+
+        先等待进行中的 flush 结束，失败时放回缓冲的行也会被检查。
+        """
+        with self._flush_lock, self._lock:
+            keep = [i for i, row in enumerate(self._rows) if not predicate(row)]
+            discarded = len(self._rows) - len(keep)
+            if discarded:
+                self._rows = [self._rows[i] for i in keep]
+                self._sizes = [self._sizes[i] for i in keep]
+                self._bytes = sum(self._sizes)
+                if not self._rows:
+                    self._oldest = None
+        return discarded
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def flush_if_stale(self):
+        with self._lock:
+            stale = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_interval
+        if stale:
+            self.flush()
+
+    def flush(self) -> int:
+        """把缓冲中的行全部写出，返回写入行数；失败时未写入的行留在缓冲中"""
+        with self._flush_lock:
+            with self._lock:
+                rows, sizes = self._rows, self._sizes
+                self._rows, self._sizes, self._bytes, self._oldest = [], [], 0, None
+                insert_fn, on_insert = self.insert_fn, self.on_insert
+            if not rows:
+                return 0
+
+            written = 0
+            try:
+                for start, end in self._split(sizes):
+                    result = insert_fn(rows[start:end])
+                    if on_insert:
+                        on_insert(rows[start:end], result)
+                    written = end
+                    self._stats["inserts"] += 1
+                    self._stats["rows"] += end - start
+            except Exception:
+                self._stats["errors"] += 1
+                with self._lock:
+                    self._rows = rows[written:] + self._rows
+                    self._sizes = sizes[written:] + self._sizes
+                    self._bytes = sum(self._sizes)
+                    self._oldest = time.monotonic()
+                raise
+            self._stats["flushes"] += 1
+            return written
+
+    def _split(self, sizes: List[int]) -> List[tuple]:
+        """按单次 insert 字节上限切分，返回 (start, end) 列表"""
+        batches = []
+        start = 0
+        nbytes = 0
+        for i, size in enumerate(sizes):
+            if i > start and nbytes + size > self.max_batch_bytes:
+                batches.append((start, i))
+                start, nbytes = i, 0
+            nbytes += size
+        batches.append((start, len(sizes)))
+        return batches
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "pending_rows": len(self._rows), "pending_bytes": self._bytes}
+
+
+class WriteBufferRegistry:
+    """按集合名共享写缓冲，后台线程按时间阈值写出，进程退出前全部写出
+
+    缓冲在进程内长期存在，每次 get 都把写入函数和回调换成调用方当前的向量库，
+    flush 时使用最近一次绑定的，不会写入已经删除的旧向量库实例。
+    """
+
+    def __init__(self,
+                 max_rows: int = 2048,
+                 max_bytes: int = 32 * 1024 * 1024,
+                 max_batch_bytes: int = 16 * 1024 * 1024,
+                 flush_interval: float = 1.0):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_batch_bytes = max_batch_bytes
+        self.flush_interval = flush_interval
+        self._buffers: Dict[str, WriteBuffer] = {}
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        atexit.register(self.close)
+
+    def get(self,
+            name: str,
+            insert_fn: Callable[[List[Any]], Any],
+            on_insert: Optional[Callable[[List[Any], Any], None]] = None) -> WriteBuffer:
+        """获取集合的写缓冲，不存在时创建，已存在时绑定新的 insert_fn 和 on_insert"""
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is not None:
+                buffer.bind(insert_fn, on_insert)
+            else:
+                buffer = WriteBuffer(
+                    name,
+                    insert_fn,
+                    max_rows=self.max_rows,
+                    max_bytes=self.max_bytes,
+                    max_batch_bytes=self.max_batch_bytes,
+                    flush_interval=self.flush_interval,
+                    on_insert=on_insert,
+                )
+                self._buffers[name] = buffer
+            self._ensure_flusher()
+            return buffer
+
+    def drop(self, name: str, flush: bool = True) -> int:
+        """移除集合的写缓冲，flush 为 False 时丢弃尚未写出的行（集合即将删除时），返回丢弃行数"""
+        with self._lock:
+            buffer = self._buffers.pop(name, None)
+        if buffer is None:
+            return 0
+        if flush:
+            buffer.flush()
+            return 0
+        return buffer.discard(lambda row: True)
+
+    def _ensure_flusher(self):
+        if self._flusher is not None or self.flush_interval <= 0:
+            return
+
+        def run():
+            interval = max(0.05, self.flush_interval / 2)
+            while not self._stopped.wait(interval):
+                with self._lock:
+                    buffers = list(self._buffers.values())
+                for buffer in buffers:
+                    try:
+                        buffer.flush_if_stale()
+                    except Exception as e:
+                        logger.error("Background flush of %s failed: %s", buffer.name, str(e))
+
+        self._flusher = threading.Thread(target=run, daemon=True, name="write-buffer-flusher")
+        self._flusher.start()
+
+    def flush_all(self):
+        with self._lock:
+            buffers = list(self._buffers.values())
+        for buffer in buffers:
+            try:
+                buffer.flush()
+            except Exception as e:
+                logger.error("Flush of %s failed: %s", buffer.name, str(e))
+
+    def close(self):
+        """停止后台线程并写出所有缓冲"""
+        self._stopped.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: buffer.stats() for name, buffer in self._buffers.items()}
+
+# 全局写缓冲注册表
+write_buffers = WriteBufferRegistry(
+    max_rows=settings.write_buffer.max_rows,
+    max_bytes=settings.write_buffer.max_bytes,
+    max_batch_bytes=settings.write_buffer.max_batch_bytes,
+    flush_interval=settings.write_buffer.flush_interval,
+)
@@ -35,4 +35,10 @@ class KnowledgeBase(Base):
         return self.config.get("api", {
             "api_key": None,
             "base_url": None
-        }) 
\ No newline at end of file
+        })
+
+    @property
+    def cache_config(self):
+        return self.config.get("cache", {
+            "search_results": True
+        })
@@ -1,10 +1,12 @@
-from typing import Optional, Union
-from pydantic import BaseModel, Field
+from typing import Any, Literal, Optional, Union
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from sbk.core.metadata_filter import check_promoted, parse_filter
 
 class EmbeddingConfig(BaseModel):
     type: str = Field(
         default="sentence_transformer",
-        description="embedding类型，支持 sentence_transformer 和 openai"
+        description="embedding类型，支持 sentence_transformer、openai 和 onnx"
     )
     model_name: str = Field(
         default="all-MiniLM-L6-v2",
@@ -18,6 +20,20 @@ class EmbeddingConfig(BaseModel):
         default=None,
         description="API基础URL，当type为openai时可选"
     )
+    dim: Optional[int] = Field(
+        default=None,
+        description="向量维度，当type为openai时可选，默认1024",
+        gt=0
+    )
+    quantize: Optional[bool] = Field(
+        default=None,
+        description="是否使用动态int8量化模型，当type为onnx时可选，默认开启"
+    )
+    num_threads: Optional[int] = Field(
+        default=None,
+        description="onnxruntime推理线程数，当type为onnx时可选",
+        gt=0
+    )
 
 class RetrievalConfig(BaseModel):
     type: str = Field(
@@ -47,11 +63,90 @@ class APIConfig(BaseModel):
         description="API基础URL"
     )
 
+class CacheConfig(BaseModel):
+    search_results: bool = Field(
+        default=True,
+        description="是否缓存检索结果，写入或删除数据后缓存自动失效"
+    )
+
+class VectorStoreConfig(BaseModel):
+    type: Optional[Literal["milvus", "faiss"]] = Field(
+        default=None,
+        description="向量库后端：milvus 或 faiss，默认取 KBS_VECTOR_STORE"
+    )
+    precision: Optional[Literal["float32", "float16", "sq8", "pq"]] = Field(
+        default=None,
+        description="向量存储精度，默认取 KBS_VECTOR_PRECISION；Milvus 集合创建后不能在 float32 和 float16 之间切换"
+    )
+    rerank_factor: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="有损索引的候选倍数，候选用全精度向量重排，默认取 KBS_VECTOR_RERANK_FACTOR"
+    )
+    chunk_store: Optional[Literal["inline", "external"]] = Field(
+        default=None,
+        description="chunk 正文和元数据的存放位置，默认取 KBS_CHUNK_STORE；Milvus 集合创建后不能更改"
+    )
+    promoted_metadata: Optional[dict[str, Literal["varchar", "int64", "double", "bool"]]] = Field(
+        default=None,
+        description="提升为带索引标量字段的元数据键及其类型，如 {\"source\": \"varchar\", \"page\": \"int64\"}；"
+                    "Milvus 集合创建后不能更改，FAISS 为这些键建立表达式索引"
+    )
+
+    partition_by: Optional[Literal["doc_hash", "metadata", "ingest_date"]] = Field(
+        default=None,
+        description="Milvus 集合的分区方式：doc_hash 按 doc_id 哈希分桶，metadata 按 partition_key 元数据的取值（如租户），"
+                    "ingest_date 按写入日期；不填不分区，集合写入数据后不能更改"
+    )
+    partition_key: Optional[str] = Field(
+        default=None,
+        description="按元数据分区时使用的元数据键"
+    )
+    partition_buckets: Optional[int] = Field(
+        default=None,
+        ge=1,
+        le=1024,
+        description="按 doc_id 哈希分区时的桶数，默认取 KBS_PARTITION_BUCKETS"
+    )
+    partition_granularity: Optional[Literal["day", "month"]] = Field(
+        default=None,
+        description="按写入日期分区时的粒度，默认取 KBS_PARTITION_GRANULARITY"
+    )
+    layout: Optional[Literal["per_kb", "shared"]] = Field(
+        default=None,
+        description="Milvus 集合的组织方式：per_kb 独占集合，shared 与同维度、同精度的知识库共用以 kb_id 为分区键的集合；"
+                    "默认取 KBS_COLLECTION_LAYOUT，创建知识库时确定，共享集合的名称和向量维度同时写入知识库配置"
+    )
+
+    @model_validator(mode="after")
+    def check_partitioning(self) -> "VectorStoreConfig":
+        """按元数据分区须指定 partition_key，分区只支持 Milvus；共享集合不能再按知识库分区或提升元数据"""
+        if self.partition_by == "metadata" and not self.partition_key:
+            raise ValueError("partition_by为metadata时必须指定partition_key")
+        if self.partition_by and self.type == "faiss":
+            raise ValueError("FAISS向量库不支持分区")
+        if self.layout == "shared" and (self.type == "faiss" or self.partition_by or self.promoted_metadata):
+            raise ValueError("共享集合只支持Milvus，且不能与partition_by、promoted_metadata同时使用")
+        return self
+
+    @field_validator("promoted_metadata")
+    @classmethod
+    def check_promoted_metadata(cls, value):
+        return check_promoted(value) if value is not None else None
+
 class KnowledgeBaseConfig(BaseModel):
     embedding: EmbeddingConfig = Field(
         default_factory=EmbeddingConfig,
         description="Embedding配置"
     )
+    vector_store: VectorStoreConfig = Field(
+        default_factory=VectorStoreConfig,
+        description="向量库配置"
+    )
+    cache: CacheConfig = Field(
+        default_factory=CacheConfig,
+        description="缓存配置"
+    )
 
 class SearchRequest(BaseModel):
     query: Union[str, list] = Field(..., description="搜索查询")
@@ -63,8 +158,49 @@ class SearchRequest(BaseModel):
     api_config: Optional[APIConfig] = Field(
         default_factory=APIConfig,
         description="API配置"
-    ) 
+    )
+    recall_tier: Optional[Literal["fast", "balanced", "max"]] = Field(
+        default=None,
+        description="召回档位，按校准表选择满足该档位召回率的最快检索参数"
+    )
+    latency_budget_ms: Optional[float] = Field(
+        default=None,
+        gt=0,
+        description="向量检索的 p99 延迟预算（毫秒），按校准表选择预算内召回率最高的检索参数"
+    )
+    fields: Optional[list[Literal["id", "score", "doc_id", "metadata", "content"]]] = Field(
+        default=None,
+        description="结果中返回的字段，id 和 score 总是返回，不填返回全部；只取 id 时可随后调用 chunks 接口批量读取正文"
+    )
+    metadata_filter: Optional[dict[str, Any]] = Field(
+        default=None,
+        description="元数据过滤条件，各键之间为且关系；值为标量表示等于，为列表表示属于其中之一，"
+                    "也可以是 {\"gte\": 3, \"lt\": 10} 这样的操作符字典（eq/ne/gt/gte/lt/lte/in/nin）"
+    )
+
+    partitions: Optional[list[str]] = Field(
+        default=None,
+        min_length=1,
+        description="只检索这些分区：按 doc_id 分区时为文档 id，按元数据分区时为该键的取值，"
+                    "按写入日期分区时为 YYYY-MM-DD 或 YYYY-MM；知识库须开启分区"
+    )
+
+    @field_validator("metadata_filter")
+    @classmethod
+    def check_metadata_filter(cls, value):
+        parse_filter(value)
+        return value
+
+    @model_validator(mode="after")
+    def check_top_k(self) -> "SearchRequest":
+        """单个查询只能指定一个 top_k，批量查询的 top_k 列表须与查询一一对应"""
+        if isinstance(self.top_k, list):
+            if isinstance(self.query, str):
+                raise ValueError("top_k为列表时query必须为列表")
+            if len(self.top_k) != len(self.query):
+                raise ValueError("top_k列表长度必须与query列表长度相同")
+        return self
 
 class Query(BaseModel):
     query: Union[str, list] = Field(..., description="用户查询")
-    embeddings: Union[list, list[list[float]], None] = Field(default=None, description="查询的embedding")
\ No newline at end of file
+    embeddings: Optional[Any] = Field(default=None, description="查询的embedding，形状为 (查询数, dim) 的 float32 数组")
\ No newline at end of file
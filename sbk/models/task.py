@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, DateTime, Text, JSON
+from sbk.core.database import Base
+
+class TaskRecord(Base):
+    __tablename__ = "tasks"
+
+    task_id = Column(String(64), primary_key=True)
+    task_type = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False, index=True)  # 任务状态：pending, running, completed, failed
+    stage = Column(String(50))  # 当前执行阶段
+    progress = Column(JSON, nullable=False, default={})  # 各阶段的计数
+    result = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime, index=True)  # 按完成时间清理过期任务
+    heartbeat_at = Column(DateTime, index=True)  # 所属进程最近一次确认任务仍在执行的时间
@@ -1,6 +1,8 @@
 import os
 import uuid
-from typing import List, Dict
+from typing import List, Dict, Tuple, Optional, Callable, Iterable, Iterator
+
+import numpy as np
 from werkzeug.datastructures import FileStorage
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import (
@@ -10,7 +12,11 @@ from langchain_community.document_loaders import (
 )
 import logging
 
+from sbk.config import config as settings
+from sbk.core.pipeline import batched, prefetch
 from sbk.core.embeddings.factory import EmbeddingFactory
+from sbk.core.embeddings.cache import embedding_cache
+from sbk.core.exceptions import VectorStoreError
 
 # 配置日志记录
 logging.basicConfig(level=logging.DEBUG)
@@ -23,8 +29,8 @@ class DocumentService:
         self.vector_store_path = vector_store_path
         self.SUPPORTED_EXTENSIONS = {'.pdf', '.docx', '.txt'}
         self.embedding_config = config.get("embedding")
+        self.vector_store_config = config.get("vector_store")
         logger.debug(f"kb_id: {self.kb_id}, embedding_config: {self.embedding_config}")
-        self.embedding_model = EmbeddingFactory.create(self.embedding_config)
         logger.debug("DocumentService initialized with store paths: %s, %s", document_store_path, vector_store_path)
         
     def process_document(self, file: FileStorage) -> str:
@@ -36,6 +42,18 @@ class DocumentService:
         Returns:
             str: 文档ID
         """
+        doc_id, file_path = self.save_upload(file)
+        return self.ingest(doc_id, file_path, file.filename)
+
+    def save_upload(self, file: FileStorage) -> Tuple[str, str]:
+        """校验并保存上传的文件，供后台任务稍后处理
+        
+        Args:
+            file: 上传的文件对象
+            
+        Returns:
+            Tuple[str, str]: 文档ID和保存路径
+        """
         logger.debug("Processing document: %s", file.filename)
         doc_id = str(uuid.uuid4())
         logger.debug("Generated document ID: %s", doc_id)
@@ -50,19 +68,42 @@ class DocumentService:
         file_path = os.path.join(self.document_store_path, f'{doc_id}{ext}')
         logger.debug("Saving file to: %s", file_path)
         file.save(file_path)
+        return doc_id, file_path
+
+    def ingest(self,
+               doc_id: str,
+               file_path: str,
+               filename: str,
+               progress: Optional[Callable[..., None]] = None) -> str:
+        """流式解析、分段、向量化并写入已保存的文档，完成后删除临时文件
+        
+        按页加载 → 分段 → 分批向量化 → 分批写入，各阶段在独立线程中并行执行，
+        阶段之间通过有界队列传递批次，内存占用不随文档大小增长。
         
+        Args:
+            doc_id: 文档ID
+            file_path: save_upload 返回的保存路径
+            filename: 原始文件名
+            progress: 进度回调，参数为阶段名和该阶段的计数
+            
+        Returns:
+            str: 文档ID
+        """
+        progress = progress or (lambda stage, **counts: None)
+        ext = os.path.splitext(file_path)[1].lower()
+        batch_size = settings.ingest.batch_size
+        queue_size = settings.ingest.queue_size
+        counts = {"pages_parsed": 0, "chunks_split": 0, "chunks_embedded": 0, "rows_inserted": 0}
         try:
             # 加载文档
             logger.debug("Loading document...")
+            progress("parsing", **counts)
             if ext == '.pdf':
                 loader = PyPDFLoader(file_path)
             elif ext == '.docx':
                 loader = Docx2txtLoader(file_path)
             else:
                 loader = UnstructuredFileLoader(file_path)
-                
-            documents = loader.load()
-            logger.debug("Loaded %d documents", len(documents))
             
             # 文本分段
             text_splitter = RecursiveCharacterTextSplitter(
@@ -70,18 +111,61 @@ class DocumentService:
                 chunk_overlap=200,
                 length_function=len,
             )
-            splits = text_splitter.split_documents(documents)
-            logger.debug("Split documents into %d chunks", len(splits))
-            
+
+            def split_pages() -> Iterator:
+                for page in loader.lazy_load():
+                    counts["pages_parsed"] += 1
+                    for chunk in text_splitter.split_documents([page]):
+                        # 各加载器都以保存路径作为 source，这里显式写入，写入失败时按它清理本次写入的行
+                        chunk.metadata["source"] = file_path
+                        counts["chunks_split"] += 1
+                        yield chunk
+                    progress("parsing", pages_parsed=counts["pages_parsed"], chunks_split=counts["chunks_split"])
+
+            def embed_batches(batches: Iterable[List]) -> Iterator[Tuple[List, np.ndarray]]:
+                with EmbeddingFactory.acquire(self.embedding_config) as embedding_model:
+                    for chunks in batches:
+                        texts = [chunk.page_content for chunk in chunks]
+                        # 只有缓存未命中的 chunk 才会真正调用模型
+                        embeddings = embedding_cache.embed_documents(embedding_model, self.embedding_config, texts)
+                        counts["chunks_embedded"] += len(chunks)
+                        progress("embedding", chunks_embedded=counts["chunks_embedded"])
+                        yield chunks, embeddings
+
             # 向量化存储
             from sbk.services.vector_service import VectorService
-            texts = [chunk.page_content for chunk in splits]
-            embeddings = self.embedding_model.embed_documents(texts=texts)
-            metadatas = [chunk.metadata for chunk in splits]
-            doc_ids = [file.filename for _ in range(len(texts))]
-            vector_service = VectorService(collection_name=f"collection_kb_{self.kb_id}", dim=len(embeddings[0]))
-            vector_service.add_documents(embeddings=embeddings, contents=texts, metadatas=metadatas, doc_ids=doc_ids)
-            logger.debug("Added documents to vector service with ID: %s", doc_id)
+            chunk_batches = prefetch(batched(split_pages(), batch_size), queue_size, name=f"ingest-split-{doc_id[:8]}")
+            embedded = prefetch(embed_batches(chunk_batches), queue_size, name=f"ingest-embed-{doc_id[:8]}")
+            vector_service = None
+            try:
+                for chunks, embeddings in embedded:
+                    if vector_service is None:
+                        vector_service = VectorService(
+                            collection_name=f"collection_kb_{self.kb_id}",
+                            dim=embeddings.shape[1],
+                            vector_store_path=self.vector_store_path,
+                            vector_store=self.vector_store_config,
+                            kb_id=self.kb_id,
+                        )
+                    vector_service.add_documents(
+                        embeddings=embeddings,
+                        contents=[chunk.page_content for chunk in chunks],
+                        metadatas=[chunk.metadata for chunk in chunks],
+                        doc_ids=[filename] * len(chunks),
+                    )
+                    counts["rows_inserted"] += len(chunks)
+                    progress("inserting", rows_inserted=counts["rows_inserted"])
+
+                if vector_service is None:
+                    logger.warning("Document %s produced no chunks", filename)
+                else:
+                    # 任务结束前写出缓冲，完成状态意味着数据已写入 Milvus
+                    vector_service.flush()
+            except Exception:
+                if vector_service is not None:
+                    self._remove_partial(vector_service, file_path)
+                raise
+            logger.debug("Added %d chunks to vector service with ID: %s", counts["rows_inserted"], doc_id)
             
             return doc_id
             
@@ -90,6 +174,25 @@ class DocumentService:
             # 清理临时文件
             os.remove(file_path)
             
+    def _remove_partial(self, vector_service, file_path: str):
+        """删除写入中途失败的文档仍在写缓冲中和已经写入的行，避免留下不完整的文档
+
+        按 source 删除只影响本次上传，同名文件之前上传的行不受影响。缓冲中的行先丢弃，
+        不再写出：入库往往正是因为写入失败，重新写出会再次失败并被后台线程稍后写入。
+        已写入的行无法删除时抛出异常，任务以失败结束并报告残留的行。
+        """
+        source_filter = {"source": file_path}
+        discarded = vector_service.discard_pending(source_filter)
+        try:
+            removed = vector_service.delete_by_metadata(source_filter)
+        except Exception as e:
+            logger.error("Failed to remove partially ingested document %s: %s", file_path, str(e))
+            raise VectorStoreError(
+                f"Ingest failed and rows already written for {file_path} could not be removed: {str(e)}"
+            ) from e
+        logger.info("Discarded %d buffered and removed %d written rows of partially ingested document %s",
+                    discarded, removed, file_path)
+
     def get_document_metadata(self, doc_id: str) -> Dict:
         """获取文档元数据
         
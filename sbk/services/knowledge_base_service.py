@@ -1,4 +1,5 @@
 import os
+import shutil
 from sqlalchemy.orm import Session
 from sbk.models.knowledge_base import KnowledgeBase
 
@@ -41,14 +42,26 @@ class KnowledgeBaseService:
         return self.db.query(KnowledgeBase).offset(skip).limit(limit).all()
 
     def delete_knowledge_base(self, kb_id: int):
-        """删除知识库"""
+        """删除知识库
+
+        先删除向量库中的数据：独占的 Milvus 集合直接删除，共享集合按 kb_id 删除。
+        SQLite 会复用已删除的 ID，向量数据删除失败时保留知识库记录，避免新知识库看到残留的行。
+        """
         kb = self.get_knowledge_base(kb_id)
         if kb:
+            from sbk.services.vector_service import VectorService
+            vector_service = VectorService(
+                collection_name=f"collection_kb_{kb.id}",
+                vector_store_path=kb.vector_store_path,
+                vector_store=(kb.config or {}).get("vector_store"),
+                kb_id=kb.id,
+            )
+            vector_service.drop()
             # 删除文件夹
             if os.path.exists(kb.vector_store_path):
-                os.rmdir(kb.vector_store_path)
+                shutil.rmtree(kb.vector_store_path)
             if os.path.exists(kb.document_store_path):
-                os.rmdir(kb.document_store_path)
+                shutil.rmtree(kb.document_store_path)
                 
             self.db.delete(kb)
             self.db.commit()
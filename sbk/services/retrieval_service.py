@@ -1,24 +1,42 @@
-from typing import List, Dict, Optional
+import json
+from typing import List, Dict, Optional, Union
+
+import numpy as np
 from sbk.services.vector_service import VectorService
 from sbk.models.schemas import Query
 import logging  # 添加日志模块
 
 from sbk.core.embeddings.factory import EmbeddingFactory
+from sbk.core.embeddings.cache import query_embedding_cache, normalize_query
+from sbk.core.cache import LRUCache, collection_generations
+from sbk.core.bm25 import bm25_indexes
+from sbk.core.fusion import Candidates, fuse
+from sbk.core.calibration import calibration_tables, resolve_search_params, tier_oversample
+from sbk.core.vector_stores.base import payload_fields
+from sbk.config import config as settings
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 全局检索结果缓存实例
+search_result_cache = LRUCache(
+    max_entries=settings.search_cache.max_entries,
+    max_bytes=settings.search_cache.max_bytes,
+    ttl=settings.search_cache.ttl,
+)
+
 class RetrievalService:
     def __init__(self, 
                  kb_id: int,
                  retrieval_config: Optional[Dict] = None,
-                 config: Optional[Dict] = None):
+                 config: Optional[Dict] = None,
+                 vector_store_path: Optional[str] = None):
         """初始化检索服务
         
         Args:
-            vector_store_path: 向量库路径
             retrieval_config: 检索配置
             api_config: API配置
+            vector_store_path: 向量库路径，BM25 索引位于其下
         """
         self.kb_id = kb_id
         self.retrieval_config = retrieval_config or {
@@ -27,91 +45,280 @@ class RetrievalService:
             "bm25_weight": 0.3
         }
         self.config = config or {}
-        self.vector_service = VectorService(collection_name=f"collection_kb_{self.kb_id}")
-        self.embedding_model = None  # 初始化 embedding_model 属性
+        self.collection_name = f"collection_kb_{self.kb_id}"
+        self.vector_store_path = vector_store_path
+        self._vector_service: Optional[VectorService] = None
+
+    @property
+    def vector_service(self) -> VectorService:
+        """延迟连接向量库，命中检索结果缓存时不访问 Milvus"""
+        if self._vector_service is None:
+            self._vector_service = VectorService(
+                collection_name=self.collection_name,
+                vector_store_path=self.vector_store_path,
+                vector_store=self.config.get("vector_store"),
+                kb_id=self.kb_id,
+            )
+        return self._vector_service
         
-    def search(self, query: Query, top_k: int = 3) -> List[Dict]:
+    def search(self,
+               query: Query,
+               top_k: int = 3,
+               recall_tier: Optional[str] = None,
+               latency_budget_ms: Optional[float] = None,
+               fields: Optional[List[str]] = None,
+               metadata_filter: Optional[Dict] = None,
+               partitions: Optional[List[str]] = None) -> List[Dict]:
         """检索相关文档片段
         
         Args:
-            query: 查询文本
+            query: 查询文本，为列表时只检索第一个查询，批量检索请使用 search_batch
             top_k: 返回结果数量
+            recall_tier: 召回档位 fast/balanced/max
+            latency_budget_ms: 向量检索的 p99 延迟预算（毫秒）
+            fields: 结果中携带的字段（doc_id、metadata、content），None 表示全部
+            metadata_filter: 元数据过滤条件
+            partitions: 只检索这些分区取值对应的分区
             
         Returns:
             List[Dict]: 检索结果列表
         """
-        logger.debug(f"开始检索: query='{query.query}', top_k={top_k}")  # 添加日志
+        text = query.query if isinstance(query.query, str) else query.query[0]
+        return self.search_batch([text], top_k, recall_tier, latency_budget_ms, fields, metadata_filter,
+                                 partitions)[0]
+
+    def search_batch(self,
+                     queries: List[str],
+                     top_k: Union[int, List[int]] = 3,
+                     recall_tier: Optional[str] = None,
+                     latency_budget_ms: Optional[float] = None,
+                     fields: Optional[List[str]] = None,
+                     metadata_filter: Optional[Dict] = None,
+                     partitions: Optional[List[str]] = None) -> Dict[int, List[Dict]]:
+        """批量检索，所有查询一次性向量化并在一次 Milvus 请求中检索
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 返回结果数量，可以为每个查询单独指定
+            recall_tier: 召回档位，按知识库的校准表换算为 nprobe/ef 和混合检索的候选倍数
+            latency_budget_ms: 向量检索的 p99 延迟预算（毫秒），按校准表选择预算内召回率最高的参数
+            fields: 结果中携带的字段（doc_id、metadata、content），None 表示全部；score 和 id 总是返回，
+                不需要的字段不会从向量库读取
+            metadata_filter: 元数据过滤条件，写法见 metadata_filter.parse_filter；向量检索和 BM25 检索
+                都只在满足条件的 chunk 中排名
+            partitions: 分区取值（按 doc_id 分区时为文档 id，按元数据分区时为该键的取值，按写入日期分区时为
+                YYYY-MM-DD 或 YYYY-MM），指定时只检索这些分区，知识库须开启分区
+            
+        Returns:
+            Dict[int, List[Dict]]: 以查询下标为键的检索结果
+        """
+        fields = payload_fields(fields)
+        metadata_filter = metadata_filter or None
+        top_ks = [top_k] * len(queries) if isinstance(top_k, int) else list(top_k)
+        if len(top_ks) != len(queries):
+            raise ValueError("top_k列表长度必须与查询数相同")
+        logger.debug("开始检索: %d 个查询, top_k=%s", len(queries), top_k)  # 添加日志
+
+        results: Dict[int, List[Dict]] = {}
+        cache_keys = [self._result_cache_key(text, k, recall_tier, latency_budget_ms, fields, metadata_filter,
+                                             partitions)
+                      for text, k in zip(queries, top_ks)]
+        misses = []
+        for i, cache_key in enumerate(cache_keys):
+            cached = search_result_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                results[i] = list(cached)
+            else:
+                misses.append(i)
+        logger.debug("命中检索结果缓存: %d/%d", len(queries) - len(misses), len(queries))
+
+        if misses:
+            query = Query(query=[queries[i] for i in misses])
+            computed = self._search(query, [top_ks[i] for i in misses], recall_tier, latency_budget_ms, fields,
+                                    metadata_filter, partitions)
+            for i, hits in zip(misses, computed):
+                if cache_keys[i] is not None:
+                    search_result_cache.set(cache_keys[i], hits)
+                results[i] = list(hits)
+        return {i: results[i] for i in range(len(queries))}
+
+    def _result_cache_key(self, text: str, top_k: int,
+                          recall_tier: Optional[str] = None,
+                          latency_budget_ms: Optional[float] = None,
+                          fields: tuple = (),
+                          metadata_filter: Optional[Dict] = None,
+                          partitions: Optional[List[str]] = None) -> Optional[tuple]:
+        """构造检索结果缓存键，版本号随向量库写入递增，因此旧结果不会被命中"""
+        if not self._caches_results():
+            return None
+        return (
+            self.kb_id,
+            collection_generations.get(self.collection_name),
+            normalize_query(text),
+            top_k,
+            json.dumps(self.retrieval_config, sort_keys=True),
+            recall_tier,
+            latency_budget_ms,
+            fields,
+            json.dumps(metadata_filter, sort_keys=True),
+            tuple(partitions) if partitions is not None else None,
+        )
+
+    def _caches_results(self) -> bool:
+        return search_result_cache.enabled and self.config.get("cache", {}).get("search_results", True)
+
+    def _search(self,
+                query: Query,
+                top_ks: List[int],
+                recall_tier: Optional[str] = None,
+                latency_budget_ms: Optional[float] = None,
+                fields: tuple = payload_fields(),
+                metadata_filter: Optional[Dict] = None,
+                partitions: Optional[List[str]] = None) -> List[List[Dict]]:
+        """执行检索，不经过结果缓存，query.query 为查询文本列表，结果只保留 fields 中的字段"""
         # 根据检索类型执行不同的检索策略
         retrieval_type = self.retrieval_config.get("type", "hybrid")
+        # BM25 索引中没有元数据的标量索引和分区，过滤条件先在向量库中换算为主键
+        allowed = None
+        if (metadata_filter or partitions is not None) and retrieval_type != "vector":
+            allowed = self.vector_service.match_ids(metadata_filter, partitions)
         
         if retrieval_type == "bm25":
-            results = self._bm25_search(query, top_k)
-        else:  # hybridx
-            if not getattr(self, "embedding_model"):
-                self.embedding_model = EmbeddingFactory.create(self.config.get("embedding"))
-            query.embeddings = self.embedding_model.embed_documents(query.query)
-            if retrieval_type == "vector":
-                results = self._vector_search(query, top_k)
-            else:
-                vector_results = self._vector_search(query, top_k)
-                bm25_results = self._bm25_search(query, top_k)
-                results = self._hybrid_merge(vector_results, bm25_results)
+            return [self._project(self._bm25_search(text, k, allowed), fields) for text, k in zip(query.query, top_ks)]
 
-        return results[:top_k]
-    
-    def _vector_search(self, query: Query, top_k: int) -> List[Dict]:
-        """执行向量检索"""
-        logger.debug(f"执行向量检索: query='{query.query}', top_k={top_k}")  # 添加日志
-        # 使用向量服务进行检索
-        results = self.vector_service.search(query=query, top_k=top_k)
+        # hybrid 和 vector 都需要查询向量，所有查询一次性计算
+        query.embeddings = self._embed_queries(query.query)
+        if retrieval_type == "vector":
+            search_params = self._search_params(max(top_ks), recall_tier, latency_budget_ms)
+            return self._vector_search(query, top_ks, search_params, fields, metadata_filter, partitions)
+
+        # 每路多召回一些候选，融合后再截取 top_k；知识库显式配置的 oversample 优先于召回档位
+        oversample = self._fusion_option("oversample")
+        if "oversample" not in self.retrieval_config:
+            oversample = tier_oversample(recall_tier, oversample)
+        candidate_ks = [k * oversample for k in top_ks]
+        search_params = self._search_params(max(candidate_ks), recall_tier, latency_budget_ms)
+        # 向量候选只取 id 和分数，融合后只为入选的结果读取需要的字段
+        vector_results = self._vector_search(query, candidate_ks, search_params, (), metadata_filter, partitions)
+        merged = [
+            self._hybrid_merge(hits, self._bm25_candidates(text, candidate_k, allowed), k)
+            for text, hits, candidate_k, k in zip(query.query, vector_results, candidate_ks, top_ks)
+        ]
+        return [self._project(hits, fields) for hits in self._attach_payloads(merged, fields)]
+
+    def _attach_payloads(self, results: List[List[Dict]], fields: tuple = payload_fields()) -> List[List[Dict]]:
+        """为缺少 fields 中字段的命中一次性读取这些字段，期间被删除的命中丢弃"""
+        def complete(hit: Dict) -> bool:
+            return all(name in hit for name in fields)
+
+        missing = {hit["id"] for hits in results for hit in hits if not complete(hit)}
+        if not missing:
+            return results
+        payloads = self.vector_service.fetch(sorted(missing), fields)
+        return [
+            [hit if complete(hit) else {**hit, **payloads[hit["id"]]}
+             for hit in hits if complete(hit) or hit["id"] in payloads]
+            for hits in results
+        ]
+
+    @staticmethod
+    def _project(hits: List[Dict], fields: tuple) -> List[Dict]:
+        """只保留 score、id 和 fields 中的字段"""
+        keep = {"score", "id", *fields}
+        return [{name: value for name, value in hit.items() if name in keep} for hit in hits]
+
+    def fetch(self, ids: List[int], fields: Optional[List[str]] = None) -> List[Dict]:
+        """按主键批量读取 chunk，结果与 ids 顺序一致，重复的主键只返回一次，不存在的主键跳过
         
-        return results
+        Args:
+            ids: chunk 主键列表，通常来自只返回 id 的检索结果
+            fields: 需要读取的字段（doc_id、metadata、content），None 表示全部
+            
+        Returns:
+            List[Dict]: chunk 列表
+        """
+        ids = list(dict.fromkeys(ids))
+        payloads = self.vector_service.fetch(ids, payload_fields(fields))
+        return [payloads[i] for i in ids if i in payloads]
     
-    def _bm25_search(self, query: Query, top_k: int) -> List[Dict]:
-        """执行BM25检索"""
-        logger.debug(f"执行BM25检索: query='{query.query}', top_k={top_k}")  # 添加日志
-        # TODO: 实现BM25检索
-        return []
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """计算查询向量，命中查询向量缓存时不会加载模型"""
+        embedding_config = self.config.get("embedding")
+
+        def compute(texts: List[str]) -> np.ndarray:
+            with EmbeddingFactory.acquire(embedding_config) as embedding_model:
+                return embedding_model.embed_documents(texts)
+
+        return query_embedding_cache.embed(embedding_config, queries, compute)
+
+    def _search_params(self, top_k: int,
+                       recall_tier: Optional[str] = None,
+                       latency_budget_ms: Optional[float] = None) -> Optional[Dict]:
+        """按召回档位和延迟预算选择 nprobe/ef，未指定时使用索引的默认参数"""
+        if recall_tier is None and latency_budget_ms is None:
+            return None
+        search_params = resolve_search_params(
+            self.vector_service.store,
+            calibration_tables.get(self.vector_store_path),
+            top_k,
+            recall_tier=recall_tier,
+            latency_budget_ms=latency_budget_ms,
+        )
+        logger.debug("检索参数: recall_tier=%s, latency_budget_ms=%s -> %s", recall_tier, latency_budget_ms, search_params)
+        return search_params
+
+    def _vector_search(self, query: Query, top_ks: List[int],
+                       search_params: Optional[Dict] = None,
+                       fields: Optional[tuple] = None,
+                       metadata_filter: Optional[Dict] = None,
+                       partitions: Optional[List[str]] = None) -> List[List[Dict]]:
+        """执行向量检索，所有查询在一次 search 请求中完成"""
+        logger.debug("执行向量检索: %d 个查询", len(top_ks))  # 添加日志
+        # 结果会进入缓存时按 KBS_SEARCH_CACHE_CONSISTENCY 检索，避免把缺少已完成写入的结果缓存下来
+        consistency_level = settings.search_cache.consistency_level if self._caches_results() else None
+        return self.vector_service.search_batch(query.embeddings, top_ks, metadata_filter,
+                                                search_params=search_params, fields=fields, partitions=partitions,
+                                                consistency_level=consistency_level)
     
-    def _hybrid_merge(self, vector_results: List[Dict], bm25_results: List[Dict]) -> List[Dict]:
-        """合并向量检索和BM25检索的结果"""
-        logger.debug("合并检索结果")  # 添加日志
+    def _bm25_search(self, text: str, top_k: int, allowed: Optional[np.ndarray] = None) -> List[Dict]:
+        """执行BM25检索"""
+        candidates = self._bm25_candidates(text, top_k, allowed)
+        return [candidates.fetch(i) for i in range(len(candidates))]
+
+    def _bm25_candidates(self, text: str, top_k: int, allowed: Optional[np.ndarray] = None) -> Candidates:
+        """执行BM25检索，只返回排名，正文在需要时再读取；allowed 为满足元数据过滤的主键"""
+        logger.debug(f"执行BM25检索: query='{text}', top_k={top_k}")  # 添加日志
+        if not self.vector_store_path:
+            logger.warning("知识库 %s 未配置 vector_store_path，跳过BM25检索", self.kb_id)
+            return Candidates.from_hits([])
+        pks, scores, fetch = bm25_indexes.get(self.vector_store_path).rank(text, top_k, allowed)
+        return Candidates(ids=pks, scores=scores, fetch=fetch)
+
+    def _fusion_option(self, name: str):
+        """融合参数，知识库的 retrieval_config 优先于全局配置"""
+        defaults = {
+            "method": settings.fusion.method,
+            "oversample": settings.fusion.oversample,
+            "rrf_k": settings.fusion.rrf_k,
+        }
+        key = "fusion" if name == "method" else name
+        value = self.retrieval_config.get(key, defaults[name])
+        return max(1, int(value)) if name != "method" else str(value).lower()
+
+    def _hybrid_merge(self, vector_results: List[Dict], bm25_candidates: Candidates, top_k: int) -> List[Dict]:
+        """合并向量检索和BM25检索的结果
+
+        两路分数先各自归一化（或换算为倒数排名）再加权求和，按 id 合并后用
+        argpartition 选出 top_k，只为入选结果读取正文。
+        """
+        logger.debug("合并检索结果: vector=%d, bm25=%d", len(vector_results), len(bm25_candidates))
         vector_weight = self.retrieval_config.get("vector_weight", 0.7)
         bm25_weight = self.retrieval_config.get("bm25_weight", 0.3)
-        
-        # 创建结果映射
-        merged_results = {}
-        logger.debug(len(vector_results))
-        logger.debug(len(bm25_results))
-        
-        # 处理向量检索结果
-        for result in vector_results:
-            id = result["id"]
-            merged_results[id] = {
-                "doc_id": result["doc_id"],
-                "metadata": result["metadata"],
-                "score": result["score"] * vector_weight,
-                "content": result["content"], 
-            }
-        
-        # 处理BM25检索结果
-        for result in bm25_results:
-            id = result["id"]
-            if id in merged_results:
-                merged_results[id]["score"] += result["score"] * bm25_weight
-            else:
-                merged_results[id] = {
-                    "doc_id": result["doc_id"],
-                    "metadata": result["metadata"],
-                    "score": result["score"] * bm25_weight,
-                    "content": result["content"],
-                }
-        
-        # 按分数排序
-        sorted_results = sorted(
-            merged_results.values(),
-            key=lambda x: x["score"],
-            reverse=True
+        return fuse(
+            # 向量检索使用 L2 距离，越小越相似
+            [Candidates.from_hits(vector_results, higher_is_better=False), bm25_candidates],
+            [vector_weight, bm25_weight],
+            top_k,
+            method=self._fusion_option("method"),
+            rrf_k=self._fusion_option("rrf_k"),
         )
-        
-        return sorted_results 
\ No newline at end of file
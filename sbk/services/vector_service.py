@@ -1,92 +1,122 @@
 import json
-from typing import List, Dict, Optional, Union
+from functools import partial
+from typing import Any, Callable, List, Dict, Optional, Union
 import logging
-from pymilvus import (
-    connections,
-    utility,
-    Collection,
-    CollectionSchema,
-    FieldSchema,
-    DataType
-)
+import numpy as np
+from sbk.core.cache import collection_generations
+from sbk.core.write_buffer import write_buffers
+from sbk.core.vector_stores.factory import VectorStoreFactory
+from sbk.core.bm25 import bm25_indexes
+from sbk.core.metadata_filter import matches
 from sbk.core.exceptions import VectorStoreError, ResourceNotFoundError
 from sbk.models.schemas import Query
 
 
 logger = logging.getLogger(__name__)
 
+
+def _row_size(doc_id: str, content: str, metadata: Dict, embedding: np.ndarray) -> int:
+    """估算单行写入请求的字节数"""
+    return (embedding.nbytes + len(content.encode("utf-8")) + len(doc_id.encode("utf-8"))
+            + len(json.dumps(metadata, ensure_ascii=False).encode("utf-8")) + 64)
+
+
+def _after_insert(buffer_key: str, cache_scope: str, delete_fn: Callable[[List[int]], int],
+                  rows: List[tuple], primary_keys: List[int]):
+    """写缓冲每次 insert 成功后把新行加入知识库的 BM25 索引，再使检索缓存失效
+
+    版本号在所有副作用完成后才递增，否则递增之后、BM25 更新之前的检索会把缺少新行的结果缓存到新版本下。
+    BM25 更新失败时用 delete_fn 删除刚写入的向量再抛出，整批留在写缓冲中重试，
+    不会出现向量库中有而 BM25 索引中没有的行；入库任务因此失败并清理本次上传。
+    """
+    try:
+        bm25_index = bm25_indexes.bound(buffer_key)
+        if bm25_index is not None:
+            doc_ids, contents, metadatas, _ = zip(*rows)
+            try:
+                bm25_index.add(primary_keys, doc_ids, contents, metadatas)
+            except Exception as e:
+                logger.error("Failed to update BM25 index for %s, undoing the insert: %s", buffer_key, str(e))
+                # 删除也失败时重试会留下重复行，入库失败后按 source 清理时会一并删除
+                delete_fn(primary_keys)
+                raise VectorStoreError(f"Failed to update BM25 index: {str(e)}") from e
+    finally:
+        # 撤销前新行可能已经被检索到，失败时同样递增
+        collection_generations.bump(cache_scope)
+
+
 class VectorService:
     def __init__(self, 
-                 host: str = "localhost",
-                 port: str = "19530",
+                 host: str = None,
+                 port: str = None,
                  collection_name: str = None,
-                 dim: int = 1024,
+                 dim: Optional[int] = None,
                  kb_name: str = "default",
-                 index_params: dict = None):
+                 index_params: dict = None,
+                 vector_store_path: Optional[str] = None,
+                 vector_store: Optional[Dict[str, Any]] = None,
+                 kb_id: Optional[int] = None):
         """初始化向量服务
         
         Args:
-            host: Milvus服务器地址
-            port: Milvus服务器端口
+            host: Milvus服务器地址，默认取 MILVUS_HOST
+            port: Milvus服务器端口，默认取 MILVUS_PORT
             collection_name: 集合名称，如果为None则使用默认名称
-            dim: 向量维度
+            dim: 向量维度，写入时传入；检索时不需要
+            vector_store_path: 知识库的向量库目录，设置后写入和删除会同步更新其中的 BM25 索引
+            vector_store: 知识库的向量库后端配置，未指定时取 KBS_VECTOR_STORE
+            kb_id: 知识库 ID，共享集合模式下读写都限定在该知识库
         """
-        self.host = host
-        self.port = port
         self.collection_name = collection_name or "document_segments"
+        self.vector_store_path = vector_store_path
         self.dim = dim
         self.kb_name = kb_name
-        self.index_params = index_params or {
-                "metric_type": "L2",
-                "index_type": "IVF_FLAT",
-                "params": {"nlist": 8}
-            }
         
         try:
-            connections.connect(kb_name=kb_name, host=self.host, port=self.port)
-            logger.debug("Connected to Milvus server at %s:%s", self.host, self.port)
-            
-            if not utility.has_collection(self.collection_name):
-                self._create_collection()
-                
-            self.collection = Collection(self.collection_name)
+            self.store = VectorStoreFactory.create(
+                vector_store,
+                collection_name=self.collection_name,
+                dim=dim,
+                vector_store_path=vector_store_path,
+                host=host,
+                port=port,
+                index_params=index_params,
+                kb_id=kb_id,
+            )
+            buffer_key = self.store.key
+            self.bm25_index = None
+            if vector_store_path:
+                bm25_indexes.bind(buffer_key, vector_store_path)
+                self.bm25_index = bm25_indexes.get(vector_store_path)
+            self.write_buffer = write_buffers.get(
+                buffer_key,
+                insert_fn=self.store.insert,
+                on_insert=partial(_after_insert, buffer_key, self.cache_scope, self.store.delete_by_ids),
+            )
         except Exception as e:
             logger.error("Failed to initialize vector service: %s", str(e))
             raise VectorStoreError(f"Failed to initialize vector service: {str(e)}")
         
-    def _create_collection(self):
-        """创建Milvus collection"""
-        try:
-            fields = [
-                FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-                FieldSchema(name="doc_id", dtype=DataType.VARCHAR, max_length=200),
-                FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=65535),
-                FieldSchema(name="metadata", dtype=DataType.JSON),
-                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dim)
-            ]
-            schema = CollectionSchema(fields=fields, description="Document segments for RAG")
-            collection = Collection(name=self.collection_name, schema=schema)
-            
-            # 创建索引
-            collection.create_index(field_name="embedding", index_params=self.index_params)
-            
-            # 创建node_id索引
-            collection.create_index(field_name="doc_id")
-            
-        except Exception as e:
-            raise VectorStoreError(f"Failed to create collection: {str(e)}")
-        
+    @property
+    def cache_scope(self) -> str:
+        """检索结果缓存的失效作用域"""
+        return self.collection_name
+
     def add_documents(self, 
-                     embeddings: List[List[float]], 
+                     embeddings: np.ndarray, 
                      contents: List[str],
                      metadatas: List[Dict],
-                     doc_ids: Optional[List[str]] = None) -> List[str]:
+                     doc_ids: Optional[List[str]] = None,
+                     flush: bool = False) -> List[str]:
         """添加文档到向量库
         
+        数据先进入集合的写缓冲，按大小或时间阈值批量写入 Milvus。
+        
         Args:
-            embeddings: 文档向量列表
+            embeddings: 文档向量，形状为 (文档数, dim) 的 float32 数组
             metadata_list: 元数据列表，每个元素应包含file_hash和content等信息
             node_ids: 节点ID列表，如果为None则自动生成
+            flush: 是否在返回前把缓冲写出，需要读己之写时使用
             
         Returns:
             List[str]: 节点ID列表
@@ -99,134 +129,180 @@ class VectorService:
             if len(doc_ids) != len(embeddings):
                 raise ValueError("node_ids长度必须与embeddings相同")
             
-            entities = [
-                {
-                    "doc_id": doc_id,
-                    "metadata": metadata,
-                    "embedding": embedding,
-                    "content": content
-                }
-                for doc_id, content, metadata, embedding in zip(doc_ids, contents, metadatas, embeddings)
-            ]
-            
-            self.collection.insert(entities)
-            self.collection.flush()
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            rows = list(zip(doc_ids, contents, metadatas, embeddings))
+            sizes = [_row_size(*row) for row in rows]
+            self.write_buffer.add(rows, sizes)
+            if flush:
+                self.flush()
             
         except Exception as e:
             raise VectorStoreError(f"Failed to add documents: {str(e)}")
+
+    def discard_pending(self, metadata_filter: Dict) -> int:
+        """丢弃写缓冲中元数据满足过滤条件、尚未写入向量库的行，返回丢弃行数"""
+        return self.write_buffer.discard(lambda row: matches(row[2], metadata_filter))
+
+    def flush(self) -> int:
+        """把写缓冲中的数据写入 Milvus，返回写入行数"""
+        try:
+            return self.write_buffer.flush()
+        except Exception as e:
+            raise VectorStoreError(f"Failed to flush documents: {str(e)}")
         
     def search(self, 
               query: Query,
               metadata_filter: Optional[Dict] = None,
-              top_k: int = 3) -> List[Dict]:
+              top_k: int = 3,
+              read_your_writes: bool = False) -> List[Dict]:
         """搜索相似文档
         
         Args:
             embedding: 查询向量
             metadata_filter: 元数据过滤条件
             top_k: 返回结果数量
+            read_your_writes: 是否先写出缓冲并以 Session 一致性检索，保证能读到本进程的写入
             
         Returns:
             List[Dict]: 搜索结果列表
         """
-        try:
-            self.collection.load()
-            
-            # 构建查询条件
-            filter_expr = None
-            if metadata_filter:
-                filter_conditions = []
-                for key, value in metadata_filter.items():
-                    if isinstance(value, str):
-                        filter_conditions.append(f'metadata["{key}"] == "{value}"')
-                    else:
-                        filter_conditions.append(f'metadata["{key}"] == {value}')
-                if filter_conditions:
-                    filter_expr = " && ".join(filter_conditions)
-            
-            # 执行向量检索
-            search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-            results = self.collection.search(
-                data=query.embeddings,
-                anns_field="embedding",
-                param=search_params,
-                limit=top_k,
-                expr=filter_expr,
-                output_fields=["doc_id", "metadata", "content", "id"]
-            )
-            
-            # 格式化结果
-            hits = []
-            for hit in results[0]:
-                hits.append({
-                    "score": float(hit.score),
-                    "doc_id": hit.entity.get("doc_id"),
-                    "metadata": hit.entity.get("metadata"),
-                    "content": hit.entity.get("content"),
-                    "id": hit.entity.get("id"),
-                })
+        embeddings = np.atleast_2d(np.asarray(query.embeddings, dtype=np.float32))[:1]
+        return self.search_batch(embeddings, top_k, metadata_filter, read_your_writes)[0]
+
+    def search_batch(self,
+                     embeddings: np.ndarray,
+                     top_k: Union[int, List[int]] = 3,
+                     metadata_filter: Optional[Dict] = None,
+                     read_your_writes: bool = False,
+                     search_params: Optional[Dict] = None,
+                     fields: Optional[List[str]] = None,
+                     partitions: Optional[List[str]] = None,
+                     consistency_level: Optional[str] = None) -> List[List[Dict]]:
+        """批量搜索相似文档，多个查询在一次后端检索中完成
+        
+        Args:
+            embeddings: 查询向量，形状为 (查询数, dim) 的 float32 数组
+            top_k: 返回结果数量，可以为每个查询单独指定
+            metadata_filter: 元数据过滤条件，写法见 metadata_filter.parse_filter，在向量检索之前生效
+            read_your_writes: 是否先写出缓冲并以后端的读己之写一致性检索
+            search_params: 覆盖索引默认值的 nprobe/ef
+            fields: 命中需要携带的字段（doc_id、metadata、content），None 表示全部，score 和 id 总是返回
+            partitions: 只检索这些分区取值对应的分区，知识库须开启分区
+            consistency_level: 后端的一致性级别，结果需要缓存时用 Strong 保证包含已完成的写入
             
-            return hits
+        Returns:
+            List[List[Dict]]: 与查询顺序一致的搜索结果列表
+        """
+        try:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            top_ks = [top_k] * len(embeddings) if isinstance(top_k, int) else list(top_k)
+            if len(top_ks) != len(embeddings):
+                raise ValueError("top_k列表长度必须与查询数相同")
+            if read_your_writes:
+                self.flush()
+            return self.store.search(embeddings, top_ks, metadata_filter, read_your_writes, search_params, fields,
+                                     partitions, consistency_level)
             
         except Exception as e:
             raise VectorStoreError(f"Search failed: {str(e)}")
+
+    def match_ids(self, metadata_filter: Optional[Dict], partitions: Optional[List[str]] = None) -> np.ndarray:
+        """满足元数据过滤条件且位于 partitions 中的全部主键，用于 BM25 检索的预过滤"""
+        try:
+            return self.store.match_ids(metadata_filter, partitions)
+        except Exception as e:
+            raise VectorStoreError(f"Metadata filter failed: {str(e)}")
+
+    def fetch(self, ids: List[int], fields: Optional[List[str]] = None) -> Dict[int, Dict]:
+        """按主键批量读取 chunk 的 doc_id、metadata 和 content
+        
+        Args:
+            ids: chunk 主键列表
+            fields: 需要读取的字段，None 表示全部
+            
+        Returns:
+            Dict[int, Dict]: 以主键为键的 chunk，已删除的主键不出现在结果中
+        """
+        try:
+            return self.store.fetch(ids, fields)
+        except Exception as e:
+            raise VectorStoreError(f"Fetch failed: {str(e)}")
     
     def delete_by_metadata(self, metadata_filter: Dict) -> int:
         """根据元数据条件删除向量"""
         try:
-            filter_conditions = []
-            for key, value in metadata_filter.items():
-                if isinstance(value, str):
-                    filter_conditions.append(f'metadata["{key}"] == "{value}"')
-                else:
-                    filter_conditions.append(f'metadata["{key}"] == {value}')
-            
-            expr = " && ".join(filter_conditions)
-            return self._delete_entities(expr)
+            return self._delete_entities(
+                self.store.delete_by_metadata, metadata_filter,
+                lambda: self.bm25_index.delete_where(metadata_filter),
+            )
         except Exception as e:
             raise VectorStoreError(f"Failed to delete by metadata: {str(e)}")
     
     def delete_by_id(self, id: int) -> int:
         """根据节点ID删除向量"""
         try:
-            expr = f'id == "{id}"'
-            return self._delete_entities(expr)
+            return self._delete_entities(self.store.delete_by_ids, [id], lambda: self.bm25_index.delete_pks([id]))
         except Exception as e:
             raise VectorStoreError(f"Failed to delete by node ID: {str(e)}")
         
     def delete_by_doc_id(self, doc_id: str) -> int:
         """根据节点ID删除向量"""
         try:
-            expr = f'doc_id == "{doc_id}"'
-            return self._delete_entities(expr)
+            return self._delete_entities(
+                self.store.delete_by_doc_id, doc_id,
+                lambda: self.bm25_index.delete_doc_ids([doc_id]),
+            )
         except Exception as e:
             raise VectorStoreError(f"Failed to delete by node ID: {str(e)}") 
     
-    def _delete_entities(self, expr: str) -> int:
+    def drop_partition(self, value: str) -> int:
+        """删除分区取值（元数据取值或写入日期）对应的整个分区，返回删除行数"""
+        try:
+            self.flush()
+            ids = self.store.drop_partition(value)
+            if len(ids):
+                if self.bm25_index is not None:
+                    self.bm25_index.delete_pks(ids)
+                collection_generations.bump(self.cache_scope)
+            return len(ids)
+        except Exception as e:
+            raise VectorStoreError(f"Failed to drop partition: {str(e)}")
+
+    def drop(self) -> int:
+        """删除知识库在向量库中的全部数据，删除知识库时调用，返回删除行数"""
+        try:
+            # 缓冲中的行不再写出；移除缓冲后，复用同一 ID 的新知识库会创建自己的缓冲
+            discarded = write_buffers.drop(self.store.key, flush=False)
+            if discarded:
+                logger.info("Discarded %d buffered rows of dropped vector store %s", discarded, self.store.key)
+            count = self.store.drop()
+            if self.vector_store_path:
+                bm25_indexes.remove(self.vector_store_path)
+            collection_generations.bump(self.cache_scope)
+            return count
+        except Exception as e:
+            raise VectorStoreError(f"Failed to drop vector store: {str(e)}")
+
+    def _delete_entities(self, delete_fn, condition, bm25_delete=None) -> int:
         """删除符合条件的实体
         
         Args:
-            expr: 删除条件表达式
+            delete_fn: 后端的删除方法
+            condition: 删除条件
+            bm25_delete: 从 BM25 索引中删除同样的行，知识库有 BM25 索引时调用
             
         Returns:
             int: 删除的实体数量
         """
         try:
-            self.collection.load()
-            # 先查询匹配的实体数量
-            count = self.collection.query(expr=expr, output_fields=["count(*)"])[0]["count"]
+            # 先写出缓冲，保证尚未写入的行也能被删除
+            self.flush()
+            count = delete_fn(condition)
+            if bm25_delete is not None and self.bm25_index is not None:
+                bm25_delete()
+            # 版本号在向量库和 BM25 都删除后才递增
             if count > 0:
-                self.collection.delete(expr)
-                self.collection.flush()
+                collection_generations.bump(self.cache_scope)
             return count
         except Exception as e:
             raise VectorStoreError(f"Delete operation failed: {str(e)}")
-            
-    def __del__(self):
-        """析构函数，确保关闭连接"""
-        try:
-            if utility.has_collection(self.collection_name):
-                self.collection.release()
-            connections.disconnect("default")
-        except Exception as e:
-            logger.error("Error during disconnection: %s", str(e)) 
\ No newline at end of file
@@ -28,7 +28,10 @@ setup(
         "openai>=1.12.0",
         "pydantic>=2.6.1",
         "psutil>=5.9.5",
-        "requests>=2.31.0"
+        "requests>=2.31.0",
+        "onnx>=1.15.0",
+        "onnxruntime>=1.16.3",
+        "zstandard>=0.22.0"
     ],
     python_requires=">=3.10",
     description="Knowledge Base System with RAG capabilities",
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# 配置在导入 sbk 时读取，版本号文件放到临时目录，避免写入用户目录
+os.environ.setdefault("KBS_SEARCH_CACHE_GENERATION_PATH",
+                      os.path.join(tempfile.mkdtemp(prefix="kbs-test-"), "generations.sqlite"))
+os.environ.setdefault("KBS_INDEX_LOCK_DIR", tempfile.mkdtemp(prefix="kbs-test-locks-"))
+os.environ.setdefault("KBS_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="kbs-test-db-"), "sbk.db"))
+# 后台线程不按时间写出缓冲，测试显式调用 flush
+os.environ.setdefault("KBS_WRITE_BUFFER_INTERVAL", "3600")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pytest
+
+from sbk.core.bm25 import BM25Index
+
+
+def add(index, pks, texts, metadatas=None):
+    index.add(pks, [f"doc{pk}" for pk in pks], texts, metadatas or [{"n": pk} for pk in pks])
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BM25Index(str(tmp_path / "bm25"), max_segments=2, merge_factor=2)
+
+
+def ranked(index, query, top_k=10, allowed=None):
+    pks, scores, _ = index.rank(query, top_k, allowed)
+    return pks.tolist(), scores.tolist()
+
+
+def test_add_and_search(index):
+    add(index, [1, 2, 3], ["apple banana", "banana cherry", "cherry durian"])
+    pks, scores = ranked(index, "banana")
+    assert sorted(pks) == [1, 2]
+    assert all(score > 0 for score in scores)
+    hits = index.search("durian", top_k=3)
+    assert [(hit["id"], hit["doc_id"], hit["content"], hit["metadata"]) for hit in hits] == \
+        [(3, "doc3", "cherry durian", {"n": 3})]
+    assert ranked(index, "missing") == ([], [])
+
+
+def test_delete_round_trip_through_merge(index):
+    # 每次 add 一个段，超过 max_segments 时合并
+    add(index, [1, 2], ["apple pie", "apple tart"])
+    add(index, [3, 4], ["apple cake", "pear cake"])
+    index.delete_pks([2])
+    index.delete_doc_ids(["doc4"])
+    assert sorted(ranked(index, "apple cake")[0]) == [1, 3]
+
+    assert index.stats()["deleted"] == 2
+
+    add(index, [5], ["apple crumble"])
+    add(index, [6], ["apple juice"])
+    stats = index.stats()
+    assert stats["segments"] <= 2
+    assert stats["live_docs"] == 4
+    # 被合并段的墓碑已清理，已删除的行也不会重新出现
+    assert stats["deleted"] < 2
+    assert sorted(ranked(index, "apple cake pie tart")[0]) == [1, 3, 5, 6]
+    assert ranked(index, "tart") == ([], [])
+
+    removed = index.delete_where({"n": {"gte": 5}})
+    assert removed == 2
+    assert sorted(ranked(index, "apple")[0]) == [1, 3]
+
+    # 新实例从磁盘加载同样的状态
+    reopened = BM25Index(index.path, max_segments=2, merge_factor=2)
+    assert sorted(ranked(reopened, "apple")[0]) == [1, 3]
+    assert ranked(reopened, "apple") == ranked(index, "apple")
+
+
+def test_idf_stays_positive_with_many_deletions(index):
+    # 删除大量包含 common 的行后，df 仍包含未合并的 posting，分数不能变为负数或零
+    add(index, list(range(1, 41)), ["common word"] * 38 + ["common rare", "rare other"])
+    index.delete_pks(range(1, 38))
+    pks, scores = ranked(index, "common")
+    assert sorted(pks) == [38, 39]
+    assert all(score > 0 for score in scores)
+
+
+def test_allowed_restricts_ranking(index):
+    add(index, list(range(1, 301)), [f"token{pk % 7} shared" for pk in range(1, 301)])
+    index.delete_pks([7, 14])
+    allowed = np.array([300, 7, 14, 21, 5])
+    pks, _ = ranked(index, "shared token0", top_k=10, allowed=allowed)
+    assert sorted(pks) == [5, 21, 300]
+    assert ranked(index, "shared", allowed=np.array([], dtype=np.int64)) == ([], [])
+
+
+def test_rank_matches_exhaustive_scoring(index):
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(30)]
+    texts = [" ".join(rng.choice(words, size=rng.integers(3, 30))) for _ in range(600)]
+    for start in range(0, 600, 200):
+        add(index, list(range(start + 1, start + 201)), texts[start:start + 200])
+    index.delete_pks(rng.choice(np.arange(1, 601), size=150, replace=False))
+    # top_k 覆盖全部文档时结果即精确排名，较小的 top_k 必须是它的前缀
+    full_pks, full_scores = ranked(index, "w1 w2 w3", top_k=600)
+    pks, scores = ranked(index, "w1 w2 w3", top_k=10)
+    assert scores == pytest.approx(full_scores[:10], rel=1e-5)
+    assert set(pks) <= set(full_pks[:10 + full_scores.count(full_scores[9])])
+
+
+def test_removed_segment_directories(index):
+    for pk in range(1, 6):
+        add(index, [pk], [f"text {pk}"])
+    segments = [name for name in os.listdir(index.path) if name.startswith("seg_") and not name.endswith(".tmp")]
+    assert len(segments) == index.stats()["segments"]
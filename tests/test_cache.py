@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from sbk.core import cache
+from sbk.core.cache import GenerationCounter, LRUCache, collection_generations
+from sbk.services.vector_service import VectorService
+
+DIM = 4
+
+
+def test_lru_eviction_and_invalidate():
+    lru = LRUCache(max_entries=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+    # b 最久未使用，被淘汰
+    assert lru.get("b") is None
+    assert (lru.get("a"), lru.get("c")) == (1, 3)
+    lru.invalidate("a")
+    assert lru.get("a", "missing") == "missing"
+    stats = lru.stats()
+    assert (stats["evictions"], stats["entries"]) == (1, 1)
+
+
+def test_lru_ttl_and_byte_budget(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = LRUCache(max_entries=10, max_bytes=100, ttl=5, sizeof=len)
+    lru.set("a", "x" * 60)
+    lru.set("b", "y" * 60)
+    assert lru.get("a") is None and lru.get("b") == "y" * 60
+    lru.set("big", "z" * 101)
+    assert lru.get("big") is None
+    now[0] += 6
+    assert lru.get("b") is None
+    assert lru.stats()["expirations"] == 1
+    assert not LRUCache(max_entries=0).enabled
+
+
+@pytest.mark.parametrize("persistent", [False, True])
+def test_generation_counter(tmp_path, persistent):
+    path = str(tmp_path / "generations.sqlite") if persistent else None
+    counter = GenerationCounter(path)
+    assert counter.get("kb") == 0
+    assert [counter.bump("kb"), counter.bump("kb"), counter.bump("other")] == [1, 2, 1]
+    assert counter.get("kb") == 2
+    if persistent:
+        # 同一文件上的其他进程（这里用另一个实例代替）看到同样的版本号
+        other = GenerationCounter(path)
+        assert other.get("kb") == 2
+        other.bump("kb")
+        assert counter.get("kb") == 3
+
+
+@pytest.fixture
+def service(tmp_path):
+    return VectorService(collection_name=f"kb_{tmp_path.name}", dim=DIM,
+                         vector_store={"type": "faiss"}, vector_store_path=str(tmp_path))
+
+
+def add(service, doc_id, count, flush=True, offset=0):
+    embeddings = np.arange(offset, offset + count * DIM, dtype=np.float32).reshape(count, DIM)
+    service.add_documents(embeddings, [f"{doc_id} chunk {i}" for i in range(count)],
+                          [{"source": doc_id} for _ in range(count)], [doc_id] * count, flush=flush)
+
+
+def test_writes_bump_generation_after_side_effects(service):
+    scope = service.cache_scope
+    start = collection_generations.get(scope)
+
+    add(service, "a", 3, flush=False)
+    # 仍在写缓冲中的行不可检索，版本号不变
+    assert collection_generations.get(scope) == start
+    service.flush()
+    after_insert = collection_generations.get(scope)
+    assert after_insert > start
+    # 版本号递增时 BM25 索引已包含新行
+    assert len(service.bm25_index.search("chunk", top_k=10)) == 3
+
+    add(service, "b", 2, offset=100)
+    assert collection_generations.get(scope) > after_insert
+
+
+def test_deletes_bump_generation_only_when_rows_removed(service):
+    scope = service.cache_scope
+    add(service, "a", 3)
+    add(service, "b", 2, offset=100)
+    before = collection_generations.get(scope)
+
+    assert service.delete_by_doc_id("missing") == 0
+    assert collection_generations.get(scope) == before
+
+    assert service.delete_by_doc_id("a") == 3
+    after_delete = collection_generations.get(scope)
+    assert after_delete > before
+    assert {hit["doc_id"] for hit in service.bm25_index.search("chunk", top_k=10)} == {"b"}
+
+    assert service.delete_by_metadata({"source": "b"}) == 2
+    assert collection_generations.get(scope) > after_delete
@@ -0,0 +1,53 @@
+import numpy as np
+
+from sbk.core.calibration import _recall, exact_top_k, relevant_ids, select_entry
+
+VECTORS = np.array([[0, 0], [2, 0], [0, 2], [5, 5], [2, 0]], dtype=np.float32)
+IDS = np.arange(10, 15, dtype=np.int64)
+
+
+def batches(size=2):
+    return [(IDS[i:i + size], VECTORS[i:i + size]) for i in range(0, len(VECTORS), size)]
+
+
+def test_exact_top_k_across_batches_and_padding():
+    ids, distances = exact_top_k(batches(), np.array([[5, 5]], dtype=np.float32), 7)
+    assert ids[0, 0] == 13 and distances[0, 0] == 0
+    assert ids[0, -2:].tolist() == [-1, -1]
+    assert np.isinf(distances[0, -2:]).all()
+    assert np.all(np.diff(distances[0, :5]) >= 0)
+
+
+def test_tied_rows_at_the_kth_distance_are_all_relevant():
+    # 查询到 11、12、14 的距离都是 2，top_k=2 时三行都算正确结果
+    relevant, bounds, expected = relevant_ids(batches(), np.array([[1, 1]], dtype=np.float32), 2)
+    assert relevant == [{10, 11, 12, 14}]
+    assert expected == 2
+    assert bounds[0] >= 2
+
+
+def test_recall_counts_any_tied_row_as_a_hit():
+    truth = relevant_ids(batches(), np.array([[2, 1]], dtype=np.float32), 1)
+    # 到 11 和 14 的距离并列最近，任选其一召回率都是 1
+    assert _recall((np.array([[11]]), None), truth) == 1.0
+    assert _recall((np.array([[14]]), None), truth) == 1.0
+    assert _recall((np.array([[10]]), None), truth) == 0.0
+    # 精确距离不超过并列上限的命中也算正确，不要求出现在候选集合里
+    assert _recall((np.array([[99]]), np.array([[1.0]])), truth) == 1.0
+
+
+def test_recall_ignores_padding():
+    truth = relevant_ids(batches(), np.array([[0, 0]], dtype=np.float32), 2)
+    assert _recall((np.array([[10, -1]]), None), truth) == 0.5
+
+
+def test_select_entry_prefers_fastest_meeting_target():
+    entries = [
+        {"value": 8, "recall": 0.9, "p99_ms": 1.0},
+        {"value": 16, "recall": 0.97, "p99_ms": 2.0},
+        {"value": 32, "recall": 0.99, "p99_ms": 4.0},
+    ]
+    assert select_entry(entries, target_recall=0.95)["value"] == 16
+    assert select_entry(entries, target_recall=0.999)["value"] == 32
+    assert select_entry(entries, target_recall=0.95, latency_budget_ms=1.5)["value"] == 8
+    assert select_entry(entries, latency_budget_ms=0.5)["value"] == 8
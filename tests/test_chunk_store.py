@@ -0,0 +1,44 @@
+import pytest
+
+from sbk.core.chunk_store import SQL_BATCH, ChunkStore
+
+
+def codec_param(codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    return codec
+
+
+@pytest.mark.parametrize("codec", ["zstd", "zlib", "none"])
+def test_round_trip(tmp_path, codec):
+    store = ChunkStore(str(tmp_path), codec=codec_param(codec))
+    contents = ["正文 " * 50, "", "second chunk"]
+    metadatas = [{"source": "a.pdf", "page": 1}, {"source": "a.pdf", "page": 2}, {"source": "b.md"}]
+    store.put([1, 2, 3], ["a", "a", "b"], contents, metadatas)
+
+    chunks = store.get([3, 1, 2, 99])
+    assert sorted(chunks) == [1, 2, 3]
+    assert [chunks[i]["content"] for i in (1, 2, 3)] == contents
+    assert [chunks[i]["metadata"] for i in (1, 2, 3)] == metadatas
+    assert store.get([1], fields=["doc_id"]) == {1: {"id": 1, "doc_id": "a"}}
+    assert sorted(store.match_ids({"source": "a.pdf"}).tolist()) == [1, 2]
+    assert store.stats()["codec"] == codec
+
+
+def test_codec_is_pinned_at_creation(tmp_path):
+    ChunkStore(str(tmp_path), codec="zlib").put([1], ["a"], ["text"], [{}])
+    reopened = ChunkStore(str(tmp_path), codec="none")
+    assert reopened.stats()["codec"] == "zlib"
+    assert reopened.get([1])[1]["content"] == "text"
+
+
+def test_overwrite_and_delete_in_batches(tmp_path):
+    store = ChunkStore(str(tmp_path), codec="zlib")
+    ids = list(range(SQL_BATCH + 10))
+    store.put(ids, ["a"] * len(ids), [str(i) for i in ids], [{}] * len(ids))
+    store.put([0], ["b"], ["replaced"], [{}])
+    assert store.get([0])[0]["content"] == "replaced"
+    assert len(store.get(ids)) == len(ids)
+    assert store.delete(ids[1:]) == len(ids) - 1
+    assert store.delete_doc("b") == 1
+    assert store.stats()["rows"] == 0
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from sbk.core.embeddings.base import BaseEmbedding
+from sbk.core.embeddings.cache import EmbeddingCache
+
+DIM = 6
+CONFIG = {"type": "sentence_transformer", "model_name": "test-model"}
+
+
+class HashEmbedding(BaseEmbedding):
+    """按文本生成固定向量，并记录实际计算过的文本"""
+
+    def __init__(self):
+        self.calls = []
+
+    def _vector(self, text):
+        rng = np.random.default_rng(sum(text.encode("utf-8")) + len(text))
+        return rng.normal(size=DIM).astype(np.float32) / 3
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return np.stack([self._vector(text) for text in texts])
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16"])
+def test_hits_return_the_same_vectors_as_misses(tmp_path, dtype):
+    model = HashEmbedding()
+    cache = EmbeddingCache(str(tmp_path), max_bytes=1 << 20, dtype=dtype)
+    texts = ["alpha", "beta", "alpha", "gamma"]
+    first = cache.embed_documents(model, CONFIG, texts)
+    second = cache.embed_documents(model, CONFIG, texts)
+    assert first.dtype == np.float32 and first.shape == (4, DIM)
+    # 命中与未命中返回完全相同的向量，分数不随缓存状态变化
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_array_equal(first[0], first[2])
+    assert model.calls == [["alpha", "beta", "gamma"]]
+    if dtype == "float32":
+        np.testing.assert_array_equal(first, model.embed_documents(texts))
+    else:
+        np.testing.assert_array_equal(first, model.embed_documents(texts).astype(np.float16).astype(np.float32))
+
+
+def test_default_precision_is_float32(tmp_path):
+    assert EmbeddingCache(str(tmp_path), max_bytes=1 << 20).dtype == "float32"
+
+
+def test_cache_persists_across_instances_and_configs(tmp_path):
+    model = HashEmbedding()
+    EmbeddingCache(str(tmp_path), max_bytes=1 << 20).embed_documents(model, CONFIG, ["alpha", "beta"])
+    cache = EmbeddingCache(str(tmp_path), max_bytes=1 << 20)
+    cache.embed_documents(model, CONFIG, ["beta", "delta"])
+    cache.embed_documents(model, {**CONFIG, "model_name": "other"}, ["beta"])
+    assert model.calls == [["alpha", "beta"], ["delta"], ["beta"]]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert sorted(stats["entries"].values()) == [1, 3]
+
+
+def test_capacity_evicts_least_recently_used(tmp_path):
+    model = HashEmbedding()
+    # 容量为 4 个 float32 向量
+    cache = EmbeddingCache(str(tmp_path), max_bytes=4 * DIM * 4)
+    cache.embed_documents(model, CONFIG, ["a", "b", "c", "d"])
+    cache.embed_documents(model, CONFIG, ["a"])
+    cache.embed_documents(model, CONFIG, ["e", "f"])
+    model.calls.clear()
+    result = cache.embed_documents(model, CONFIG, ["a", "b", "c", "d", "e", "f"])
+    # b 和 c 最久未访问，被 e 和 f 替换
+    assert model.calls == [["b", "c"]]
+    assert cache.stats()["evictions"] >= 2
+    np.testing.assert_array_equal(result, HashEmbedding().embed_documents(["a", "b", "c", "d", "e", "f"]))
+
+
+def test_disabled_cache_calls_model(tmp_path):
+    model = HashEmbedding()
+    cache = EmbeddingCache(str(tmp_path), max_bytes=0)
+    cache.embed_documents(model, CONFIG, ["a"])
+    cache.embed_documents(model, CONFIG, ["a"])
+    assert model.calls == [["a"], ["a"]]
@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+import pytest
+
+from sbk.core.embeddings.base import BaseEmbedding
+from sbk.core.embeddings.registry import EmbeddingRegistry, config_fingerprint, registry_key
+
+
+class CountingEmbedding(BaseEmbedding):
+    def __init__(self, config):
+        self.config = config
+        self.closed = False
+
+    def embed_query(self, text):
+        return np.zeros(2, dtype=np.float32)
+
+    def embed_documents(self, texts):
+        return np.zeros((len(texts), 2), dtype=np.float32)
+
+    def memory_bytes(self):
+        return 100
+
+    def stats(self):
+        return {"micro_batch": {"batches": 0}}
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def loads():
+    return []
+
+
+@pytest.fixture
+def registry(loads):
+    def loader(config):
+        loads.append(config["model_name"])
+        return CountingEmbedding(config)
+    # idle_ttl 为 0 时不启动后台清理线程
+    return EmbeddingRegistry(loader, max_models=2, idle_ttl=0)
+
+
+def config(name):
+    return {"type": "sentence_transformer", "model_name": name}
+
+
+def test_same_config_loads_once(registry, loads):
+    with registry.lease(config("a")) as first, registry.lease({"model_name": "a"}) as second:
+        assert first is second
+    assert loads == ["a"]
+    stats = registry.stats()
+    assert (stats["loads"], stats["hits"], stats["resident_bytes"]) == (1, 1, 100)
+    assert stats["models"][0]["refcount"] == 0
+    assert stats["models"][0]["micro_batch"] == {"batches": 0}
+
+
+def test_concurrent_acquire_loads_once(registry, loads):
+    barrier = threading.Barrier(8)
+    models = []
+
+    def worker():
+        barrier.wait()
+        models.append(registry.acquire(config("a")))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert loads == ["a"]
+    assert len({id(model) for model in models}) == 1
+    assert registry.stats()["models"][0]["refcount"] == 8
+
+
+def test_lru_eviction_skips_models_in_use(registry, loads):
+    pinned = registry.acquire(config("a"))
+    with registry.lease(config("b")):
+        pass
+    with registry.lease(config("c")) as c:
+        # a 仍被引用，超过上限时卸载最久未用的 b
+        assert [m["model_name"] for m in registry.stats()["models"]] == ["a", "c"]
+    assert not pinned.closed
+    registry.release(config("a"))
+
+    with registry.lease(config("b")):
+        pass
+    assert loads == ["a", "b", "c", "b"]
+    assert pinned.closed and not c.closed
+    assert registry.stats()["evictions"] == 2
+
+
+def test_all_models_in_use_exceed_limit(registry):
+    models = [registry.acquire(config(name)) for name in "abc"]
+    assert registry.stats()["resident_models"] == 3
+    for name in "abc":
+        registry.release(config(name))
+    assert registry.stats()["resident_models"] == 2
+    assert models[0].closed
+
+
+def test_evict_idle_and_clear(loads, monkeypatch):
+    from sbk.core.embeddings import registry as registry_module
+    now = [1000.0]
+    monkeypatch.setattr(registry_module.time, "monotonic", lambda: now[0])
+    registry = EmbeddingRegistry(lambda c: CountingEmbedding(c), max_models=4, idle_ttl=60)
+    monkeypatch.setattr(registry, "_ensure_sweeper", lambda: None)
+    busy = registry.acquire(config("busy"))
+    with registry.lease(config("idle")) as idle:
+        pass
+    now[0] += 61
+    assert registry.evict_idle() == 1
+    assert idle.closed and not busy.closed
+    registry.clear()
+    assert registry.stats()["resident_models"] == 1
+    registry.release(config("busy"))
+    registry.clear()
+    assert busy.closed
+
+
+def test_keys_separate_api_keys_but_not_fingerprints():
+    a = {"type": "openai", "api_key": "k1", "base_url": "http://x/"}
+    b = {"type": "openai", "api_key": "k2", "base_url": "http://x"}
+    assert registry_key(a) != registry_key(b)
+    assert config_fingerprint(a) == config_fingerprint(b)
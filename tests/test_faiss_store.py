@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from sbk.core.vector_stores import faiss_store
+from sbk.core.vector_stores.faiss_store import FaissVectorStore
+
+DIM = 8
+
+
+def rows_for(count, start=0, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, DIM)).astype(np.float32)
+    rows = [(f"doc{(start + i) % 5}", f"chunk {start + i}", {"n": start + i, "tag": "even" if (start + i) % 2 == 0 else "odd"},
+             vectors[i]) for i in range(count)]
+    return rows, vectors
+
+
+@pytest.fixture
+def store(tmp_path):
+    # checkpoint_rows 较小，测试同时覆盖快照、增量索引和墓碑
+    store = FaissVectorStore(str(tmp_path / "faiss"), checkpoint_rows=16)
+    yield store
+    store.close()
+
+
+def brute_force(vectors, ids, query, k):
+    distances = ((vectors - query) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")[:k]
+    return [int(ids[i]) for i in order]
+
+
+def test_insert_and_search(store):
+    rows, vectors = rows_for(40)
+    ids = store.insert(rows)
+    assert ids == sorted(ids) and len(set(ids)) == 40
+    assert store.num_rows() == 40 and store.dim == DIM
+
+    hits = store.search(vectors[:2], [3, 5])
+    assert [len(h) for h in hits] == [3, 5]
+    for query, query_hits, k in zip(vectors[:2], hits, [3, 5]):
+        assert [hit["id"] for hit in query_hits] == brute_force(vectors, np.array(ids), query, k)
+        assert query_hits[0]["score"] == pytest.approx(0.0, abs=1e-4)
+        assert [hit["score"] for hit in query_hits] == sorted(hit["score"] for hit in query_hits)
+    first = hits[0][0]
+    assert (first["doc_id"], first["content"], first["metadata"]) == ("doc0", "chunk 0", {"n": 0, "tag": "even"})
+
+
+def test_dimension_mismatch_is_rejected(store):
+    store.insert(rows_for(2)[0])
+    with pytest.raises(ValueError):
+        store.insert([("doc", "text", {}, np.zeros(DIM + 1, dtype=np.float32))])
+
+
+@pytest.mark.parametrize("exact_max_rows", [faiss_store.EXACT_SEARCH_MAX_ROWS, 0])
+def test_search_with_metadata_filter(store, monkeypatch, exact_max_rows):
+    # 0 时过滤结果交给 IDSelector 在索引上检索
+    monkeypatch.setattr(faiss_store, "EXACT_SEARCH_MAX_ROWS", exact_max_rows)
+    rows, vectors = rows_for(40)
+    ids = np.array(store.insert(rows))
+    even = np.array([row[2]["tag"] == "even" for row in rows])
+    hits = store.search(vectors[1:2], [4], metadata_filter={"tag": "even", "n": {"lt": 30}})[0]
+    allowed = even & (np.arange(40) < 30)
+    assert [hit["id"] for hit in hits] == brute_force(vectors[allowed], ids[allowed], vectors[1], 4)
+    assert all(hit["metadata"]["tag"] == "even" and hit["metadata"]["n"] < 30 for hit in hits)
+    assert store.search(vectors[:1], [4], metadata_filter={"tag": "none"}) == [[]]
+
+
+def test_fields_projection_and_fetch(store):
+    rows, vectors = rows_for(4)
+    ids = store.insert(rows)
+    hit = store.search(vectors[:1], [1], fields=["doc_id"])[0][0]
+    assert set(hit) == {"id", "score", "doc_id"}
+    fetched = store.fetch(ids[:2] + [10 ** 6], fields=["content"])
+    assert fetched == {ids[0]: {"id": ids[0], "content": "chunk 0"}, ids[1]: {"id": ids[1], "content": "chunk 1"}}
+
+
+def test_match_ids(store):
+    ids = np.array(store.insert(rows_for(10)[0]))
+    assert store.match_ids({"tag": "odd"}).tolist() == ids[1::2].tolist()
+    assert store.match_ids({"n": {"in": [2, 3, 99]}}).tolist() == ids[2:4].tolist()
+    with pytest.raises(ValueError):
+        store.match_ids({"tag": "odd"}, partitions=["a"])
+
+
+def test_deletes_are_excluded_from_search(store):
+    rows, vectors = rows_for(40)
+    ids = np.array(store.insert(rows))
+    assert store.delete_by_doc_id("doc0") == 8
+    assert store.delete_by_ids(ids[1:3].tolist() + [10 ** 6]) == 2
+    assert store.delete_by_metadata({"n": {"gte": 35}}) == 4
+    assert store.delete_by_metadata({}) == 0
+    assert store.delete_by_doc_id("doc0") == 0
+
+    live = np.array([row[0] != "doc0" and not 1 <= i <= 2 and i < 35 for i, row in enumerate(rows)])
+    assert store.num_rows() == live.sum()
+    # 查询本身是已删除的行，最近邻必须来自剩余的行
+    for query in vectors[[0, 1, 36]]:
+        hits = store.search(query[None, :], [5])[0]
+        assert [hit["id"] for hit in hits] == brute_force(vectors[live], ids[live], query, 5)
+    assert store.fetch(ids[:3]) == {}
+
+
+def test_reopen_sees_snapshot_delta_and_tombstones(store):
+    rows, vectors = rows_for(40)
+    ids = np.array(store.insert(rows))
+    store.delete_by_ids(ids[:5].tolist())
+    more, more_vectors = rows_for(3, start=40, seed=1)
+    ids = np.concatenate([ids, store.insert(more)])
+    vectors = np.concatenate([vectors, more_vectors])
+
+    reopened = FaissVectorStore(store.path, checkpoint_rows=16)
+    try:
+        assert reopened.num_rows() == 38
+        live = np.arange(len(ids)) >= 5
+        for query in vectors[[0, 20, 41]]:
+            expected = brute_force(vectors[live], ids[live], query, 6)
+            assert [hit["id"] for hit in reopened.search(query[None, :], [6])[0]] == expected
+            assert [hit["id"] for hit in store.search(query[None, :], [6])[0]] == expected
+        # 另一个实例的删除在下一次检索前追平
+        reopened.delete_by_ids([int(ids[40])])
+        assert int(ids[40]) not in [hit["id"] for hit in store.search(vectors[40:41], [3])[0]]
+    finally:
+        reopened.close()
+
+
+def test_iter_embeddings(store):
+    rows, vectors = rows_for(25)
+    ids = store.insert(rows)
+    batches = list(store.iter_embeddings(batch_size=10))
+    assert [len(batch_ids) for batch_ids, _ in batches] == [10, 10, 5]
+    assert np.concatenate([batch_ids for batch_ids, _ in batches]).tolist() == ids
+    np.testing.assert_array_equal(np.concatenate([batch for _, batch in batches]), vectors)
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from sbk.core.fusion import Candidates, fuse, normalize_scores, reciprocal_ranks
+
+
+def hits(ids, scores):
+    return [{"id": id, "score": score, "content": f"c{id}"} for id, score in zip(ids, scores)]
+
+
+def test_normalize_scores_maps_best_to_one():
+    assert normalize_scores(np.array([1.0, 3.0, 2.0])).tolist() == [0.0, 1.0, 0.5]
+    # L2 距离越小越相似
+    assert normalize_scores(np.array([1.0, 3.0, 2.0]), higher_is_better=False).tolist() == [1.0, 0.0, 0.5]
+    assert normalize_scores(np.array([2.0, 2.0])).tolist() == [1.0, 1.0]
+
+
+def test_reciprocal_ranks_follow_score_order():
+    ranks = reciprocal_ranks(np.array([0.1, 0.9, 0.5]), k=60)
+    np.testing.assert_allclose(ranks, [1 / 63, 1 / 61, 1 / 62])
+    ranks = reciprocal_ranks(np.array([0.1, 0.9, 0.5]), higher_is_better=False, k=60)
+    np.testing.assert_allclose(ranks, [1 / 61, 1 / 63, 1 / 62])
+
+
+def test_weighted_fusion_orders_by_combined_score():
+    vector = Candidates.from_hits(hits([1, 2, 3], [0.1, 0.2, 0.9]), higher_is_better=False)
+    bm25 = Candidates.from_hits(hits([3, 2, 4], [9.0, 5.0, 1.0]))
+    results = fuse([vector, bm25], [0.7, 0.3], top_k=4)
+    assert [hit["id"] for hit in results] == [2, 1, 3, 4]
+    scores = [hit["score"] for hit in results]
+    assert scores == sorted(scores, reverse=True)
+    # 2 在两路都靠前：0.7 * 0.875 + 0.3 * 0.5
+    assert results[0]["score"] == pytest.approx(0.7 * 0.875 + 0.3 * 0.5)
+
+
+def test_rrf_fusion_rewards_agreement():
+    vector = Candidates.from_hits(hits([1, 2, 3], [0.1, 0.2, 0.3]), higher_is_better=False)
+    bm25 = Candidates.from_hits(hits([3, 2, 1], [3.0, 2.0, 1.0]))
+    results = fuse([vector, bm25], [1.0, 1.0], top_k=3, method="rrf")
+    # 1 和 3 各在一路排第一、另一路排第三，倒数排名之和略高于两路都排第二的 2
+    assert sorted(hit["id"] for hit in results[:2]) == [1, 3]
+    assert results[2]["id"] == 2
+    assert results[0]["score"] == pytest.approx(1 / 61 + 1 / 63)
+    assert results[2]["score"] == pytest.approx(2 / 62)
+
+
+def test_fusion_fetches_only_winners():
+    fetched = []
+
+    def fetch(i):
+        fetched.append(i)
+        return {"id": 10 + i, "score": 0.0}
+
+    candidates = Candidates(ids=np.arange(10, 20), scores=np.arange(10, dtype=np.float32)[::-1], fetch=fetch)
+    results = fuse([candidates], [1.0], top_k=3)
+    assert [hit["id"] for hit in results] == [10, 11, 12]
+    assert sorted(fetched) == [0, 1, 2]
+
+
+def test_fusion_edge_cases():
+    empty = Candidates.from_hits([])
+    assert fuse([empty], [1.0], top_k=3) == []
+    assert fuse([Candidates.from_hits(hits([1], [1.0]))], [1.0], top_k=0) == []
+    with pytest.raises(ValueError):
+        fuse([Candidates.from_hits(hits([1], [1.0]))], [1.0], top_k=1, method="max")
@@ -0,0 +1,38 @@
+import os
+
+from pymilvus import MilvusException
+
+from sbk.core.index_policy import IndexLocks
+from sbk.core.vector_stores.milvus import _is_stale
+
+
+def test_journal_records_only_during_rebuild(tmp_path):
+    locks = IndexLocks(str(tmp_path))
+    locks.record("kb", {"op": "delete", "expr": "id in [1]"})
+    with locks.rebuild("kb") as acquired:
+        assert acquired
+        locks.start_journal("kb")
+        locks.record("kb", {"op": "delete", "expr": "id in [1]", "partition": None})
+        entries, offset = locks.read_journal("kb")
+        assert entries == [{"op": "delete", "expr": "id in [1]", "partition": None}]
+        locks.record("kb", {"op": "drop_partition", "partition": "p_val_a"})
+        entries, offset = locks.read_journal("kb", offset)
+        assert entries == [{"op": "drop_partition", "partition": "p_val_a"}]
+        assert locks.read_journal("kb", offset) == ([], offset)
+        locks.end_journal("kb")
+    assert not any(name.endswith(".jsonl") for name in os.listdir(tmp_path))
+
+
+def test_journal_left_by_interrupted_rebuild_is_removed(tmp_path):
+    locks = IndexLocks(str(tmp_path))
+    locks.start_journal("kb")
+    locks.record("kb", {"op": "delete", "expr": "id in [1]"})
+    assert not any(name.endswith(".jsonl") for name in os.listdir(tmp_path))
+
+
+def test_stale_errors_are_matched_by_code():
+    assert _is_stale(MilvusException(100, "collection not found[kb]"))
+    assert _is_stale(MilvusException(201, "partition not loaded"))
+    assert _is_stale(MilvusException(1, "collection not exist", 4))
+    # 消息中含 not found 但错误码不同的写入错误不重试
+    assert not _is_stale(MilvusException(1100, "primary key not found in insert data"))
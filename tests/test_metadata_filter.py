@@ -0,0 +1,102 @@
+import json
+import sqlite3
+
+import pytest
+
+from sbk.core.metadata_filter import (
+    Condition,
+    matches,
+    milvus_expr,
+    parse_filter,
+    split_promoted,
+    sqlite_where,
+)
+
+ROWS = [
+    {"source": "a.pdf", "page": 1, "lang": "en"},
+    {"source": "a.pdf", "page": 4, "lang": "zh"},
+    {"source": 'b"c\\d.pdf', "page": 2},
+    {"source": "e.pdf", "page": 0, "draft": True},
+    {},
+]
+
+FILTERS = [
+    {"source": "a.pdf"},
+    {"page": {"gte": 2}},
+    {"page": {"gt": 0, "lte": 2}},
+    {"source": ["e.pdf", 'b"c\\d.pdf']},
+    {"lang": {"nin": ["en"]}},
+    {"lang": {"ne": "en"}},
+    {"draft": True},
+    {"source": "a.pdf", "page": {"lt": 3}},
+]
+
+
+def test_parse_filter_shapes():
+    assert parse_filter({"page": 3}) == [Condition("page", "eq", 3)]
+    assert parse_filter({"page": [1, 2]}) == [Condition("page", "in", (1, 2))]
+    assert parse_filter({"page": {"gte": 1, "lt": 5}}) == [Condition("page", "gte", 1), Condition("page", "lt", 5)]
+    assert parse_filter(None) == []
+
+
+@pytest.mark.parametrize("bad", [
+    {"page": {"like": 1}},
+    {'a"b': 1},
+    {"page": []},
+    {"page": {}},
+    {"page": float("nan")},
+    {"page": {"in": 3}},
+    "page",
+])
+def test_parse_filter_rejects_invalid(bad):
+    with pytest.raises(ValueError):
+        parse_filter(bad)
+
+
+def test_milvus_expr_translation():
+    assert milvus_expr(parse_filter({"source": "a.pdf"})) == 'metadata["source"] == "a.pdf"'
+    assert milvus_expr(parse_filter({"page": {"gte": 2, "lt": 5}})) == 'metadata["page"] >= 2 && metadata["page"] < 5'
+    assert milvus_expr(parse_filter({"lang": {"nin": ["en", "de"]}})) == 'metadata["lang"] not in ["en", "de"]'
+    assert milvus_expr(parse_filter({"draft": True})) == 'metadata["draft"] == true'
+    # 字符串按 JSON 规则转义，引号和反斜杠不能提前结束字面量
+    assert milvus_expr(parse_filter({"source": 'b"c\\d'})) == 'metadata["source"] == "b\\"c\\\\d"'
+    assert milvus_expr([]) is None
+
+
+def test_milvus_expr_uses_promoted_fields():
+    promoted = {"page": "int64"}
+    expr = milvus_expr(parse_filter({"page": 3, "source": "a.pdf"}), promoted)
+    assert expr == 'meta_page == 3 && metadata["source"] == "a.pdf"'
+
+
+def test_split_promoted_keeps_default_sensitive_conditions():
+    promoted = {"page": "int64", "source": "varchar"}
+    scalar, residual = split_promoted({"page": {"gte": 3}, "source": "a.pdf", "lang": "en"}, promoted)
+    assert scalar == [Condition("page", "gte", 3), Condition("source", "eq", "a.pdf")]
+    assert residual == [Condition("lang", "eq", "en")]
+    # 缺失的键写入默认值 0，page == 0 在标量字段上无法区分缺失，需要同时检查原始元数据
+    scalar, residual = split_promoted({"page": 0}, promoted)
+    assert scalar == residual == [Condition("page", "eq", 0)]
+    # 类型不符的值不能比较标量字段
+    scalar, residual = split_promoted({"page": "3"}, promoted)
+    assert scalar == [] and residual == [Condition("page", "eq", "3")]
+
+
+@pytest.mark.parametrize("metadata_filter", FILTERS)
+def test_sqlite_where_agrees_with_python(metadata_filter):
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, metadata TEXT)")
+    db.executemany("INSERT INTO chunks VALUES (?, ?)", [(i, json.dumps(row)) for i, row in enumerate(ROWS)])
+    where, params = sqlite_where(metadata_filter)
+    found = sorted(row[0] for row in db.execute(f"SELECT id FROM chunks WHERE {where}", params))
+    expected = [i for i, row in enumerate(ROWS) if matches(row, metadata_filter)]
+    assert found == expected
+
+
+def test_sqlite_where_without_filter_matches_everything():
+    assert sqlite_where(None) == ("1", [])
+
+
+def test_missing_key_never_matches():
+    assert not matches({}, {"lang": {"ne": "en"}})
+    assert not matches({"page": "x"}, {"page": {"gt": 1}})
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from sbk.core.embeddings.batching import MicroBatcher
+
+
+class BlockingEncoder:
+    """第一次调用阻塞到 release，期间到达的请求在队列中积累"""
+
+    def __init__(self):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        if len(self.batches) == 1:
+            self.started.set()
+            self.release.wait(5)
+        return [f"vec:{text}" for text in texts]
+
+
+def test_concurrent_requests_are_coalesced():
+    encoder = BlockingEncoder()
+    batcher = MicroBatcher(encoder, max_batch_size=4, max_wait_ms=50)
+    try:
+        first = batcher.submit(["warmup"])
+        assert encoder.started.wait(5)
+        futures = batcher.submit([f"q{i}" for i in range(10)])
+        encoder.release.set()
+        assert [future.result(5) for future in futures] == [f"vec:q{i}" for i in range(10)]
+        assert first[0].result(5) == "vec:warmup"
+    finally:
+        batcher.close()
+    # 排队的 10 条按 max_batch_size 合并成 4、4、2
+    assert encoder.batches == [["warmup"], ["q0", "q1", "q2", "q3"], ["q4", "q5", "q6", "q7"], ["q8", "q9"]]
+    stats = batcher.stats()
+    assert (stats["batches"], stats["items"], stats["max_batch_size"]) == (4, 11, 4)
+    assert stats["batch_size_histogram"]["1"] == 1
+    assert stats["batch_size_histogram"]["2"] == 1
+    assert stats["batch_size_histogram"]["4"] == 2
+    assert stats["avg_batch_size"] == pytest.approx(11 / 4)
+
+
+def test_threads_receive_their_own_results():
+    batcher = MicroBatcher(lambda texts: [text.upper() for text in texts], max_batch_size=8, max_wait_ms=20)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.embed([f"a{i}", f"b{i}"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+    assert results == {i: [f"A{i}", f"B{i}"] for i in range(16)}
+    assert batcher.stats()["batches"] < 32
+
+
+def test_encode_errors_reach_every_caller_in_the_batch():
+    def encode(texts):
+        raise RuntimeError("model failed")
+
+    batcher = MicroBatcher(encode, max_batch_size=4, max_wait_ms=20)
+    futures = batcher.submit(["a", "b"])
+    for future in futures:
+        with pytest.raises(RuntimeError, match="model failed"):
+            future.result(5)
+    # 失败后后台线程继续处理新请求
+    batcher.encode_fn = lambda texts: list(texts)
+    assert batcher.embed(["c"]) == ["c"]
+    batcher.close()
+
+
+def test_closed_batcher_rejects_requests():
+    batcher = MicroBatcher(lambda texts: list(texts))
+    assert batcher.embed(["a"]) == ["a"]
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(["b"])
@@ -0,0 +1,141 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from sbk.core.embeddings import openai as openai_embedding
+from sbk.core.embeddings.openai import OpenAIEmbedding
+
+
+def vector(text):
+    return [float(len(text)), float(sum(map(ord, text)) % 97)]
+
+
+class StubServer:
+    """本地 OpenAI 兼容端点：/v1/embeddings 接受批量请求，/v1 接受逐条请求
+
+    failures 中的状态码按顺序返回给批量请求，之后的请求正常响应。
+    """
+
+    def __init__(self):
+        self.batch_requests = []
+        self.raw_requests = []
+        self.failures = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if self.path.endswith("/embeddings"):
+                    stub.batch_requests.append(body["input"])
+                    if stub.failures:
+                        self._reply(stub.failures.pop(0), {"error": {"message": "stub failure"}},
+                                    {"retry-after": "0"})
+                        return
+                    data = [{"object": "embedding", "index": i, "embedding": vector(text)}
+                            for i, text in enumerate(body["input"])]
+                else:
+                    stub.raw_requests.append(body["input"])
+                    data = [{"object": "embedding", "index": 0, "embedding": vector(body["input"])}]
+                self._reply(200, {"object": "list", "data": data, "model": body["model"],
+                                  "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+
+            def _reply(self, status, payload, headers=None):
+                encoded = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(encoded)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/v1"
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def make_embedding(server, monkeypatch):
+    monkeypatch.setattr(openai_embedding.time, "sleep", lambda seconds: None)
+    created = []
+
+    def make(**kwargs):
+        embedding = OpenAIEmbedding(api_key="test", base_url=server.base_url, model_name="stub", dim=2,
+                                    max_retries=kwargs.pop("max_retries", 2), timeout=5, **kwargs)
+        # 不加载 tiktoken 编码表，按字符数估算 token
+        embedding._encoding = False
+        created.append(embedding)
+        return embedding
+
+    yield make
+    for embedding in created:
+        embedding.close()
+
+
+def test_batches_by_size_and_tokens_in_order(server, make_embedding):
+    embedding = make_embedding(max_batch_size=2, max_batch_tokens=8, max_concurrency=3)
+    texts = ["a", "bb", "ccc", "dddddd", "eeeeeee", "f"]
+    result = embedding.embed_documents(texts)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result, np.array([vector(text) for text in texts], dtype=np.float32))
+    assert sorted(server.batch_requests) == sorted([["a", "bb"], ["ccc"], ["dddddd"], ["eeeeeee", "f"]])
+    assert server.raw_requests == []
+    np.testing.assert_array_equal(embedding.embed_query("xyz"), np.array(vector("xyz"), dtype=np.float32))
+
+
+def test_rate_limit_is_retried(server, make_embedding):
+    server.failures = [429, 503]
+    embedding = make_embedding()
+    result = embedding.embed_documents(["a", "b"])
+    np.testing.assert_array_equal(result, np.array([vector("a"), vector("b")], dtype=np.float32))
+    assert server.batch_requests == [["a", "b"]] * 3
+    assert server.raw_requests == []
+
+
+def test_exhausted_retries_raise_without_per_text_fallback(server, make_embedding):
+    server.failures = [429] * 3
+    embedding = make_embedding(max_retries=2)
+    with pytest.raises(openai_embedding._RetryableError):
+        embedding.embed_documents(["a", "b"])
+    assert len(server.batch_requests) == 3
+    assert server.raw_requests == []
+    assert not embedding._raw_http
+
+
+def test_other_errors_are_not_retried_or_split(server, make_embedding):
+    server.failures = [401]
+    embedding = make_embedding()
+    with pytest.raises(openai_embedding.openai.AuthenticationError):
+        embedding.embed_documents(["a", "b"])
+    assert len(server.batch_requests) == 1
+    assert server.raw_requests == []
+
+
+def test_unsupported_batch_format_switches_to_raw_requests(server, make_embedding):
+    server.failures = [404]
+    embedding = make_embedding()
+    result = embedding.embed_documents(["a", "b"])
+    np.testing.assert_array_equal(result, np.array([vector("a"), vector("b")], dtype=np.float32))
+    assert server.raw_requests == ["a", "b"]
+    # 之后的请求直接逐条发送
+    embedding.embed_documents(["c"])
+    assert server.batch_requests == [["a", "b"]]
+    assert server.raw_requests == ["a", "b", "c"]
@@ -0,0 +1,54 @@
+import calendar
+import zlib
+
+import pytest
+
+from sbk.core.partitioning import DEFAULT_PARTITION, Partitioner
+
+
+def test_disabled_without_partition_by():
+    assert Partitioner.from_config(None) is None
+    assert Partitioner.from_config({"partition_by": ""}) is None
+
+
+def test_doc_hash_routes_writes_and_requests_to_the_same_bucket():
+    partitioner = Partitioner.from_config({"partition_by": "doc_hash", "partition_buckets": 4})
+    expected = f"p_hash_{zlib.crc32(b'doc-1') % 4}"
+    assert partitioner.partition_of("doc-1", {}) == expected
+    assert partitioner.partition_for("doc-1") == expected
+    assert {partitioner.partition_of(f"doc-{i}", {}) for i in range(100)} <= {f"p_hash_{i}" for i in range(4)}
+
+
+def test_metadata_values_are_sanitized_without_collisions():
+    partitioner = Partitioner.from_config({"partition_by": "metadata", "partition_key": "tenant"})
+    assert partitioner.partition_of("d", {"tenant": "acme_1"}) == "p_val_acme_1"
+    assert partitioner.partition_for("acme_1") == "p_val_acme_1"
+    assert partitioner.partition_of("d", {}) == DEFAULT_PARTITION
+    unsafe = partitioner.partition_for("acme-1")
+    assert unsafe.startswith("p_val_acme_1_") and unsafe != partitioner.partition_for("acme.1")
+    assert len(partitioner.partition_for("x" * 500)) < 100
+
+
+def test_ingest_date_granularity():
+    now = calendar.timegm((2024, 3, 9, 12, 0, 0))
+    monthly = Partitioner.from_config({"partition_by": "ingest_date", "partition_granularity": "MONTH"})
+    daily = Partitioner.from_config({"partition_by": "ingest_date", "partition_granularity": "day"})
+    assert monthly.partition_of("d", {}, now=now) == "p_date_202403"
+    assert daily.partition_of("d", {}, now=now) == "p_date_20240309"
+    assert monthly.partition_for("2024-03-09") == monthly.partition_for("2024-03") == "p_date_202403"
+    assert daily.partition_for("2024-03-09") == "p_date_20240309"
+    with pytest.raises(ValueError):
+        daily.partition_for("2024-03")
+    with pytest.raises(ValueError):
+        monthly.partition_for("March 2024")
+
+
+@pytest.mark.parametrize("config", [
+    {"partition_by": "tenant"},
+    {"partition_by": "metadata"},
+    {"partition_by": "doc_hash", "partition_buckets": -1},
+    {"partition_by": "ingest_date", "partition_granularity": "year"},
+])
+def test_invalid_config(config):
+    with pytest.raises(ValueError):
+        Partitioner.from_config(config)
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from sbk.core.pipeline import batched, prefetch
+
+
+def test_batched():
+    assert list(batched(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(batched([], 3)) == []
+
+
+def test_prefetch_preserves_order_across_stages():
+    stage = prefetch(batched(range(100), 7), maxsize=2)
+    doubled = prefetch(([x * 2 for x in batch] for batch in stage), maxsize=2)
+    assert [x for batch in doubled for x in batch] == [x * 2 for x in range(100)]
+
+
+def test_prefetch_bounds_how_far_the_producer_runs_ahead():
+    produced = []
+
+    def source():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = prefetch(source(), maxsize=3)
+    assert next(items) == 0
+    time.sleep(0.3)
+    # 队列中最多 3 个，加上生产者手中等待放入的 1 个
+    assert len(produced) <= 5
+    assert list(items) == list(range(1, 100))
+
+
+def test_producer_errors_are_raised_to_the_consumer():
+    def source():
+        yield 1
+        yield 2
+        raise ValueError("parse failed")
+
+    items = prefetch(source(), maxsize=1)
+    assert next(items) == 1
+    assert next(items) == 2
+    with pytest.raises(ValueError, match="parse failed"):
+        next(items)
+
+
+def test_stopping_early_closes_the_producer():
+    closed = threading.Event()
+
+    def source():
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            closed.set()
+
+    items = prefetch(source(), maxsize=2)
+    assert next(items) == 0
+    items.close()
+    assert closed.wait(5)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from sbk.core.embeddings.cache import QueryEmbeddingCache, normalize_query
+from sbk.core.embeddings.registry import config_fingerprint
+
+CONFIG = {"type": "sentence_transformer", "model_name": "test-model"}
+
+
+class Compute:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text), i] for i, text in enumerate(texts)], dtype=np.float64)
+
+
+def test_normalize_query():
+    assert normalize_query("  ＡＢＣ　 def\n") == "ABC def"
+
+
+def test_only_misses_are_computed_once_per_text():
+    cache = QueryEmbeddingCache(max_entries=10, max_bytes=0, ttl=0)
+    compute = Compute()
+    first = cache.embed(CONFIG, ["hello  world", "foo", "hello world"], compute)
+    assert compute.calls == [["hello world", "foo"]]
+    assert first.dtype == np.float32
+    np.testing.assert_array_equal(first[0], first[2])
+
+    second = cache.embed(CONFIG, ["foo", "bar"], compute)
+    assert compute.calls[-1] == ["bar"]
+    np.testing.assert_array_equal(second[0], first[1])
+    stats = cache.stats()
+    # 同一批内重复的查询只查找一次
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+
+
+def test_configs_do_not_share_entries():
+    cache = QueryEmbeddingCache(max_entries=10, max_bytes=0, ttl=0)
+    compute = Compute()
+    cache.embed(CONFIG, ["q"], compute)
+    cache.embed({**CONFIG, "model_name": "other"}, ["q"], compute)
+    assert compute.calls == [["q"], ["q"]]
+
+
+def test_cached_rows_do_not_hold_the_batch():
+    cache = QueryEmbeddingCache(max_entries=10, max_bytes=0, ttl=0)
+    cache.embed(CONFIG, ["a", "b"], Compute())
+    vector = cache.cache.get((config_fingerprint(CONFIG), "a"))
+    assert vector.base is None and vector.shape == (2,)
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from sbk.core.exceptions import VectorStoreError
+from sbk.services.vector_service import VectorService
+
+DIM = 4
+
+
+@pytest.fixture
+def service(tmp_path):
+    service = VectorService(collection_name=f"kb_{tmp_path.name}", dim=DIM,
+                            vector_store={"type": "faiss"}, vector_store_path=str(tmp_path))
+    embeddings = np.eye(DIM, dtype=np.float32).repeat(2, axis=0) + np.arange(2 * DIM, dtype=np.float32)[:, None] * 0.01
+    service.add_documents(embeddings, [f"chunk {i}" for i in range(len(embeddings))],
+                          [{"source": f"doc{i // 2}"} for i in range(len(embeddings))],
+                          [f"doc{i // 2}" for i in range(len(embeddings))], flush=True)
+    return service
+
+
+def test_batch_results_match_single_searches(service):
+    queries = np.eye(DIM, dtype=np.float32)[[2, 0, 3]]
+    top_ks = [1, 3, 2]
+    batch = service.search_batch(queries, top_ks)
+    assert [len(hits) for hits in batch] == top_ks
+    for query, top_k, hits in zip(queries, top_ks, batch):
+        single = service.search_batch(query[None, :], top_k)[0]
+        assert [hit["id"] for hit in hits] == [hit["id"] for hit in single]
+    assert [hits[0]["doc_id"] for hits in batch] == ["doc2", "doc0", "doc3"]
+
+
+def test_batch_applies_filter_to_every_query(service):
+    batch = service.search_batch(np.eye(DIM, dtype=np.float32), 8, metadata_filter={"source": "doc1"})
+    assert all({hit["doc_id"] for hit in hits} == {"doc1"} for hits in batch)
+
+
+def test_top_k_list_must_match_query_count(service):
+    with pytest.raises(VectorStoreError):
+        service.search_batch(np.eye(DIM, dtype=np.float32), [1, 2])
@@ -0,0 +1,91 @@
+import time
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from sbk.core.database import Base
+from sbk.core.tasks import TaskManager, TaskStatus
+from sbk.models.task import TaskRecord
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # 每个线程使用独立连接，与生产环境的连接池一致
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(bind=engine, tables=[TaskRecord.__table__])
+    return sessionmaker(bind=engine)
+
+
+def add_record(session_factory, task_id, status, heartbeat_at, completed_at=None):
+    db = session_factory()
+    db.add(TaskRecord(task_id=task_id, task_type="process_document", status=status, progress={},
+                      created_at=heartbeat_at, heartbeat_at=heartbeat_at, completed_at=completed_at))
+    db.commit()
+    db.close()
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_orphaned_tasks_are_failed_on_startup(session_factory):
+    stale = datetime.now() - timedelta(seconds=120)
+    add_record(session_factory, "dead-running", TaskStatus.RUNNING, stale)
+    add_record(session_factory, "dead-pending", TaskStatus.PENDING, stale)
+    add_record(session_factory, "alive", TaskStatus.RUNNING, datetime.now())
+    add_record(session_factory, "done", TaskStatus.COMPLETED, stale, completed_at=stale)
+
+    manager = TaskManager(max_workers=1, retention=0, orphan_timeout=60, session_factory=session_factory)
+    try:
+        assert wait_for(lambda: manager.get_task_status("dead-running")["status"] == TaskStatus.FAILED)
+        dead = manager.get_task_status("dead-pending")
+        assert dead["status"] == TaskStatus.FAILED
+        assert "interrupted" in dead["error"] and dead["completed_at"] is not None
+        assert manager.get_task_status("alive")["status"] == TaskStatus.RUNNING
+        assert manager.get_task_status("done")["status"] == TaskStatus.COMPLETED
+    finally:
+        manager.shutdown()
+
+
+def test_heartbeat_keeps_local_tasks_alive(session_factory):
+    manager = TaskManager(max_workers=1, retention=0, orphan_timeout=0.3, session_factory=session_factory)
+    try:
+        # 唯一的工作线程被占用，任务一直排队，只靠心跳保持存活
+        release = threading.Event()
+        manager.executor.submit(release.wait)
+        task_id = manager.submit_task("unknown", {})
+        time.sleep(1.0)
+        assert manager.get_task_status(task_id)["status"] == TaskStatus.PENDING
+        # 任务不再属于任何存活的进程后，超时即被标记为失败
+        with manager._tasks_lock:
+            manager.tasks.pop(task_id)
+        assert wait_for(lambda: manager.get_task_status(task_id)["status"] == TaskStatus.FAILED)
+        assert "interrupted" in manager.get_task_status(task_id)["error"]
+    finally:
+        release.set()
+        manager.shutdown()
+
+
+def test_task_lifecycle_and_prune(session_factory):
+    old = datetime.now() - timedelta(seconds=120)
+    add_record(session_factory, "expired", TaskStatus.COMPLETED, old, completed_at=old)
+    manager = TaskManager(max_workers=1, retention=60, orphan_timeout=0, session_factory=session_factory)
+    try:
+        task_id = manager.submit_task("unknown", {})
+        assert wait_for(lambda: manager.get_task_status(task_id)["status"] == TaskStatus.FAILED)
+        status = manager.get_task_status(task_id)
+        assert "Unknown task type" in status["error"]
+        assert status["started_at"] is not None and status["completed_at"] is not None
+        assert task_id not in manager.tasks
+        assert manager.get_task_status("expired") == {"error": "Task not found"}
+        assert manager.get_task_status("missing") == {"error": "Task not found"}
+    finally:
+        manager.shutdown()
@@ -0,0 +1,70 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from sbk.services.vector_service import VectorService
+
+DIM = 4
+
+
+@pytest.fixture
+def service(tmp_path):
+    return VectorService(collection_name=f"kb_{tmp_path.name}", dim=DIM,
+                         vector_store={"type": "faiss"}, vector_store_path=str(tmp_path))
+
+
+def add(service, doc_id, count, flush=True, offset=0):
+    embeddings = np.arange(offset, offset + count * DIM, dtype=np.float32).reshape(count, DIM)
+    service.add_documents(embeddings, [f"{doc_id} chunk {i}" for i in range(count)],
+                          [{"source": doc_id} for _ in range(count)], [doc_id] * count, flush=flush)
+
+
+def test_discard_pending_only_drops_matching_buffered_rows(service):
+    add(service, "a", 2, flush=False)
+    add(service, "b", 1, flush=False, offset=100)
+    assert service.discard_pending({"source": "a"}) == 2
+    service.flush()
+    assert service.store.num_rows() == 1
+    assert {hit["doc_id"] for hit in service.bm25_index.search("chunk", top_k=10)} == {"b"}
+
+
+def test_drop_discards_the_buffer_of_the_dropped_store(tmp_path):
+    path = str(tmp_path / "kb")
+    service = VectorService(collection_name="kb_1", dim=DIM, vector_store={"type": "faiss"},
+                            vector_store_path=path)
+    add(service, "old", 2)
+    add(service, "pending", 3, flush=False)
+    old_buffer = service.write_buffer
+    assert service.drop() == 2
+    assert old_buffer.pending() == 0
+    # 删除知识库时随后删除整个目录
+    shutil.rmtree(path)
+
+    # 复用同一目录（同一知识库 ID）的新知识库使用新的缓冲和向量库
+    reused = VectorService(collection_name="kb_1", dim=DIM, vector_store={"type": "faiss"},
+                           vector_store_path=path)
+    assert reused.write_buffer is not old_buffer
+    assert reused.store is not service.store
+    add(reused, "new", 1)
+    assert reused.store.num_rows() == 1
+    assert {hit["doc_id"] for hit in reused.bm25_index.search("chunk", top_k=10)} == {"new"}
+
+
+def test_bm25_failure_undoes_the_insert_and_keeps_rows_pending(service, monkeypatch):
+    add(service, "a", 2, flush=False)
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(service.bm25_index, "add", fail)
+    with pytest.raises(Exception):
+        service.flush()
+    assert service.store.num_rows() == 0
+    assert service.write_buffer.pending() == 2
+
+    monkeypatch.undo()
+    service.flush()
+    assert service.store.num_rows() == 2
+    assert service.write_buffer.pending() == 0
+    assert {hit["doc_id"] for hit in service.bm25_index.search("chunk", top_k=10)} == {"a"}
@@ -0,0 +1,43 @@
+import pytest
+
+from sbk.config import config as settings
+from sbk.core.exceptions import VectorStoreError
+from sbk.core.vector_stores.factory import VectorStoreFactory
+
+
+def fail():
+    raise AssertionError("dimension is only needed for shared collections")
+
+
+def test_pin_layout_keeps_per_kb_configs_unchanged():
+    config = {"type": "milvus", "layout": "per_kb", "precision": None}
+    assert VectorStoreFactory.pin_layout(config, fail) == {**config, "layout": "per_kb"}
+    # 分区或 FAISS 的知识库始终独占集合
+    assert VectorStoreFactory.pin_layout({"type": "faiss", "layout": "shared"}, fail)["layout"] == "per_kb"
+    assert VectorStoreFactory.pin_layout({"type": "milvus", "layout": "shared", "partition_by": "doc_hash"},
+                                         fail)["layout"] == "per_kb"
+
+
+def test_pin_layout_records_the_shared_collection(monkeypatch):
+    prefix = settings.vector_store.shared_collection_prefix
+    pinned = VectorStoreFactory.pin_layout({"type": "milvus", "layout": "shared", "precision": "SQ8",
+                                            "chunk_store": "external"}, lambda: 384)
+    assert pinned == {"type": "milvus", "layout": "shared", "collection": f"{prefix}_384_sq8_ext", "dim": 384,
+                      "precision": "sq8", "chunk_store": "external"}
+
+    # 之后修改全局配置不影响已经确定的知识库
+    monkeypatch.setattr(settings.vector_store, "collection_layout", "per_kb")
+    assert VectorStoreFactory.layout(pinned) == "shared"
+
+
+def test_shared_layout_requires_pinned_collection():
+    with pytest.raises(ValueError):
+        VectorStoreFactory.create({"type": "milvus", "layout": "shared"}, kb_id=1)
+    with pytest.raises(ValueError):
+        VectorStoreFactory.create({"type": "milvus", "layout": "shared", "collection": "c", "dim": 8})
+
+
+def test_shared_layout_rejects_other_dimensions():
+    config = {"type": "milvus", "layout": "shared", "collection": "kbs_shared_8_float32", "dim": 8}
+    with pytest.raises(VectorStoreError):
+        VectorStoreFactory.create(config, dim=16, kb_id=1)
@@ -0,0 +1,121 @@
+import pytest
+
+from sbk.core.write_buffer import WriteBuffer, WriteBufferRegistry
+
+
+class FlakyInsert:
+    """记录每次写入的行，fail_on 中的调用序号抛出异常"""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.calls = 0
+        self.written = []
+
+    def __call__(self, rows):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise ConnectionError("insert failed")
+        self.written.extend(rows)
+        return len(rows)
+
+
+def make_buffer(insert, **kwargs):
+    kwargs.setdefault("max_rows", 1000)
+    kwargs.setdefault("flush_interval", 3600)
+    return WriteBuffer("test", insert, **kwargs)
+
+
+def test_flush_writes_rows_in_order():
+    insert = FlakyInsert()
+    buffer = make_buffer(insert)
+    buffer.add([1, 2, 3], [10, 10, 10])
+    buffer.add([4], [10])
+    assert buffer.pending() == 4
+    assert buffer.flush() == 4
+    assert insert.written == [1, 2, 3, 4]
+    assert buffer.pending() == 0
+    assert buffer.flush() == 0
+
+
+def test_failed_rows_are_retried_before_newer_rows():
+    insert = FlakyInsert(fail_on={1})
+    buffer = make_buffer(insert)
+    buffer.add(["a", "b"], [1, 1])
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert buffer.pending() == 2
+    buffer.add(["c"], [1])
+    buffer.flush()
+    assert insert.written == ["a", "b", "c"]
+
+
+def test_partial_failure_keeps_only_unwritten_batches():
+    # 每行 6 字节、单次 insert 上限 10 字节，每批一行；第二批失败
+    insert = FlakyInsert(fail_on={2})
+    results = []
+    buffer = make_buffer(insert, max_batch_bytes=10, on_insert=lambda rows, result: results.append(list(rows)))
+    buffer.add(["a", "b", "c"], [6, 6, 6])
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert insert.written == ["a"]
+    assert results == [["a"]]
+    assert buffer.pending() == 2
+    buffer.add(["d"], [6])
+    assert buffer.flush() == 3
+    assert insert.written == ["a", "b", "c", "d"]
+    assert results == [["a"], ["b"], ["c"], ["d"]]
+    assert buffer.stats()["errors"] == 1
+
+
+def test_add_flushes_when_full():
+    insert = FlakyInsert()
+    buffer = make_buffer(insert, max_rows=3)
+    buffer.add([1, 2], [1, 1])
+    assert insert.written == []
+    buffer.add([3], [1])
+    assert insert.written == [1, 2, 3]
+
+
+def test_flush_if_stale():
+    insert = FlakyInsert()
+    buffer = make_buffer(insert, flush_interval=0)
+    buffer.add([1], [1])
+    buffer.flush_if_stale()
+    assert insert.written == [1]
+
+
+def test_discard_drops_rows_left_by_a_failed_flush():
+    insert = FlakyInsert(fail_on={1})
+    buffer = make_buffer(insert)
+    buffer.add([("a", 1), ("b", 1), ("a", 2), ("c", 1)], [10] * 4)
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert buffer.discard(lambda row: row[0] == "a") == 2
+    assert buffer.pending() == 2
+    assert buffer.stats()["pending_bytes"] == 20
+    buffer.flush()
+    assert insert.written == [("b", 1), ("c", 1)]
+    assert buffer.discard(lambda row: True) == 0
+
+
+def test_registry_binds_the_latest_insert_fn():
+    registry = WriteBufferRegistry(flush_interval=0)
+    first, second = FlakyInsert(), FlakyInsert()
+    buffer = registry.get("kb", first)
+    buffer.add([1], [10])
+    assert registry.get("kb", second) is buffer
+    buffer.flush()
+    assert (first.written, second.written) == ([], [1])
+
+
+def test_registry_drop_discards_or_flushes():
+    registry = WriteBufferRegistry(flush_interval=0)
+    insert = FlakyInsert()
+    registry.get("kb", insert).add([1, 2], [10, 10])
+    assert registry.drop("kb", flush=False) == 2
+    assert registry.drop("kb") == 0
+    buffer = registry.get("kb", insert)
+    assert buffer.pending() == 0
+    buffer.add([3], [10])
+    registry.drop("kb")
+    assert insert.written == [3]